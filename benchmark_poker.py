@@ -0,0 +1,487 @@
+""" Benchmarks for the poker functions. Random mod and numpy to build reproducible inputs, time mod
+to time each benchmark, json mod to save and compare baselines, argparse mod for the command line.
+Run with: python benchmark_poker.py --help """
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import combinations
+from math import comb
+
+import numpy as np
+
+from poker_python_challenge_answers import deal_cards, winner_is, hand_ranking, encode_hand, \
+    hand_ranking_batch, Deck, deal_cards_batch, best_hand_strength, hand_strength, \
+    save_lookup_tables, decode_hand, sort_cards, classify_sorted_hand, score_hands, winners_batch, \
+    iter_deals
+from poker_draw import get_draw_tables, solve_draw
+from poker_io import rank_file
+from poker_ranges import parse_range, range_equity, sample_boards
+from poker_threads import rank_hands_threaded, winners_threaded
+
+
+def time_per_call(func, inputs, repeat=5):
+    """ Function that calls func on every item in inputs repeat times and returns the fastest
+    average time per call in seconds """
+
+    # Keeping the fastest run makes the number less sensitive to whatever else the machine is
+    # doing at the same time
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in inputs:
+            func(item)
+        best = min(best, (time.perf_counter() - start) / len(inputs))
+    return best
+
+
+def make_tables(num_tables, num_players=4, seed=0):
+    """ Function that returns a list of dealt tables (see deal_cards) using a fixed seed. The
+    tables are dealt with their own random number generator, so the random mod is left alone """
+    rng = random.Random(seed)
+    player_list = [f"Player {num}" for num in range(num_players)]
+    return [deal_cards(player_list, rng=rng) for _ in range(num_tables)]
+
+
+def bench_winner_is(num_tables=20000):
+    """ Function that compares winner_is with and without breaking ties by kickers """
+    tables = make_tables(num_tables)
+    category_only = time_per_call(lambda table: winner_is(table, category_only=True), tables)
+    with_kickers = time_per_call(winner_is, tables)
+    print(f"winner_is (category only): {category_only * 1e6:8.2f} us per table")
+    print(f"winner_is (with kickers):  {with_kickers * 1e6:8.2f} us per table")
+    print(f"ratio: {with_kickers / category_only:.2f}")
+
+
+def bench_winners_batch(num_tables=10000, num_players=9):
+    """ Function that compares winners_batch with calling winner_is once per table """
+    deals = deal_cards_batch(num_tables, num_players, rng=0)
+    names = [f"Player {num}" for num in range(num_players)]
+    tables = [dict(zip(names, deal)) for deal in deals.tolist()]
+    per_table = time_per_call(winner_is, tables, repeat=3) * num_tables
+    batch = time_per_call(winners_batch, [deals])
+    print(f"{num_tables} tables x {num_players} players: winner_is {per_table * 1000:8.1f} ms, "
+          f"winners_batch {batch * 1000:8.1f} ms, speedup {per_table / batch:.1f}x")
+
+
+def make_hands(num_hands, seed=0):
+    """ Function that returns a list of random five card hands as strings using a fixed seed """
+    return [hand for table in make_tables(num_hands // 4 + 1, seed=seed)
+            for hand in table.values()][:num_hands]
+
+
+def bench_hand_ranking(num_hands=100000):
+    """ Function that compares hand_ranking on string cards and on integer cards """
+    hands = make_hands(num_hands)
+    encoded_hands = [encode_hand(hand) for hand in hands]
+    strings = time_per_call(hand_ranking, hands)
+    encoded = time_per_call(hand_ranking, encoded_hands)
+    print(f"hand_ranking (string cards):  {strings * 1e6:8.3f} us per hand")
+    print(f"hand_ranking (integer cards): {encoded * 1e6:8.3f} us per hand")
+
+
+def make_hand_array(num_hands, seed=0, chunk_size=1 << 16):
+    """ Function that returns an array of shape (num_hands, 5) of random integer hands using a
+    fixed seed. Each hand is the first five cards of a shuffled deck """
+    rng = np.random.default_rng(seed)
+    hands = np.empty((num_hands, 5), dtype=np.uint8)
+    # Shuffling a chunk of decks at a time keeps the random numbers from taking up gigabytes
+    for start in range(0, num_hands, chunk_size):
+        size = min(chunk_size, num_hands - start)
+        hands[start:start + size] = rng.random((size, 52)).argsort(axis=1)[:, :5]
+    return hands
+
+
+def bench_hand_ranking_batch(sizes=(1000000, 10000000), chunk_size=1 << 16):
+    """ Function that compares hand_ranking_batch with calling hand_ranking once per hand """
+    for num_hands in sizes:
+        hands = make_hand_array(num_hands)
+
+        start = time.perf_counter()
+        hand_ranking_batch(hands)
+        batch = time.perf_counter() - start
+
+        # The scalar path gets the hands as Python lists, converted outside of the timing
+        scalar = 0.0
+        for chunk_start in range(0, num_hands, chunk_size):
+            chunk = hands[chunk_start:chunk_start + chunk_size].tolist()
+            start = time.perf_counter()
+            for hand in chunk:
+                hand_ranking(hand)
+            scalar += time.perf_counter() - start
+
+        print(f"{num_hands:>10} hands: batch {num_hands / batch:12,.0f} hands/s, "
+              f"scalar {num_hands / scalar:12,.0f} hands/s, speedup {scalar / batch:.1f}x")
+
+
+def bench_best_hand(num_hands=50000):
+    """ Function that compares best_hand_strength on 7 cards with ranking all 21 ways to pick 5 """
+    rng = random.Random(0)
+    hands = [rng.sample(range(52), 7) for _ in range(num_hands)]
+    table = time_per_call(best_hand_strength, hands)
+    brute_force = time_per_call(lambda cards: max(hand_strength(hand)
+                                                  for hand in combinations(cards, 5)), hands)
+    print(f"best_hand_strength (7 cards): {table * 1e6:8.3f} us per hand")
+    print(f"best of 21 hand_strength:     {brute_force * 1e6:8.3f} us per hand")
+    print(f"speedup: {brute_force / table:.1f}x")
+
+
+def bench_deal_cards(num_deals=100000):
+    """ Function that compares deal_cards with a new deck every call and with a reused deck """
+    player_list = ["Noor", "Hagen", "Sadie", "Kunai"]
+    rng = random.Random(0)
+    fresh = time_per_call(lambda _: deal_cards(player_list, rng=rng), range(num_deals))
+    deck = Deck(encoded=True, rng=rng)
+    deck.build()
+    reused = time_per_call(lambda _: deal_cards(player_list, deck=deck), range(num_deals))
+    print(f"deal_cards (new deck):     {1 / fresh:12,.0f} deals/s")
+    print(f"deal_cards (reused deck):  {1 / reused:12,.0f} deals/s")
+    cards = time_per_call(lambda _: deck.reset() or deck.deal_random(52), range(num_deals // 10))
+    print(f"Deck.deal_random:          {52 / cards:12,.0f} cards/s")
+    start = time.perf_counter()
+    deal_cards_batch(num_deals * 10, len(player_list), rng=0)
+    print(f"deal_cards_batch:          {num_deals * 10 / (time.perf_counter() - start):12,.0f} "
+          f"deals/s")
+    start = time.perf_counter()
+    for _ in iter_deals(len(player_list), num_deals=num_deals * 10, rng=0):
+        pass
+    print(f"iter_deals:                {num_deals * 10 / (time.perf_counter() - start):12,.0f} "
+          f"deals/s")
+
+
+def time_import(table_file, repeat=5):
+    """ Function that returns the fastest time in seconds to start a new Python process that
+    imports the poker module with POKER_TABLES_FILE set to table_file """
+    environment = dict(os.environ, POKER_TABLES_FILE=table_file)
+    code = ("import time; start = time.perf_counter(); import poker_python_challenge_answers; "
+            "print(time.perf_counter() - start)")
+    return min(float(subprocess.run([sys.executable, "-c", code], env=environment, check=True,
+                                    capture_output=True, text=True).stdout)
+               for _ in range(repeat))
+
+
+def bench_startup():
+    """ Function that compares importing the module with and without a saved table file """
+    with tempfile.TemporaryDirectory() as directory:
+        table_file = save_lookup_tables(os.path.join(directory, "tables.bin"))
+        mapped = time_import(table_file)
+        built = time_import(os.path.join(directory, "missing.bin"))
+    print(f"import (tables built):     {built * 1000:8.1f} ms")
+    print(f"import (tables mapped):    {mapped * 1000:8.1f} ms")
+
+
+def bench_rank_file(num_hands=1000000):
+    """ Function that times ranking a hand history file with one hand per line """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "hands.txt")
+        with open(path, "w") as file:
+            for hand in deal_cards_batch(num_hands, 1, rng=0).reshape(-1, 5).tolist():
+                file.write(" ".join(decode_hand(hand)) + "\n")
+        stats = rank_file(path, os.path.join(directory, "ranked.txt"))
+    print(f"rank_file:                 {stats['lines_per_second']:12,.0f} lines/s")
+
+
+def bench_threads(max_threads=8, num_hands=2000000, num_tables=40000):
+    """ Function that shows how ranking scales from 1 to max_threads threads, for batches of hands
+    (see rank_hands_threaded) and for tables ranked one at a time (see winners_threaded) """
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(f"threads (GIL {'on' if gil else 'off'}, {os.cpu_count()} CPUs):")
+    hands = make_hand_array(num_hands)
+    tables = [dict(zip(["Noor", "Hagen", "Sadie", "Kunai"], deal))
+              for deal in deal_cards_batch(num_tables, 4, rng=0).tolist()]
+    threads = 1
+    while threads <= max_threads:
+        batch = time_per_call(lambda _: rank_hands_threaded(hands, workers=threads), [0], 3)
+        winners = time_per_call(lambda _: winners_threaded(tables, workers=threads), [0], 3)
+        print(f"{threads:3} threads: rank_hands_threaded {num_hands / batch:12,.0f} hands/s, "
+              f"winners_threaded {num_tables / winners:10,.0f} tables/s")
+        threads *= 2
+
+
+def naive_range_equity(range1, range2, boards):
+    """ Function that returns the equity of the first range against the second on a list of
+    boards (see range_equity) the way it is done without the matrices: a loop over every pair of
+    hands and every board, ranking both hands each time """
+    combos1, weights1 = parse_range(range1)
+    combos2, weights2 = parse_range(range2)
+    equity = total = 0.0
+    for hand1, weight1 in zip(combos1.tolist(), weights1.tolist()):
+        for hand2, weight2 in zip(combos2.tolist(), weights2.tolist()):
+            if set(hand1) & set(hand2):
+                continue
+            wins = ties = dealt = 0
+            for board in boards:
+                if set(board) & set(hand1 + hand2):
+                    continue
+                strength1 = best_hand_strength(hand1 + board)
+                strength2 = best_hand_strength(hand2 + board)
+                wins += strength1 > strength2
+                ties += strength1 == strength2
+                dealt += 1
+            if dealt:
+                equity += weight1 * weight2 * (wins + ties / 2) / dealt
+                total += weight1 * weight2
+    return equity / total
+
+
+def bench_range_equity(range1="AA, KK, QQ, AKs, AKo", range2="JJ, TT, 99, AQs, KQs, QJs",
+                       num_boards=300):
+    """ Function that compares range_equity with a loop over every pair of hands and board, and
+    range_equity with its matrices already in the cache """
+    boards = sample_boards(num_boards).tolist()
+    start = time.perf_counter()
+    naive = naive_range_equity(range1, range2, boards)
+    naive_time = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as cache_dir:
+        start = time.perf_counter()
+        result = range_equity(range1, range2, num_boards, cache_dir=cache_dir)
+        matrix_time = time.perf_counter() - start
+        start = time.perf_counter()
+        range_equity(range1, range2, num_boards, cache_dir=cache_dir)
+        cached_time = time.perf_counter() - start
+    print(f"range equity ({result['pairs']} pairs of hands x {num_boards} boards): "
+          f"equity {result['equity']:.4f} (loop {naive:.4f})")
+    print(f"nested loop:               {naive_time * 1000:10.1f} ms")
+    print(f"matrices:                  {matrix_time * 1000:10.1f} ms "
+          f"({naive_time / matrix_time:.0f}x faster)")
+    print(f"matrices from the cache:   {cached_time * 1000:10.1f} ms")
+
+
+def bench_draw_solver(num_hands=200):
+    """ Function that times solve_draw on random hands with a full deck and with the cards of
+    three other players dealt, and compares it with calling hand_ranking on every draw of all 32
+    ways to discard """
+    start = time.perf_counter()
+    get_draw_tables()
+    print(f"draw tables loaded or built: {(time.perf_counter() - start) * 1000:10.1f} ms")
+    rng = random.Random(0)
+    hands = [rng.sample(Deck().full_deck(), 20) for _ in range(num_hands)]
+    full = time_per_call(lambda cards: solve_draw(cards[:5]), hands, 1)
+    dealt = time_per_call(lambda cards: solve_draw(cards[:5], [card for card in Deck().full_deck()
+                                                               if card not in cards]), hands, 1)
+    # Every way to discard k of the 5 cards needs comb(47, k) draws ranked
+    num_draws = sum(comb(5, size) * comb(47, size) for size in range(6))
+    naive = time_per_call(hand_ranking, make_hands(20000), 1) * num_draws
+    print(f"solve_draw (full deck):      {full * 1000:10.2f} ms per hand")
+    print(f"solve_draw (15 cards dealt): {dealt * 1000:10.2f} ms per hand")
+    print(f"hand_ranking on all {num_draws:,} draws: {naive * 1000:10.0f} ms per hand")
+
+
+# Benchmark suite with baselines. Every benchmark is timed the same way (see measure) on inputs
+# made from fixed seeds, and the results can be saved to a JSON file and compared with a later
+# run to catch functions that got slower. Baselines only make sense on the machine that made them
+
+
+def make_category_hands(category, num_hands, seed=0):
+    """ Function that returns a list of num_hands random hands as strings that are all of one kind
+    (e.g. "High Card", which goes through every check in classify_sorted_hand) using a fixed
+    seed """
+    score = score_hands[category]
+    hands = []
+    rng = np.random.default_rng(seed)
+    # Deal a lot of random hands at once and keep the ones of the right kind
+    while len(hands) < num_hands:
+        dealt = deal_cards_batch(100000, 1, rng=rng).reshape(-1, 5)
+        dealt = dealt[hand_ranking_batch(dealt) == score]
+        hands.extend(decode_hand(hand) for hand in dealt[:num_hands - len(hands)].tolist())
+    return hands
+
+
+def measure(func, inputs, repeat=5, group_size=100):
+    """ Function that calls func on every item in inputs repeat times and returns a dictionary with
+    the calls per second and the 50th, 90th and 99th percentile time of a call in microseconds.
+    Calls are timed in groups of group_size for the percentiles, since one call can be too short
+    to time alone """
+    # One call on the first group before timing, so the first timed calls do not pay for things
+    # like filling the processor caches
+    for item in inputs[:group_size]:
+        func(item)
+
+    times = []
+    best = float("inf")
+    for _ in range(repeat):
+        run_start = time.perf_counter()
+        for start in range(0, len(inputs), group_size):
+            group = inputs[start:start + group_size]
+            begin = time.perf_counter()
+            for item in group:
+                func(item)
+            times.append((time.perf_counter() - begin) / len(group))
+        best = min(best, (time.perf_counter() - run_start) / len(inputs))
+
+    # Calls per second come from the fastest run, like time_per_call, so whatever else the machine
+    # is doing moves the number as little as possible. The percentiles show the spread
+    p50, p90, p99 = np.percentile(times, [50, 90, 99]) * 1e6
+    return {"ops_per_second": 1 / best, "p50_us": p50, "p90_us": p90, "p99_us": p99,
+            "calls": len(inputs) * repeat}
+
+
+def suite_benchmarks(scale=1.0, seed=0):
+    """ Function that returns a dictionary with the name of each benchmark in the suite as the key
+    and a tuple of the function to time and the list of inputs to call it with as the value. scale
+    multiplies the number of inputs """
+    size = max(1, int(10000 * scale))
+    player_list = ["Noor", "Hagen", "Sadie", "Kunai"]
+    hands = make_hands(size, seed)
+    high_cards = make_category_hands("High Card", size, seed)
+    pairs = make_category_hands("Pair", size, seed)
+    tables = make_tables(size // 4 + 1, seed=seed)
+
+    deck_rng = random.Random(seed)
+    shuffled_deck = Deck(rng=random.Random(seed))
+    shuffled_deck.build()
+
+    return {
+        "hand_ranking/random": (hand_ranking, hands),
+        "hand_ranking/high_card": (hand_ranking, high_cards),
+        "hand_ranking/pair": (hand_ranking, pairs),
+        "hand_ranking/integer_cards": (hand_ranking, [encode_hand(hand) for hand in hands]),
+        "hand_strength/random": (hand_strength, hands),
+        "sort_cards/random": (sort_cards, hands),
+        "classify_sorted_hand/random": (classify_sorted_hand, [sort_cards(hand) for hand in hands]),
+        "classify_sorted_hand/high_card": (classify_sorted_hand,
+                                           [sort_cards(hand) for hand in high_cards]),
+        "deal_cards/4_players": (lambda _: deal_cards(player_list, rng=deck_rng), range(size)),
+        "Deck.build": (lambda _: Deck().build(), range(size)),
+        "Deck.shuffle": (lambda _: shuffled_deck.shuffle(), range(size)),
+        "winner_is/4_players": (winner_is, tables),
+        "winner_is/category_only": (lambda table: winner_is(table, category_only=True), tables),
+        "winners_batch/100x9": (winners_batch, [deal_cards_batch(100, 9, rng=seed + num)
+                                                for num in range(max(1, size // 100))]),
+        "best_hand_strength/7_cards": (best_hand_strength,
+                                       [random.Random(seed + num).sample(range(52), 7)
+                                        for num in range(size)]),
+    }
+
+
+def run_suite(scale=1.0, repeat=5, seed=0, names=None):
+    """ Function that runs the benchmarks in the suite (all of them, or the ones whose names start
+    with one of names) and returns a dictionary with each benchmark's results (see measure) """
+    results = {}
+    for name, (func, inputs) in suite_benchmarks(scale, seed).items():
+        if names and not any(name.startswith(prefix) for prefix in names):
+            continue
+        results[name] = measure(func, list(inputs), repeat)
+    return results
+
+
+def save_baseline(results, path):
+    """ Function that saves suite results (see run_suite) to a JSON file at path, together with the
+    Python version and machine they were measured on """
+    baseline = {"python": platform.python_version(), "machine": platform.machine(),
+                "processor": platform.processor(), "results": results}
+    with open(path, "w") as file:
+        json.dump(baseline, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+def load_baseline(path):
+    """ Function that returns the suite results saved to the JSON file at path """
+    with open(path) as file:
+        return json.load(file)["results"]
+
+
+def compare_results(results, baseline, threshold=0.2):
+    """ Function that compares suite results with a baseline and returns a list of the benchmarks
+    that regressed: each is a tuple of the name, the baseline and current calls per second and
+    the change as a fraction. A benchmark regressed if it does fewer calls per second than the
+    baseline by more than threshold (0.2 is 20%). Benchmarks missing from either side are
+    skipped """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["ops_per_second"]
+        after = result["ops_per_second"]
+        change = after / before - 1
+        if change < -threshold:
+            regressions.append((name, before, after, change))
+    return regressions
+
+
+def print_results(results, baseline=None):
+    """ Function that prints a table of suite results, with the change from the baseline if one is
+    given """
+    print(f"{'benchmark':32} {'ops/s':>14} {'p50 us':>9} {'p90 us':>9} {'p99 us':>9}"
+          + (f" {'change':>8}" if baseline else ""))
+    for name, result in results.items():
+        line = (f"{name:32} {result['ops_per_second']:14,.0f} {result['p50_us']:9.3f} "
+                f"{result['p90_us']:9.3f} {result['p99_us']:9.3f}")
+        if baseline and name in baseline:
+            line += f" {result['ops_per_second'] / baseline[name]['ops_per_second'] - 1:+8.1%}"
+        print(line)
+
+
+def run_comparisons():
+    """ Function that runs the benchmarks that compare two ways of doing the same thing """
+    bench_startup()
+    bench_winner_is()
+    bench_winners_batch()
+    bench_hand_ranking()
+    bench_hand_ranking_batch()
+    bench_best_hand()
+    bench_deal_cards()
+    bench_rank_file()
+    bench_threads()
+    bench_range_equity()
+    bench_draw_solver()
+
+
+def main(argv=None):
+    """ Function that runs the benchmark suite from the command line. Returns 1 if a benchmark
+    regressed compared with the baseline, otherwise 0 """
+    parser = argparse.ArgumentParser(description="Benchmark the poker functions.")
+    parser.add_argument("--save", metavar="PATH", help="save the results as a baseline to PATH")
+    parser.add_argument("--baseline", metavar="PATH", help="compare with the baseline at PATH")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="fail if a benchmark is slower than the baseline by more than this "
+                             "fraction (default 0.2)")
+    parser.add_argument("--retries", type=int, default=2,
+                        help="times to run a benchmark again before calling it a regression")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="multiply the number of inputs per benchmark by this")
+    parser.add_argument("--repeat", type=int, default=5, help="times to run each benchmark")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the inputs")
+    parser.add_argument("--only", nargs="*", metavar="NAME",
+                        help="only run benchmarks whose names start with these")
+    parser.add_argument("--comparisons", action="store_true",
+                        help="run the benchmarks that compare two ways of doing the same thing "
+                             "instead of the suite")
+    args = parser.parse_args(argv)
+
+    if args.comparisons:
+        run_comparisons()
+        return 0
+
+    results = run_suite(args.scale, args.repeat, args.seed, args.only)
+    baseline = load_baseline(args.baseline) if args.baseline else None
+    if baseline:
+        # A benchmark that looks slower is run again and its fastest run kept, so a moment where
+        # the machine was busy is not reported as a regression
+        for _ in range(args.retries):
+            names = [name for name, *_ in compare_results(results, baseline, args.threshold)]
+            if not names:
+                break
+            for name, result in run_suite(args.scale, args.repeat, args.seed, names).items():
+                if name in names and result["ops_per_second"] > results[name]["ops_per_second"]:
+                    results[name] = result
+    print_results(results, baseline)
+    if args.save:
+        save_baseline(results, args.save)
+
+    if baseline:
+        regressions = compare_results(results, baseline, args.threshold)
+        for name, before, after, change in regressions:
+            print(f"REGRESSION {name}: {before:,.0f} -> {after:,.0f} ops/s ({change:+.1%})")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+""" Command line interface for ranking hands, finding winners and simulating deals. Run with
+python poker_cli.py --help. Argparse mod to read the command line, csv and json mods for the
+table formats, sys mod for standard input and output, concurrent futures mod to spread work
+across processes, time mod for the throughput summary, contextlib mod to profile a command only
+when asked, numpy to read and write binary hands"""
+import argparse
+import contextlib
+import csv
+import io
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import poker_metrics
+from poker_profile import AllocationTracker, StackSampler, StackTracer, collapse_stacks, \
+    format_hotspots, hotspots
+from poker_python_challenge_answers import hand_ranking_batch, winner_is
+from poker_io import format_results, rank_blocks, rank_file, read_stream_blocks
+from poker_simulation import simulate_equity
+
+
+def open_input(path):
+    """ Function that returns a binary stream for path, or standard input if path is "-" """
+    return sys.stdin.buffer if path == "-" else open(path, "rb")
+
+
+def open_output(path):
+    """ Function that returns a binary stream for path, or standard output if path is "-" """
+    return sys.stdout.buffer if path == "-" else open(path, "wb")
+
+
+def read_binary_hands(stream, batch_size):
+    """ Function that reads hands stored as 5 bytes each (one integer card per byte, see
+    encode_card) and yields them as numpy arrays of at most batch_size hands """
+    while True:
+        data = stream.read(batch_size * 5)
+        if not data:
+            break
+        if len(data) % 5:
+            raise ValueError("binary input must hold 5 bytes per hand")
+        yield np.frombuffer(data, dtype=np.uint8).reshape(-1, 5)
+
+
+def run_rank(args):
+    """ Function that ranks every hand read from args.input and writes the results to
+    args.output. Returns the number of hands ranked """
+
+    # A text file written to a file can be split between worker processes by byte range
+    if args.format == "text" and args.workers > 1 and "-" not in (args.input, args.output):
+        return rank_file(args.input, args.output, args.batch_size * 16, args.workers)["lines"]
+
+    count = 0
+    stream = open_input(args.input)
+    output = open_output(args.output)
+    try:
+        # Binary hands are 5 bytes in and one 4 byte strength out, text is one line each
+        if args.format == "binary":
+            for hands in read_binary_hands(stream, args.batch_size):
+                strengths = hand_ranking_batch(hands, strength=True)
+                output.write(strengths.astype("<u4").tobytes())
+                count += len(strengths)
+        else:
+            for strengths in rank_blocks(read_stream_blocks(stream, args.batch_size * 16)):
+                output.write(format_results(strengths))
+                count += len(strengths)
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+        if output is not sys.stdout.buffer:
+            output.close()
+        else:
+            output.flush()
+    return count
+
+
+def read_tables(stream, table_format):
+    """ Function that returns a dictionary of table names and their players (player names as keys
+    and hands as values). JSON input is either a list of tables or an object of named tables.
+    CSV input has one row per player: table name, player name and then the five cards """
+    text = io.TextIOWrapper(stream, encoding="utf-8")
+    if table_format == "json":
+        tables = json.load(text)
+        if isinstance(tables, list):
+            tables = {str(number): table for number, table in enumerate(tables)}
+        return tables
+
+    tables = {}
+    for row in csv.reader(text):
+        if not row:
+            continue
+        table, player, *cards = [field.strip() for field in row]
+        if len(cards) == 1:
+            cards = cards[0].split()
+        tables.setdefault(table, {})[player] = cards
+    return tables
+
+
+def winners_of_tables(tables, category_only=False):
+    """ Function that returns a list with the winners (see winner_is) of every table in a list """
+    return [winner_is(players, category_only) for players in tables]
+
+
+def run_winner(args):
+    """ Function that finds the winners of every table read from args.input and writes them to
+    args.output. Returns the number of tables """
+    stream = open_input(args.input)
+    try:
+        tables = read_tables(stream, args.format)
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+
+    # Split the tables into batches of batch_size, ranked by the workers in order
+    names = list(tables)
+    batches = [[tables[name] for name in names[start:start + args.batch_size]]
+               for start in range(0, len(names), args.batch_size)]
+    if args.workers > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            results = executor.map(winners_of_tables, batches,
+                                   [args.category_only] * len(batches))
+    else:
+        results = [winners_of_tables(batch, args.category_only) for batch in batches]
+    winners = dict(zip(names, [table for batch in results for table in batch]))
+
+    output = open_output(args.output)
+    text = io.TextIOWrapper(output, encoding="utf-8", newline="")
+    try:
+        if args.format == "json":
+            json.dump(winners, text)
+            text.write("\n")
+        else:
+            writer = csv.writer(text)
+            for name, table_winners in winners.items():
+                for player in table_winners:
+                    writer.writerow([name, player])
+    finally:
+        text.flush()
+        if output is sys.stdout.buffer:
+            text.detach()
+        else:
+            text.close()
+    return len(winners)
+
+
+def parse_known_hand(value):
+    """ Function that turns "Name=Ah As" from the command line into ("Name", ["Ah", "As"]) """
+    name, _, cards = value.partition("=")
+    return name, cards.replace(",", " ").split()
+
+
+def run_simulate(args):
+    """ Function that simulates args.deals deals and writes each player's chance to win and tie.
+    Returns the number of deals """
+    known_hands = dict(args.known)
+    result = simulate_equity(known_hands, num_players=args.players, trials=args.deals,
+                             seed=args.seed, workers=args.workers, batch_size=args.batch_size,
+                             target_standard_error=args.target_standard_error)
+
+    output = open_output(args.output)
+    try:
+        if args.format == "json":
+            output.write(json.dumps(result).encode() + b"\n")
+        elif args.format == "binary":
+            # Each player's win and tie chances as little endian 64 bit floats
+            rates = [[player["win"], player["tie"]] for player in result["players"].values()]
+            output.write(np.array(rates, dtype="<f8").tobytes())
+        else:
+            lines = [f"{name}: win {player['win']:.4%} "
+                     f"({player['win_interval'][0]:.4%} - {player['win_interval'][1]:.4%}), "
+                     f"tie {player['tie']:.4%}"
+                     for name, player in result["players"].items()]
+            output.write(("\n".join(lines) + "\n").encode())
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+        else:
+            output.flush()
+    return result["trials"]
+
+
+def make_parser():
+    """ Function that returns the argument parser for the command line """
+    # Options shared by every command
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--workers", type=int, default=1,
+                        help="number of worker processes (default 1)")
+    common.add_argument("--batch-size", type=int, default=100000,
+                        help="number of hands, tables or deals handled per batch")
+    common.add_argument("--seed", type=int, default=0,
+                        help="seed for the random numbers (only used by simulate)")
+    common.add_argument("--output", "-o", default="-",
+                        help="file to write to (default standard output)")
+    common.add_argument("--metrics", metavar="PATH",
+                        help="time the poker functions in this process (not in --workers) and "
+                             "write the metrics to PATH at exit, as JSON if PATH ends in .json, "
+                             "otherwise in the Prometheus format")
+    common.add_argument("--profile", metavar="PATH",
+                        help="profile this process (not --workers), write the stacks to PATH in "
+                             "the collapsed format of flame graphs and print the functions that "
+                             "take the most time to standard error")
+    common.add_argument("--profile-mode", choices=["sample", "trace"], default="sample",
+                        help="sample the stack every millisecond (default), or time every call")
+    common.add_argument("--profile-memory", action="store_true",
+                        help="measure the memory allocated with tracemalloc and print it per "
+                             "hand, table or deal to standard error")
+
+    parser = argparse.ArgumentParser(description="Rank poker hands, find winners and simulate "
+                                                 "deals.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rank = commands.add_parser("rank", parents=[common],
+                               help="rank hands, one per line (or 5 bytes each with binary)")
+    rank.add_argument("input", nargs="?", default="-",
+                      help="file of hands (default standard input)")
+    rank.add_argument("--format", choices=["text", "binary"], default="text",
+                      help="text: lines like 'Kh As 5c 3d 4h' in, 'Pair,2285874' out; binary: "
+                           "5 bytes per hand in, a little endian uint32 strength out")
+    rank.set_defaults(run=run_rank, unit="hands")
+
+    winner = commands.add_parser("winner", parents=[common],
+                                 help="find the winners of tables of players and hands")
+    winner.add_argument("input", nargs="?", default="-",
+                        help="file of tables (default standard input)")
+    winner.add_argument("--format", choices=["json", "csv"], default="json",
+                        help="json: a list or object of tables of players and cards; csv: rows "
+                             "of table, player and five cards")
+    winner.add_argument("--category-only", action="store_true",
+                        help="only compare the kind of hand, not the kickers")
+    winner.set_defaults(run=run_winner, unit="tables")
+
+    simulate = commands.add_parser("simulate", parents=[common],
+                                   help="deal random hands and report how often each player wins")
+    simulate.add_argument("--deals", type=int, default=100000, help="number of deals")
+    simulate.add_argument("--players", type=int, default=2, help="number of players")
+    simulate.add_argument("--known", action="append", type=parse_known_hand, default=[],
+                          metavar="NAME=CARDS",
+                          help="known cards of a player, e.g. 'Noor=Ah As' (can be repeated)")
+    simulate.add_argument("--target-standard-error", type=float, default=None,
+                          help="stop once every win chance has this standard error")
+    simulate.add_argument("--format", choices=["text", "json", "binary"], default="text",
+                          help="binary: each player's win and tie chance as little endian float64")
+    simulate.set_defaults(run=run_simulate, unit="deals")
+    return parser
+
+
+def main(argv=None):
+    """ Function that runs the command line and prints a throughput summary to standard error """
+    args = make_parser().parse_args(argv)
+    if args.metrics:
+        poker_metrics.enable()
+    profiler = contextlib.nullcontext()
+    if args.profile:
+        profiler = StackSampler() if args.profile_mode == "sample" else StackTracer()
+    tracker = AllocationTracker() if args.profile_memory else contextlib.nullcontext()
+    start = time.perf_counter()
+    try:
+        with profiler, tracker:
+            count = args.run(args)
+    finally:
+        if args.metrics:
+            poker_metrics.disable()
+            poker_metrics.dump(args.metrics)
+    seconds = time.perf_counter() - start
+    rate = count / seconds if seconds else float("inf")
+    print(f"{args.command}: {count:,} {args.unit} in {seconds:.3f} s ({rate:,.0f} {args.unit}/s)",
+          file=sys.stderr)
+
+    if args.profile:
+        with open(args.profile, "w") as file:
+            file.write(collapse_stacks(profiler.stacks))
+        unit = "samples" if args.profile_mode == "sample" else "us"
+        print(format_hotspots(hotspots(profiler.stacks, 15), unit), end="", file=sys.stderr)
+    if args.profile_memory:
+        per_unit = max(count, 1)
+        print(f"memory: {tracker.peak:,} bytes at peak ({tracker.peak / per_unit:,.1f} per "
+              f"{args.unit[:-1]}), {tracker.retained:,} bytes retained", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+""" Draw decisions for five card draw: which cards to throw away. Each of the 32 ways to discard
+from a hand is scored by the chance of every kind of hand after drawing, and an expected value
+from a table of payouts. The chances are exact where possible, found from tables of how many 5 card
+hands hold each set of up to 4 cards (see build_draw_tables), and estimated from random draws
+otherwise. Concurrent futures mod to solve many hands in a pool of processes, functools mod to
+remember lists of draws, math mod to count combinations, os mod for the path of the tables file,
+numpy for the tables and to rank many draws at once"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import combinations
+from math import comb
+
+import numpy as np
+
+from poker_python_challenge_answers import Deck, card_code, hand_names, hand_ranking_batch, \
+    iter_deals, score_hands
+
+# One column per score (see score_hands), so a count of hands by kind can be indexed by score.
+# Column 0 is never used
+num_scores = max(score_hands.values()) + 1
+
+# comb(n, r) for every number of cards n and every set size r, as an array for numpy lookups
+draw_binomials = np.array([[comb(n, r) for r in range(6)] for n in range(53)], dtype=np.int64)
+
+# Path of the file the tables are saved to and read from, like the lookup tables (see
+# default_table_file)
+default_draw_table_file = os.environ.get(
+    "POKER_DRAW_TABLES_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "poker_draw_tables.npz"))
+
+
+@lru_cache(maxsize=None)
+def colex_combinations(num_items, size):
+    """ Function that returns an array of every combination of size numbers from 0 to num_items - 1,
+    one sorted combination per row, in colex order: the combinations of the numbers below m come
+    before every combination holding m. Row i is then the combination whose colex index (see
+    colex_index) is i. The arrays are remembered, since the same ones are asked for again and
+    again, and must not be changed """
+    combos = np.zeros((1, 0), dtype=np.uint8)
+    for column in range(size):
+        # The combinations with largest number m are those of one number less from below m
+        # (the first comb(m, column) rows so far) with m added
+        parts = [np.concatenate([combos[:comb(largest, column)],
+                                 np.full((comb(largest, column), 1), largest, dtype=np.uint8)],
+                                axis=1)
+                 for largest in range(column, num_items)]
+        combos = np.concatenate(parts) if parts else np.zeros((0, column + 1), dtype=np.uint8)
+    combos.flags.writeable = False
+    return combos
+
+
+def colex_index(cards):
+    """ Function that returns the colex index of a set of integer cards: its row in
+    colex_combinations(52, number of cards) """
+    return sum(comb(card, position + 1) for position, card in enumerate(sorted(cards)))
+
+
+def colex_indexes(rows):
+    """ Function that returns the colex index of every row of an array of sorted integer cards """
+    indexes = np.zeros(len(rows), dtype=np.int64)
+    for position in range(rows.shape[1]):
+        indexes += draw_binomials[rows[:, position], position + 1]
+    return indexes
+
+
+def build_draw_tables():
+    """ Function that ranks every 5 card hand once and returns a list of six tables. For 0 to 4
+    cards, the table has one row per set of that many cards (in colex order, see colex_index)
+    with the number of 5 card hands holding the set, by score. The last table has the score of
+    every 5 card hand """
+    hands = colex_combinations(52, 5)
+    scores = hand_ranking_batch(hands).astype(np.int64)
+    tables = []
+    for size in range(5):
+        counts = np.zeros(comb(52, size) * num_scores, dtype=np.int64)
+        # Every hand holds one set of size cards for each way to pick size of its positions,
+        # and picking positions of a sorted hand gives a sorted set
+        for positions in combinations(range(5), size):
+            indexes = colex_indexes(hands[:, list(positions)]) if size else 0
+            counts += np.bincount(indexes * num_scores + scores, minlength=len(counts))
+        tables.append(counts.reshape(-1, num_scores).astype(np.int32))
+    tables.append(scores.astype(np.uint8))
+    return tables
+
+
+def save_draw_tables(path=None, tables=None):
+    """ Function that writes the draw tables (by default the ones in use) to a file at path (by
+    default default_draw_table_file) and returns the path """
+    if path is None:
+        path = default_draw_table_file
+    if tables is None:
+        tables = get_draw_tables()
+    # Written to a temporary file first, so other processes never read a half written file
+    temporary_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(temporary_path, **{f"size{size}": table for size, table in enumerate(tables)})
+    os.replace(temporary_path, path)
+    return path
+
+
+def load_or_build_draw_tables(path=None):
+    """ Function that returns the draw tables from the file at path (by default
+    default_draw_table_file) if it can be used, or builds them otherwise """
+    if path is None:
+        path = default_draw_table_file
+    try:
+        with np.load(path) as saved:
+            tables = [saved[f"size{size}"] for size in range(6)]
+        if all(len(table) == comb(52, size) for size, table in enumerate(tables)):
+            return tables
+    except (OSError, KeyError, ValueError):
+        pass
+    return build_draw_tables()
+
+
+# The tables in use, loaded or built the first time a hand is solved rather than on import, since
+# building them takes a second. Two threads that both make them get the same tables
+draw_tables = None
+
+
+def get_draw_tables():
+    """ Function that returns the draw tables in use, loading or building them if needed """
+    global draw_tables
+    if draw_tables is None:
+        draw_tables = load_or_build_draw_tables()
+    return draw_tables
+
+
+def count_containing(cards, tables, memo):
+    """ Function that returns the number of 5 card hands holding a set of integer cards, by score,
+    remembered in the dictionary memo since the sets come up again for other discards """
+    key = tuple(sorted(cards))
+    counts = memo.get(key)
+    if counts is None:
+        if len(key) == 5:
+            counts = np.zeros(num_scores, dtype=np.int64)
+            counts[tables[5][colex_index(key)]] = 1
+        else:
+            counts = tables[len(key)][colex_index(key)].astype(np.int64)
+        memo[key] = counts
+    return counts
+
+
+def exclusion_counts(kept, unseen, tables, memo):
+    """ Function that returns the number of ways to draw up to 5 cards onto kept cards from the
+    deck, by score of the hand made. The hands that hold the kept cards are counted from the
+    tables, and the hands that also hold a card not in the deck (unseen) are taken away by
+    inclusion and exclusion: take away the hands holding each unseen card, add back those
+    holding two, and so on """
+    counts = np.zeros(num_scores, dtype=np.int64)
+    for size in range(5 - len(kept) + 1):
+        sign = -1 if size % 2 else 1
+        for cards in combinations(unseen, size):
+            counts += sign * count_containing(kept + list(cards), tables, memo)
+    return counts
+
+
+def enumeration_counts(kept, deck, tables):
+    """ Function that returns the number of ways to draw onto kept cards from the deck, by score
+    of the hand made, by going through every draw """
+    draws = np.asarray(deck, dtype=np.uint8)[colex_combinations(len(deck), 5 - len(kept))]
+    hands = np.concatenate([draws, np.tile(np.array(kept, dtype=np.uint8), (len(draws), 1))],
+                           axis=1)
+    hands.sort(axis=1)
+    return np.bincount(tables[5][colex_indexes(hands)], minlength=num_scores)
+
+
+def sampled_counts(kept, deck, tables, samples, rng):
+    """ Function that returns the number of hands of each score in samples random draws onto kept
+    cards from the deck """
+    draws = next(iter_deals(1, 5 - len(kept), samples, samples, rng, deck)).reshape(samples, -1)
+    hands = np.concatenate([draws, np.tile(np.array(kept, dtype=np.uint8), (samples, 1))], axis=1)
+    hands.sort(axis=1)
+    return np.bincount(tables[5][colex_indexes(hands)], minlength=num_scores)
+
+
+def solve_draw(hand, deck=None, payouts=None, exact_limit=200000, samples=20000, rng=None):
+    """ Function that returns every way to discard from a hand of 5 cards, best first, with input
+    of the hand and the deck to draw from (a Deck or a list of cards, by default every card not in
+    the hand). Each is a dictionary with the cards discarded and kept (as given), the chance of
+    each kind of hand after drawing, the expected value (the sum of the chances times the payout
+    of each kind of hand in the dictionary payouts, by default its score, see score_hands), the
+    number of ways to draw and how the chances were found.
+
+    The chances are exact, counted from the draw tables (or by going through every draw if the
+    deck is small), unless that takes more than about exact_limit lookups; then they come from
+    samples random draws made with rng (a numpy Generator or a seed) """
+    codes = [card_code(card) for card in hand]
+    if len(codes) != 5 or len(set(codes)) != 5:
+        raise ValueError("a hand must have 5 different cards")
+    if deck is None:
+        deck_codes = [code for code in range(52) if code not in codes]
+    else:
+        deck_codes = [card_code(card) for card in (deck.cards if isinstance(deck, Deck) else deck)]
+        if set(deck_codes) & set(codes) or len(set(deck_codes)) != len(deck_codes):
+            raise ValueError("the deck must not hold the cards of the hand or a card twice")
+    values = np.zeros(num_scores)
+    for name, score in score_hands.items():
+        values[score] = score if payouts is None else payouts.get(name, 0)
+
+    tables = get_draw_tables()
+    memo = {}
+    rng = np.random.default_rng(rng)
+    in_deck = set(deck_codes)
+    options = []
+    for discard_mask in range(32):
+        discard = [position for position in range(5) if discard_mask >> position & 1]
+        kept = [codes[position] for position in range(5) if position not in discard]
+        num_draws = comb(len(deck_codes), len(discard))
+        if num_draws == 0:
+            continue
+
+        # Inclusion and exclusion adds up a table row per set of unseen cards, enumeration
+        # ranks every draw; a table row costs about as much as ranking 50 draws
+        unseen = [code for code in range(52) if code not in in_deck and code not in kept]
+        exclusion_cost = 50 * sum(comb(len(unseen), size) for size in range(len(discard) + 1))
+        if min(exclusion_cost, num_draws) > exact_limit:
+            counts = sampled_counts(kept, deck_codes, tables, samples, rng)
+            method = "sampled"
+        elif exclusion_cost <= num_draws:
+            counts = exclusion_counts(kept, unseen, tables, memo)
+            method = "exact"
+        else:
+            counts = enumeration_counts(kept, deck_codes, tables)
+            method = "exact"
+
+        chances = counts / counts.sum()
+        options.append({"discard": [hand[position] for position in discard],
+                        "keep": [hand[position] for position in range(5)
+                                 if position not in discard],
+                        "categories": {hand_names[score]: float(chances[score])
+                                       for score in sorted(hand_names, reverse=True)},
+                        "ev": float(chances @ values), "draws": num_draws, "method": method})
+
+    # Sorted by expected value; of options that are as good, the ones discarding fewer cards come
+    # first
+    options.sort(key=lambda option: (-option["ev"], len(option["discard"])))
+    return options
+
+
+def solve_one(arguments):
+    """ Function that solves one hand (see solve_draw) with a tuple of its arguments, for
+    the process pool """
+    hand, deck, options = arguments
+    return solve_draw(hand, deck, **options)
+
+
+def solve_draws(hands, decks=None, workers=1, **options):
+    """ Function that solves a list of hands (see solve_draw) and returns the list of their
+    options, in workers processes if workers is more than 1. decks is a list of the deck of each
+    hand, by default every card not in the hand. Each process loads or builds the draw tables
+    once, so saving them first (see save_draw_tables) makes the processes start faster """
+    if decks is None:
+        decks = [None] * len(hands)
+    arguments = [(hand, deck, options) for hand, deck in zip(hands, decks)]
+    if workers <= 1:
+        return [solve_one(item) for item in arguments]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(solve_one, arguments,
+                                 chunksize=max(1, len(arguments) // (4 * workers))))
@@ -0,0 +1,418 @@
+""" Reading and writing hands in bulk: ranking hand history files that are too big to load into
+memory, and saving deals in a compact binary file that can be read back without parsing.
+Concurrent futures mod to split a file between processes, mmap and struct mods to read and write
+the binary deal files, os, shutil and tempfile mods to handle the output files, time mod to
+measure throughput, numpy to parse and rank many hands at once"""
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from poker_python_challenge_answers import card_codes, hand_names, hand_ranking_batch, card_code
+
+# Dictionary with every card as bytes (as read from a file) as the key and its integer card (see
+# encode_card) as the value. "T" is accepted as well as "10" for tens
+byte_card_codes = {card.encode(): code for card, code in card_codes.items()}
+byte_card_codes.update({b"T" + card[2:]: code for card, code in byte_card_codes.items()
+                        if card.startswith(b"10")})
+
+# Tables from a byte to the rank index (0 for 2, 12 for Ace) and to the suit index, with 255 for
+# bytes that are not a rank or a suit. They turn a whole array of bytes into ranks and suits at
+# once
+byte_ranks = np.full(256, 255, dtype=np.uint8)
+for rank_index, rank_byte in enumerate(b"23456789TJQKA"):
+    byte_ranks[rank_byte] = rank_index
+byte_suits = np.full(256, 255, dtype=np.uint8)
+for suit_index, suit_byte in enumerate(b"hdcs"):
+    byte_suits[suit_byte] = suit_index
+
+# A line like "Kh As 5c 3d 4h" (with "T" for tens) is 14 bytes plus the newline, with the ranks
+# at these positions, each followed by its suit
+line_width = 15
+rank_positions = [0, 3, 6, 9, 12]
+suit_positions = [1, 4, 7, 10, 13]
+
+
+def parse_line(line, line_number=None):
+    """ Function that returns the integer cards of one line (as bytes) holding five cards separated
+    by spaces or commas. Raises ValueError if the line is not a hand of five different cards """
+    tokens = line.replace(b",", b" ").split()
+    try:
+        codes = [byte_card_codes[token] for token in tokens]
+    except KeyError as error:
+        raise ValueError(f"line {line_number}: {error.args[0]!r} is not a card") from None
+    if len(codes) != 5:
+        raise ValueError(f"line {line_number}: expected 5 cards, found {len(codes)}")
+    if len(set(codes)) != 5:
+        raise ValueError(f"line {line_number}: the same card is in the hand more than once")
+    return codes
+
+
+def parse_hands(data, first_line=1):
+    """ Function that returns a numpy array of shape (number of hands, 5) with the integer cards of
+    every line in data, which is bytes holding whole lines of five cards each. Empty lines (or
+    lines of only spaces) are skipped. first_line is the line number of the first line, used in
+    error messages. Raises ValueError if a line is not a hand of five different cards (see
+    parse_line) """
+    data = data.replace(b"\r", b"").replace(b"10", b"T")
+    if data and not data.endswith(b"\n"):
+        data += b"\n"
+
+    # Most files write every hand the same way ("Kh As 5c 3d 4h"), so every line has the same
+    # width and the ranks and suits are always in the same columns. Those are looked up for all
+    # lines at once. Anything else is parsed one line at a time
+    if len(data) % line_width == 0:
+        rows = np.frombuffer(data, dtype=np.uint8).reshape(-1, line_width)
+        ranks = byte_ranks[rows[:, rank_positions]]
+        suits = byte_suits[rows[:, suit_positions]]
+        if (rows[:, -1] == ord("\n")).all() and (ranks != 255).all() and (suits != 255).all() \
+                and np.isin(rows[:, [2, 5, 8, 11]], [ord(" "), ord(",")]).all():
+            hands = suits * 13 + ranks
+            # A card held twice is next to itself once each hand is sorted
+            ordered = np.sort(hands, axis=1)
+            repeated = np.flatnonzero((ordered[:, 1:] == ordered[:, :-1]).any(axis=1))
+            if len(repeated):
+                raise ValueError(f"line {first_line + repeated[0]}: the same card is in the hand "
+                                 "more than once")
+            return hands
+
+    lines = data.splitlines()
+    hands = np.empty((len(lines), 5), dtype=np.uint8)
+    num_hands = 0
+    for index, line in enumerate(lines):
+        if line.strip():
+            hands[num_hands] = parse_line(line, first_line + index)
+            num_hands += 1
+    return hands[:num_hands]
+
+
+def read_stream_blocks(stream, block_size=1 << 24):
+    """ Function that reads an open binary stream (a file or standard input) block_size bytes at
+    a time and yields blocks of whole lines """
+    pending = b""
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            break
+        data = pending + block
+        cut = data.rfind(b"\n") + 1
+        if cut:
+            yield data[:cut]
+        pending = data[cut:]
+    if pending:
+        yield pending
+
+
+def read_line_blocks(path, block_size=1 << 24, start=0, end=None):
+    """ Function that reads the file at path block_size bytes at a time and yields blocks of whole
+    lines. Only the lines that start in the byte range from start up to end (the whole file by
+    default) are read, so a file can be split between workers without sharing a line """
+    with open(path, "rb") as file:
+        # A line that starts before start belongs to the previous range, so skip to the start of
+        # the next line
+        if start > 0:
+            file.seek(start - 1)
+            file.readline()
+
+        # offset is where in the file the bytes in pending start
+        offset = file.tell()
+        pending = b""
+        while end is None or offset < end:
+            block = file.read(block_size)
+            data = pending + block
+            # Keep a partly read line for the next block, unless the file has ended
+            cut = data.rfind(b"\n") + 1 if block else len(data)
+            lines, pending = data[:cut], data[cut:]
+
+            # Only keep the lines that start before end: the line holding the byte just before
+            # end is the last one
+            if end is not None and offset + len(lines) > end:
+                lines = lines[:lines.find(b"\n", end - offset - 1) + 1 or len(lines)]
+            if lines:
+                yield lines
+            offset += len(lines)
+            if not block:
+                break
+
+
+def rank_blocks(blocks, start=0):
+    """ Function that yields one numpy array of hand strengths (see hand_strength) for each block
+    of whole lines of hands (see parse_hands). start is the byte of the file the lines were read
+    from (see read_line_blocks); errors name the line counted from there """
+    line_number = 1
+    try:
+        for block in blocks:
+            hands = parse_hands(block, line_number)
+            # Lines are counted rather than hands, since empty lines are skipped
+            line_number += block.count(b"\n") + (not block.endswith(b"\n"))
+            yield hand_ranking_batch(hands, strength=True)
+    except ValueError as error:
+        # A worker given a byte range of the file only knows the lines from the start of the range
+        if start:
+            raise ValueError(f"in the lines from byte {start}: {error}") from None
+        raise
+
+
+def iter_ranked_file(path, block_size=1 << 24, start=0, end=None):
+    """ Function that ranks the hands in the file at path (one hand per line, see parse_hands) and
+    yields one numpy array of hand strengths (see hand_strength) per block of lines read. Only
+    one block is held in memory at a time. start and end limit the lines read to a byte range
+    (see read_line_blocks) """
+    return rank_blocks(read_line_blocks(path, block_size, start, end), start)
+
+
+def format_results(strengths):
+    """ Function that returns bytes with one line "hand,strength" (e.g. "Pair,2285874") for each
+    strength in an array """
+    return "".join(f"{hand_names[strength >> 20]},{strength}\n"
+                   for strength in strengths.tolist()).encode()
+
+
+def rank_file_range(path, output_path, block_size=1 << 24, start=0, end=None):
+    """ Function that ranks the lines of the file at path that start in the byte range from start
+    to end, writes the results (see format_results) to output_path and returns the number of
+    lines """
+    lines = 0
+    with open(output_path, "wb") as output:
+        for strengths in iter_ranked_file(path, block_size, start, end):
+            output.write(format_results(strengths))
+            lines += len(strengths)
+    return lines
+
+
+def rank_file(path, output_path, block_size=1 << 24, workers=1):
+    """ Function that ranks every hand in the file at path (one hand per line, see parse_hands)
+    and writes one line "hand,strength" per hand to output_path, in the same order. Memory use
+    depends on block_size, not on the size of the file. With more than one worker, the file is
+    split into workers byte ranges that are ranked by separate processes and then joined.
+    Returns a dictionary with the number of lines, the time taken and the lines per second """
+    start_time = time.perf_counter()
+    if workers <= 1:
+        lines = rank_file_range(path, output_path, block_size)
+    else:
+        # Each worker writes its part of the output to its own file next to output_path
+        size = os.path.getsize(path)
+        bounds = [size * worker // workers for worker in range(workers + 1)]
+        directory = os.path.dirname(os.path.abspath(output_path))
+        part_paths = []
+        for _ in range(workers):
+            handle, part_path = tempfile.mkstemp(dir=directory, suffix=".part")
+            os.close(handle)
+            part_paths.append(part_path)
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                lines = sum(executor.map(rank_file_range, [path] * workers, part_paths,
+                                         [block_size] * workers, bounds[:-1], bounds[1:]))
+            with open(output_path, "wb") as output:
+                for part_path in part_paths:
+                    with open(part_path, "rb") as part:
+                        shutil.copyfileobj(part, output, block_size)
+        finally:
+            for part_path in part_paths:
+                os.remove(part_path)
+
+    seconds = time.perf_counter() - start_time
+    return {"lines": lines, "seconds": seconds,
+            "lines_per_second": lines / seconds if seconds else float("inf")}
+
+
+# Binary deal files. A deal file starts with a header (deal_header) holding the number of players,
+# the cards per hand, the bits used per card, the seed the deals were made with (if any) and the
+# number of deals, followed by the player names (one per line, padded to a multiple of 8 bytes).
+# Then every deal is stored as a record of the same size: the integer cards (see encode_card) of
+# the first player, then the second player and so on. With 8 bits per card each card is one byte,
+# so the records can be used as a numpy array straight from the file without copying. With 6 bits
+# per card (enough for 0-51) the records are a quarter smaller but have to be unpacked to be read:
+# every 4 cards fill 3 bytes, first card in the highest bits
+deal_file_name = b"PKRDEALS"
+deal_file_version = 1
+# Name, version, players, cards per hand, bits per card, flags, seed, number of deals, length of
+# the player names
+deal_header = struct.Struct("<8sHHBBHQQI4x")
+# Flag set when the file holds the seed the deals were made with
+deal_flag_seed = 1
+
+
+def pack_cards(cards, card_bits):
+    """ Function that returns the records for an array of integer cards of shape (number of deals,
+    number of cards per deal), as a uint8 array with one row per deal """
+    cards = np.ascontiguousarray(cards, dtype=np.uint8)
+    if card_bits == 8:
+        return cards
+
+    # Every 4 cards of 6 bits fill 3 bytes, first card in the highest bits. The cards are padded
+    # with zeros to a multiple of 4, and bytes that only hold padding are cut off again
+    num_deals, num_cards = cards.shape
+    padded = np.zeros((num_deals, -(-num_cards // 4) * 4), dtype=np.uint32)
+    padded[:, :num_cards] = cards
+    groups = padded.reshape(num_deals, -1, 4)
+    values = groups[..., 0] << 18 | groups[..., 1] << 12 | groups[..., 2] << 6 | groups[..., 3]
+    packed = np.stack([values >> 16, values >> 8, values], axis=2).astype(np.uint8)
+    return packed.reshape(num_deals, -1)[:, :(num_cards * 6 + 7) // 8]
+
+
+def unpack_cards(records, num_cards, card_bits):
+    """ Function that returns the integer cards of shape (number of deals, num_cards) stored in a
+    uint8 array of records with one row per deal (see pack_cards) """
+    if card_bits == 8:
+        return records
+    num_deals = len(records)
+    padded = np.zeros((num_deals, -(-num_cards // 4) * 3), dtype=np.uint32)
+    padded[:, :records.shape[1]] = records
+    groups = padded.reshape(num_deals, -1, 3)
+    values = groups[..., 0] << 16 | groups[..., 1] << 8 | groups[..., 2]
+    cards = np.stack([values >> 18, values >> 12, values >> 6, values], axis=2) & 63
+    return cards.astype(np.uint8).reshape(num_deals, -1)[:, :num_cards]
+
+
+class DealWriter:
+    """ Class representing a binary deal file being written. Use it in a with statement, or call
+    close() at the end, which writes the number of deals into the header """
+
+    def __init__(self, path, player_list, hand_size=5, seed=None, card_bits=8):
+        """ Initialize the writer and write the header. card_bits is 8 for one byte per card or 6
+        for a smaller file. seed, if given, must fit the header's 64 bits (0 to 2 ** 64 - 1) """
+        if card_bits not in (6, 8):
+            raise ValueError(f"card_bits must be 6 or 8, not {card_bits}")
+        if seed is not None and not (isinstance(seed, (int, np.integer)) and 0 <= seed < 1 << 64):
+            raise ValueError(f"seed must be an integer from 0 to 2 ** 64 - 1, not {seed!r}")
+        if any("\n" in name for name in player_list):
+            raise ValueError("player names can not hold a newline")
+        self.player_list = list(player_list)
+        self.hand_size = hand_size
+        self.seed = None if seed is None else int(seed)
+        self.card_bits = card_bits
+        self.count = 0
+        names = "\n".join(self.player_list).encode()
+        self.names = names + b"\0" * (-len(names) % 8)
+        self.file = open(path, "wb")
+        self.write_header()
+
+    def write_header(self):
+        """ Function that writes the header with the current number of deals at the start of the
+        file """
+        self.file.seek(0)
+        self.file.write(deal_header.pack(
+            deal_file_name, deal_file_version, len(self.player_list), self.hand_size,
+            self.card_bits, deal_flag_seed if self.seed is not None else 0,
+            self.seed or 0, self.count, len(self.names)) + self.names)
+
+    def write(self, deals):
+        """ Function that adds deals to the file, either as an array of integer cards of shape
+        (number of deals, number of players, cards per hand) or as a list of dictionaries of
+        players and their cards (see deal_cards), which can be strings, integers or Cards. Raises
+        ValueError if a card is not an integer from 0 to 51, since it would not round trip """
+        if not isinstance(deals, np.ndarray):
+            deals = np.array([[[card_code(card) for card in players[name]]
+                               for name in self.player_list] for players in deals],
+                             dtype=np.int64).reshape(-1, len(self.player_list), self.hand_size)
+        if deals.shape[1:] != (len(self.player_list), self.hand_size):
+            raise ValueError(f"deals must have shape (number of deals, {len(self.player_list)}, "
+                             f"{self.hand_size}), not {deals.shape}")
+        # pack_cards keeps only the low 8 or 6 bits of each card, so anything else is cut down to
+        # a different card without an error
+        if not np.issubdtype(deals.dtype, np.integer) or \
+                deals.size and (deals.min() < 0 or deals.max() > 51):
+            raise ValueError("deals must hold integer cards from 0 to 51")
+        self.file.write(pack_cards(deals.reshape(len(deals), -1), self.card_bits).tobytes())
+        self.count += len(deals)
+
+    def close(self):
+        """ Function that writes the number of deals into the header and closes the file """
+        if not self.file.closed:
+            self.write_header()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_deals(path, deals, player_list=None, seed=None, card_bits=8):
+    """ Function that writes deals (see DealWriter.write) to a new binary deal file at path. The
+    player names are taken from the first deal unless player_list is given """
+    if player_list is None:
+        player_list = list(deals[0]) if not isinstance(deals, np.ndarray) else \
+            [f"Player {num}" for num in range(1, deals.shape[1] + 1)]
+    hand_size = deals.shape[2] if isinstance(deals, np.ndarray) else \
+        len(next(iter(deals[0].values())))
+    with DealWriter(path, player_list, hand_size, seed, card_bits) as writer:
+        writer.write(deals)
+
+
+class DealFile:
+    """ Class representing a binary deal file opened for reading. The file is mapped into memory,
+    so opening it does not read the deals """
+
+    def __init__(self, path):
+        """ Initialize by reading the header. Raises ValueError if path is not a deal file or is
+        shorter than its header says """
+        with open(path, "rb") as file:
+            self.mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mapped) < deal_header.size:
+            raise ValueError(f"{path} is too short to be a deal file")
+        (name, version, num_players, self.hand_size, self.card_bits, flags, seed, self.count,
+         names_length) = deal_header.unpack_from(self.mapped)
+        if name != deal_file_name or version != deal_file_version:
+            raise ValueError(f"{path} is not a version {deal_file_version} deal file")
+        self.seed = seed if flags & deal_flag_seed else None
+        names = self.mapped[deal_header.size:deal_header.size + names_length]
+        self.player_list = names.rstrip(b"\0").decode().split("\n")[:num_players]
+        self.num_cards = num_players * self.hand_size
+        self.record_size = (self.num_cards * self.card_bits + 7) // 8
+        self.offset = deal_header.size + names_length
+        if len(self.mapped) < self.offset + self.count * self.record_size:
+            raise ValueError(f"{path} holds fewer deals than its header says")
+
+    def __len__(self):
+        """ Return the number of deals in the file """
+        return self.count
+
+    def records(self, start=0, stop=None):
+        """ Function that returns the records of the deals from start up to stop as a uint8 array
+        with one row per deal, read straight from the mapped file without copying """
+        stop = self.count if stop is None else min(stop, self.count)
+        start = min(start, stop)
+        return np.frombuffer(self.mapped, dtype=np.uint8, count=(stop - start) * self.record_size,
+                             offset=self.offset + start * self.record_size).reshape(
+            stop - start, self.record_size)
+
+    def deals(self, start=0, stop=None):
+        """ Function that returns the deals from start up to stop as an array of integer cards of
+        shape (number of deals, number of players, cards per hand), ready for winners_batch or
+        hand_ranking_batch. With 8 bits per card the array is read only and uses the mapped file
+        instead of a copy """
+        cards = unpack_cards(self.records(start, stop), self.num_cards, self.card_bits)
+        return cards.reshape(-1, len(self.player_list), self.hand_size)
+
+    def iter_deals(self, chunk_size=1 << 20):
+        """ Function that yields the deals chunk_size at a time (see deals), so files with more
+        deals than fit in memory can be gone through """
+        for start in range(0, self.count, chunk_size):
+            yield self.deals(start, start + chunk_size)
+
+    def tables(self, start=0, stop=None):
+        """ Function that returns the deals from start up to stop as a list of dictionaries of
+        players and their integer cards, like deal_cards gives, e.g. to replay with winner_is """
+        return [dict(zip(self.player_list, deal)) for deal in self.deals(start, stop).tolist()]
+
+    def close(self):
+        """ Function that unmaps the file, or leaves that until the arrays returned by deals() and
+        records() are gone if they are still in use """
+        try:
+            self.mapped.close()
+        except BufferError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,266 @@
+""" Instrumentation for the poker functions: how often each function is called, how long the calls
+take, how often each boolean check (is_flush, is_pair, ...) is true and how many hands of each
+kind are ranked. Instrumentation is off until enable() is called, and while it is off the poker
+functions are the plain functions with nothing added, so it costs nothing. enable() swaps the
+functions for timed versions and disable() puts the originals back. Bisect mod to find the
+latency bucket of a call, functools mod to wrap the functions, json mod for the JSON dump, sys mod
+to find other modules holding the functions, threading mod to keep enable and disable from
+running at the same time, time mod to time the calls, numpy to count the hands ranked in a batch"""
+import functools
+import json
+import sys
+import threading
+from bisect import bisect_left
+from time import perf_counter
+
+import numpy as np
+
+import poker_python_challenge_answers as poker
+
+# Upper bounds in seconds of the latency buckets, from a microsecond to a second. A call that
+# takes longer than the last bound goes in one more bucket for everything slower
+latency_buckets = [1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 1e-3, 1e-2, 0.1, 1.0]
+
+# The functions that are timed, by name. The hand ranking functions also count the kind of hand
+# they return, the boolean checks count how often they are true. Note that hand_ranking and
+# hand_strength use the lookup tables, so the boolean checks only run when classify_sorted_hand is
+# called (e.g. while the lookup tables are built)
+predicate_names = ["is_royal_flush", "is_straight_flush", "is_four_kind", "is_full_house",
+                   "is_flush", "is_straight", "is_three_kind", "is_two_pair", "is_pair"]
+ranking_names = ["hand_ranking", "hand_strength", "best_hand_strength", "best_hand_ranking",
+                 "classify_sorted_hand"]
+timed_names = ["sort_cards", "winner_is", "deal_cards", "deal_cards_batch", "shuffle_batch"]
+deck_method_names = ["build", "shuffle", "deal", "deal_random", "reset"]
+
+
+class Metrics:
+    """ Class representing the collected counts and timings. Each timed function has a call count,
+    the total time of its calls in seconds and a count of calls per latency bucket """
+
+    def __init__(self):
+        """ Initialize empty metrics """
+        self.calls = {}
+        self.seconds = {}
+        self.buckets = {}
+        # Number of times each boolean check returned True
+        self.true_counts = {}
+        # Dictionary of function names, each holding the number of hands of each kind it returned
+        self.categories = {}
+
+    def record(self, name, seconds):
+        """ Function that adds one call of the function name that took seconds """
+        if name not in self.calls:
+            self.calls[name] = 0
+            self.seconds[name] = 0.0
+            self.buckets[name] = [0] * (len(latency_buckets) + 1)
+        self.calls[name] += 1
+        self.seconds[name] += seconds
+        self.buckets[name][bisect_left(latency_buckets, seconds)] += 1
+
+    def count_category(self, name, category, num=1):
+        """ Function that adds num hands of kind category returned by the function name """
+        counts = self.categories.setdefault(name, dict.fromkeys(poker.score_hands, 0))
+        counts[category] += num
+
+    def reset(self):
+        """ Function that sets every count and timing back to zero. The dictionaries are emptied
+        instead of replaced, since the timed functions hold on to them """
+        for counts in (self.calls, self.seconds, self.buckets, self.true_counts, self.categories):
+            counts.clear()
+
+    def snapshot(self):
+        """ Function that returns a copy of the metrics as a dictionary: for each timed function its
+        calls, total seconds, mean seconds and the count of calls per latency bucket (keyed by the
+        upper bound in seconds, "+Inf" for the rest), plus the true counts of the boolean checks
+        and the kinds of hand returned by each ranking function """
+        bounds = [str(bound) for bound in latency_buckets] + ["+Inf"]
+        functions = {name: {"calls": calls, "seconds": self.seconds[name],
+                            "mean_seconds": self.seconds[name] / calls,
+                            "buckets": dict(zip(bounds, self.buckets[name]))}
+                     for name, calls in self.calls.items()}
+        return {"functions": functions, "predicate_true": dict(self.true_counts),
+                "categories": {name: dict(counts) for name, counts in self.categories.items()}}
+
+    def to_json(self):
+        """ Function that returns the snapshot (see snapshot) as a JSON string """
+        return json.dumps(self.snapshot(), sort_keys=True)
+
+    def to_prometheus(self, prefix="poker"):
+        """ Function that returns the metrics in the Prometheus text format, with a histogram of
+        the call latency per function, a counter of true results per boolean check and a counter
+        of hands per kind of hand and function """
+        lines = [f"# HELP {prefix}_call_seconds Time spent in each poker function.",
+                 f"# TYPE {prefix}_call_seconds histogram"]
+        for name, calls in self.calls.items():
+            # Prometheus buckets count every call up to their bound, so they add up
+            total = 0
+            for bound, count in zip(latency_buckets + ["+Inf"], self.buckets[name]):
+                total += count
+                lines.append(f'{prefix}_call_seconds_bucket{{function="{name}",le="{bound}"}} '
+                             f'{total}')
+            lines.append(f'{prefix}_call_seconds_sum{{function="{name}"}} {self.seconds[name]!r}')
+            lines.append(f'{prefix}_call_seconds_count{{function="{name}"}} {calls}')
+
+        lines += [f"# HELP {prefix}_predicate_true_total Times each boolean check was true.",
+                  f"# TYPE {prefix}_predicate_true_total counter"]
+        lines += [f'{prefix}_predicate_true_total{{predicate="{name}"}} {count}'
+                  for name, count in self.true_counts.items()]
+
+        lines += [f"# HELP {prefix}_hands_total Hands ranked, by function and kind of hand.",
+                  f"# TYPE {prefix}_hands_total counter"]
+        lines += [f'{prefix}_hands_total{{function="{name}",category="{category}"}} {count}'
+                  for name, counts in self.categories.items()
+                  for category, count in counts.items()]
+        return "\n".join(lines) + "\n"
+
+
+# The metrics everything is recorded in, the original functions while enabled (by name, with
+# "Deck." in front of the Deck methods) and a lock around enable and disable
+metrics = Metrics()
+originals = {}
+switch_lock = threading.Lock()
+
+
+def timed(name, func):
+    """ Function that returns a version of func that records the time of each call """
+    record = metrics.record
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        result = func(*args, **kwargs)
+        record(name, perf_counter() - start)
+        return result
+    return wrapper
+
+
+def timed_predicate(name, func):
+    """ Function that returns a version of a boolean check that records the time of each call and
+    counts how often it is true """
+    record = metrics.record
+    true_counts = metrics.true_counts
+
+    @functools.wraps(func)
+    def wrapper(sorted_hand):
+        start = perf_counter()
+        result = func(sorted_hand)
+        record(name, perf_counter() - start)
+        if result:
+            true_counts[name] = true_counts.get(name, 0) + 1
+        return result
+    return wrapper
+
+
+def timed_ranking(name, func):
+    """ Function that returns a version of a hand ranking function that records the time of each
+    call and counts the kind of hand it returns (a name, or a strength, see hand_strength) """
+    record = metrics.record
+    count_category = metrics.count_category
+    hand_names = poker.hand_names
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        result = func(*args, **kwargs)
+        record(name, perf_counter() - start)
+        count_category(name, result if type(result) is str else hand_names[result >> 20])
+        return result
+    return wrapper
+
+
+def timed_batch(name, func):
+    """ Function that returns a version of hand_ranking_batch that records the time of each call
+    and counts the kinds of hand in the results """
+    record = metrics.record
+    count_category = metrics.count_category
+
+    @functools.wraps(func)
+    def wrapper(hands, strength=False, *args, **kwargs):
+        start = perf_counter()
+        results = func(hands, strength, *args, **kwargs)
+        record(name, perf_counter() - start)
+        scores = np.bincount((results >> 20 if strength else results).ravel(),
+                             minlength=len(poker.hand_names))
+        for score, count in enumerate(scores.tolist()):
+            if count:
+                count_category(name, poker.hand_names[score], count)
+        return results
+    return wrapper
+
+
+def replace_everywhere(old, new):
+    """ Function that replaces the function old with new in every loaded module that holds it
+    under some name (e.g. after "from poker_python_challenge_answers import hand_ranking") """
+    for module in list(sys.modules.values()):
+        namespace = getattr(module, "__dict__", None)
+        if not namespace:
+            continue
+        for name, value in list(namespace.items()):
+            if value is old:
+                namespace[name] = new
+
+
+def enable():
+    """ Function that turns instrumentation on by swapping the poker functions for timed ones.
+    Counting carries on from what was recorded before, see reset() """
+    with switch_lock:
+        if originals:
+            return
+        wrappers = {}
+        for name in predicate_names:
+            wrappers[name] = timed_predicate(name, getattr(poker, name))
+        for name in ranking_names:
+            wrappers[name] = timed_ranking(name, getattr(poker, name))
+        for name in timed_names:
+            wrappers[name] = timed(name, getattr(poker, name))
+        wrappers["hand_ranking_batch"] = timed_batch("hand_ranking_batch",
+                                                     poker.hand_ranking_batch)
+        for name, wrapper in wrappers.items():
+            originals[name] = getattr(poker, name)
+            replace_everywhere(originals[name], wrapper)
+
+        # Deck methods are replaced on the class, so every deck uses them
+        for name in deck_method_names:
+            method = getattr(poker.Deck, name)
+            originals["Deck." + name] = method
+            setattr(poker.Deck, name, timed("Deck." + name, method))
+
+
+def disable():
+    """ Function that turns instrumentation off by putting the original poker functions back. The
+    metrics recorded so far are kept """
+    with switch_lock:
+        for name, original in originals.items():
+            if name.startswith("Deck."):
+                setattr(poker.Deck, name[5:], original)
+            else:
+                replace_everywhere(getattr(poker, name), original)
+        originals.clear()
+
+
+def is_enabled():
+    """ Function that returns True if instrumentation is on """
+    return bool(originals)
+
+
+def reset():
+    """ Function that sets every count and timing back to zero """
+    metrics.reset()
+
+
+def snapshot():
+    """ Function that returns a copy of the metrics recorded so far (see Metrics.snapshot) """
+    return metrics.snapshot()
+
+
+def dump(path, metrics_format=None):
+    """ Function that writes the metrics to the file at path, as JSON or in the Prometheus text
+    format. The format is taken from the file extension (".json" for JSON) unless it is given as
+    "json" or "prometheus" """
+    if metrics_format is None:
+        metrics_format = "json" if str(path).endswith(".json") else "prometheus"
+    with open(path, "w") as file:
+        if metrics_format == "json":
+            file.write(metrics.to_json() + "\n")
+        else:
+            file.write(metrics.to_prometheus())
@@ -0,0 +1,369 @@
+""" Profiling the poker functions: where the time goes and how much memory each call allocates.
+A workload (e.g. ranking 20,000 hands with hand_ranking) is run under a sampling profiler, which
+looks at the running stack every millisecond, or under a tracing profiler, which times every call
+and return. Either one gives a count per stack, written in the collapsed stack format that flame
+graph tools read (one line per stack, "outer;inner;innermost weight"), and a table of the functions
+that take the most time. Tracemalloc measures the memory allocated per call. Argparse mod for the
+command line, collections mod to count stacks, sys, threading and time mods to sample and trace
+stacks, tracemalloc mod to measure allocations, random mod for the workloads' hands.
+Run with: python poker_profile.py --help """
+import argparse
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from poker_python_challenge_answers import Deck, convert_card_to_numeric, deal_cards, \
+    decode_hand, encode_hand, hand_ranking, sort_cards, winner_is
+
+
+def frame_name(frame):
+    """ Function that returns the name of the function a stack frame runs, with its module, e.g.
+    "poker_python_challenge_answers.hand_ranking" """
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}.{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def builtin_name(func):
+    """ Function that returns the name of a function written in C, with its module if it has one
+    (methods such as list.append only have their class) """
+    name = getattr(func, "__qualname__", getattr(func, "__name__", "?"))
+    module = getattr(func, "__module__", None)
+    return f"{module}.{name}" if module else name
+
+
+class StackSampler:
+    """ Class representing a sampling profiler for the block of code in a with statement. Another
+    thread looks at the stack of the thread running the block every interval seconds and counts
+    each stack it sees, from the function holding the with statement inward """
+
+    def __init__(self, interval=0.001):
+        """ Initialize the sampler with the time in seconds between samples """
+        self.interval = interval
+        self.stacks = Counter()
+        self.stop = threading.Event()
+        self.thread = None
+
+    def __enter__(self):
+        self.root = sys._getframe(1)
+        self.ident = threading.get_ident()
+        # Python only lets another thread run every switch interval, 5 ms by default, so it is
+        # made as short as the interval while sampling
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self.switch_interval, self.interval))
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def sample(self):
+        """ Function that counts the stack of the profiled thread until the sampler is stopped """
+        while not self.stop.wait(self.interval):
+            frame = sys._current_frames().get(self.ident)
+            if self.stop.is_set():
+                break
+            names = []
+            while frame is not None and frame is not self.root:
+                names.append(frame_name(frame))
+                frame = frame.f_back
+            # Stacks that do not reach the with statement are from before or after the block
+            if frame is self.root:
+                names.append(frame_name(frame))
+                self.stacks[";".join(reversed(names))] += 1
+
+    def __exit__(self, *exc_info):
+        self.stop.set()
+        self.thread.join()
+        sys.setswitchinterval(self.switch_interval)
+        self.root = None
+
+
+class StackTracer:
+    """ Class representing a tracing profiler for the block of code in a with statement. Every call
+    and return in the thread running the block (including calls of functions written in C) is
+    seen, and the time between them in microseconds is added to the stack running at the time """
+
+    def __init__(self):
+        """ Initialize the tracer """
+        self.stacks = Counter()
+
+    def __enter__(self):
+        names = [frame_name(sys._getframe(1))]
+        stacks = self.stacks
+        clock = time.perf_counter_ns
+        last = clock()
+
+        def trace(frame, event, arg):
+            nonlocal last
+            now = clock()
+            stacks[";".join(names)] += (now - last) / 1000
+            if event == "call":
+                names.append(frame_name(frame))
+            elif event == "c_call":
+                names.append(builtin_name(arg))
+            # A return with only the root on the stack is from a call made before tracing began
+            elif len(names) > 1:
+                names.pop()
+            last = clock()
+
+        sys.setprofile(trace)
+        return self
+
+    def __exit__(self, *exc_info):
+        sys.setprofile(None)
+        # Rounded to whole microseconds; the call to __exit__ itself is not part of the block
+        self.stacks = Counter({stack: round(weight) for stack, weight in self.stacks.items()
+                               if round(weight) and not stack.endswith(".__exit__")})
+
+
+def collapse_stacks(stacks):
+    """ Function that returns a Counter of stacks in the collapsed stack format read by flame graph
+    tools: one line per stack with the function names from the outside in, separated by ";",
+    followed by a space and the stack's weight """
+    return "".join(f"{stack} {weight}\n" for stack, weight in sorted(stacks.items()))
+
+
+def hotspots(stacks, limit=20):
+    """ Function that returns the functions that take the most time, with input of a Counter of
+    stacks. Each is a dictionary with the function's name, its self weight (stacks where it was
+    the running function) and total weight (stacks it was part of), and both as a share of all
+    the stacks' weight, sorted from the largest self weight """
+    self_weights = Counter()
+    total_weights = Counter()
+    for stack, weight in stacks.items():
+        names = stack.split(";")
+        self_weights[names[-1]] += weight
+        for name in set(names):
+            total_weights[name] += weight
+    all_weight = sum(stacks.values()) or 1
+    rows = [{"function": name, "self": self_weights[name], "total": total,
+             "self_share": self_weights[name] / all_weight, "total_share": total / all_weight}
+            for name, total in total_weights.items()]
+    rows.sort(key=lambda row: (-row["self"], -row["total"], row["function"]))
+    return rows[:limit]
+
+
+def format_hotspots(rows, unit="samples"):
+    """ Function that returns the rows of hotspots as a table of text """
+    lines = [f"{'self %':>7} {'total %':>7} {'self ' + unit:>14}  function"]
+    lines += [f"{row['self_share']:7.1%} {row['total_share']:7.1%} {row['self']:14,.0f}  "
+              f"{row['function']}" for row in rows]
+    return "\n".join(lines) + "\n"
+
+
+# What tracemalloc and this module allocate to do the measuring is left out of the lines of code
+measuring_filters = [tracemalloc.Filter(False, tracemalloc.__file__),
+                     tracemalloc.Filter(False, __file__)]
+
+
+class AllocationTracker:
+    """ Class representing tracemalloc running for the block of code in a with statement. After the
+    block, peak is the most memory in bytes the block had allocated at one time, retained is what
+    it still held at the end and top_lines the lines of code that allocated what was retained """
+
+    def __init__(self, limit=10):
+        """ Initialize the tracker with the number of lines of code to keep in top_lines """
+        self.limit = limit
+        self.peak = self.retained = 0
+        self.top_lines = []
+
+    def __enter__(self):
+        self.started = not tracemalloc.is_tracing()
+        if self.started:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self.before = tracemalloc.take_snapshot()
+        self.start_size = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def __exit__(self, *exc_info):
+        size, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        if self.started:
+            tracemalloc.stop()
+        # Filtered only once both snapshots are taken, since filtering allocates too
+        after = after.filter_traces(measuring_filters)
+        self.before = self.before.filter_traces(measuring_filters)
+        self.peak = peak - self.start_size
+        self.retained = size - self.start_size
+        self.top_lines = [(str(stat.traceback[0]), stat.size_diff, stat.count_diff)
+                          for stat in after.compare_to(self.before, "lineno")[:self.limit]
+                          if stat.size_diff > 0]
+
+
+def measure_allocations(func, inputs, num_calls=2000):
+    """ Function that calls func on each of the first num_calls inputs with tracemalloc running,
+    and returns a dictionary with the number of calls, the mean peak memory in bytes allocated
+    during a call (which includes short lived objects such as the tuples of sort_cards, freed
+    before the call returns), the mean memory still held after each call and the lines of code
+    that held it (see AllocationTracker) """
+    inputs = inputs[:num_calls]
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        # One call before measuring, so caches filled on the first call are not counted
+        if inputs:
+            func(inputs[0])
+        peaks = 0
+        with AllocationTracker() as tracker:
+            for item in inputs:
+                before = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                func(item)
+                peaks += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        if started:
+            tracemalloc.stop()
+    calls = max(1, len(inputs))
+    return {"calls": len(inputs), "peak_bytes_per_call": peaks / calls,
+            "retained_bytes_per_call": tracker.retained / calls, "top_lines": tracker.top_lines}
+
+
+# The workloads that can be profiled. Each one is a function called once per input, and a function
+# that makes num_inputs inputs from a seed
+def make_string_hands(num_inputs, seed=0):
+    """ Function that returns num_inputs random hands of five card strings """
+    rng = random.Random(seed)
+    cards = decode_hand(range(52))
+    return [rng.sample(cards, 5) for _ in range(num_inputs)]
+
+
+def make_tables(num_inputs, seed=0):
+    """ Function that returns num_inputs tables of four players and their hands """
+    deck = Deck(rng=random.Random(seed))
+    deck.build()
+    return [deal_cards(["Noor", "Hagen", "Sadie", "Kunai"], deck=deck) for _ in range(num_inputs)]
+
+
+def make_encoded_hands(num_inputs, seed=0):
+    """ Function that returns num_inputs random hands of five integer cards """
+    return [encode_hand(hand) for hand in make_string_hands(num_inputs, seed)]
+
+
+def make_cards(num_inputs, seed=0):
+    """ Function that returns num_inputs random card strings """
+    return [hand[0] for hand in make_string_hands(num_inputs, seed)]
+
+
+def make_decks(num_inputs, seed=0):
+    """ Function that returns num_inputs new decks """
+    return [Deck(rng=random.Random(seed + num)) for num in range(num_inputs)]
+
+
+def make_player_lists(num_inputs, seed=0):
+    """ Function that returns num_inputs lists of four player names """
+    return [["Noor", "Hagen", "Sadie", "Kunai"]] * num_inputs
+
+
+def build_deck(deck):
+    """ Function that builds a deck (see Deck.build). build adds a full deck to the cards, so the
+    deck is emptied first; otherwise every call made while the workload repeats would make the deck
+    bigger and time extending a huge list rather than building a deck """
+    deck.cards.clear()
+    deck.build()
+
+
+def showdown(player_list):
+    """ Function that deals a hand to every player and returns the winners """
+    return winner_is(deal_cards(player_list))
+
+
+workloads = {
+    "hand_ranking": (hand_ranking, make_string_hands),
+    "hand_ranking_encoded": (hand_ranking, make_encoded_hands),
+    "sort_cards": (sort_cards, make_string_hands),
+    "convert_card_to_numeric": (convert_card_to_numeric, make_cards),
+    "Deck.build": (build_deck, make_decks),
+    "deal_cards": (deal_cards, make_player_lists),
+    "winner_is": (winner_is, make_tables),
+    "showdown": (showdown, make_player_lists),
+}
+
+
+def run_workload(func, inputs, min_seconds=0.0):
+    """ Function that calls func on every input, again and again until at least min_seconds have
+    passed, and returns the number of calls """
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        for item in inputs:
+            func(item)
+        calls += len(inputs)
+        if not inputs or time.perf_counter() - start >= min_seconds:
+            return calls
+
+
+def profile_workload(name, num_inputs=20000, seed=0, mode="sample", interval=0.001, memory=True,
+                     limit=20, min_seconds=1.0):
+    """ Function that profiles the workload name (see workloads) on num_inputs inputs made from
+    seed, run again and again until at least min_seconds have passed so there are enough samples.
+    mode is "sample" for the sampling profiler (see StackSampler) or "trace" for the tracing
+    profiler (see StackTracer). Returns a dictionary with the workload, mode, number of calls,
+    seconds taken, the counted stacks, the hotspots (see hotspots) and, if memory is True, the
+    memory allocated per call (see measure_allocations) """
+    if name not in workloads:
+        raise ValueError(f"unknown workload {name!r}, choose from {', '.join(workloads)}")
+    if mode not in ("sample", "trace"):
+        raise ValueError(f"mode must be 'sample' or 'trace', not {mode!r}")
+    func, make_inputs = workloads[name]
+    inputs = make_inputs(num_inputs, seed)
+
+    profiler = StackSampler(interval) if mode == "sample" else StackTracer()
+    start = time.perf_counter()
+    with profiler:
+        calls = run_workload(func, inputs, min_seconds)
+    seconds = time.perf_counter() - start
+
+    result = {"workload": name, "mode": mode, "calls": calls, "seconds": seconds,
+              "stacks": profiler.stacks, "hotspots": hotspots(profiler.stacks, limit)}
+    if memory:
+        result["memory"] = measure_allocations(func, make_inputs(min(num_inputs, 2000), seed + 1))
+    return result
+
+
+def format_memory(memory, unit="call"):
+    """ Function that returns the memory measured by measure_allocations as text """
+    lines = [f"memory: {memory['peak_bytes_per_call']:,.0f} bytes at peak per {unit}, "
+             f"{memory['retained_bytes_per_call']:,.1f} bytes retained per {unit}"]
+    lines += [f"  {size:+,} bytes in {count:+,} blocks  {line}"
+              for line, size, count in memory["top_lines"]]
+    return "\n".join(lines) + "\n"
+
+
+def main(argv=None):
+    """ Function that profiles a workload from the command line, prints the hotspots and the
+    memory allocated per call, and writes the collapsed stacks to a file if asked """
+    parser = argparse.ArgumentParser(description="Profile the poker functions.")
+    parser.add_argument("workload", choices=list(workloads), help="what to profile")
+    parser.add_argument("--inputs", type=int, default=20000, help="number of inputs to call with")
+    parser.add_argument("--seconds", type=float, default=1.0,
+                        help="call with the inputs again until this many seconds have passed")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the inputs")
+    parser.add_argument("--mode", choices=["sample", "trace"], default="sample",
+                        help="sample the stack every --interval seconds, or time every call")
+    parser.add_argument("--interval", type=float, default=0.001,
+                        help="seconds between samples (default 0.001)")
+    parser.add_argument("--flame", metavar="PATH",
+                        help="write the stacks to PATH in the collapsed format of flame graphs")
+    parser.add_argument("--limit", type=int, default=20, help="functions in the hotspot table")
+    parser.add_argument("--no-memory", action="store_true", help="skip measuring allocations")
+    args = parser.parse_args(argv)
+
+    result = profile_workload(args.workload, args.inputs, args.seed, args.mode, args.interval,
+                              not args.no_memory, args.limit, args.seconds)
+    print(f"{result['workload']}: {result['calls']:,} calls in {result['seconds']:.3f} s "
+          f"({args.mode})")
+    print(format_hotspots(result["hotspots"], "samples" if args.mode == "sample" else "us"),
+          end="")
+    if "memory" in result:
+        print(format_memory(result["memory"]), end="")
+    if args.flame:
+        with open(args.flame, "w") as file:
+            file.write(collapse_stacks(result["stacks"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
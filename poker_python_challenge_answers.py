@@ -1,22 +1,52 @@
 """ Random mod providing random functions to shuffle a list and select random items from a list,
-Counter mod to use for determining two pair hand"""
+Counter mod to use for determining two pair hand, itertools mod to list every combination of ranks
+when building the hand lookup tables, array, hashlib, mmap, os, struct and sys mods to save the
+lookup tables to a file and map them back into memory, threading mod to share a HandCache between
+threads, numpy to rank many hands at once"""
+import array
+import hashlib
+import mmap
+import os
 import random
-from collections import Counter
+import struct
+import sys
+import threading
+from collections import Counter, OrderedDict
+from itertools import combinations, combinations_with_replacement
+
+import numpy as np
 
 
 # Part 1: Poker Hands
+
+# Dictionary with the face cards and their numeric values, made once instead of on every call
+face_card_values = {'J': 11, 'Q': 12, 'K': 13, 'A': 14}
+
+# Suits in the order that Deck.build uses them, which is also the order of the integer cards
+suit_strings = ['h', 'd', 'c', 's']
+
+
 def convert_card_to_numeric(card):
     """ Function to convert card as string into card as a tuple with its rank as an int and its
-    suit as a string"""
+    suit as a string. Also accepts a card encoded as an integer (see encode_card), including a
+    numpy integer, or a Card"""
+
+    # Integer cards already hold the rank and suit, so no string work is needed, and Card objects
+    # worked it out when they were made
+    if type(card) is int:
+        return card % 13 + 2, suit_strings[card // 13]
+    if type(card) is Card:
+        return card.num_card
+    # Numpy integers, e.g. from a row of deal_cards_batch, become Python integers first
+    if isinstance(card, np.integer):
+        card = int(card)
+        return card % 13 + 2, suit_strings[card // 13]
 
     # Getting the rank of the card by getting everything but the last element in the string which
     # is the suit
     rank_str = card[:-1]
     suit = card[-1]
 
-    # Making a dictionary with the face cards and their numeric values
-    face_card_values = {'J': 11, 'Q': 12, 'K': 13, 'A': 14}
-
     # If the rank is a face card, getting the associated numeric value of it and saving it to a
     # new variable, rank_numeric
     if rank_str in face_card_values:
@@ -161,13 +191,11 @@ def sort_cards(cards):
     return sorted_cards
 
 
-def hand_ranking(cards):
-    """ Function that returns the hand as a string with input of a list of cards """
+def classify_sorted_hand(sorted_cards):
+    """ Function that returns the hand as a string with input of a list of sorted numeric cards by
+    running the boolean hand checks one after the other """
 
-    # First, sort cards
-    sorted_cards = sort_cards(cards)
-
-    # Next, call on boolean functions that determine if the sorted cards are a specific hand or not.
+    # Call on boolean functions that determine if the sorted cards are a specific hand or not.
     # Going in the order from the highest hand to the lowest so that the code exits out when the
     # highest hand is found--prevents something like royal flush called as a straight or a flush
     if is_royal_flush(sorted_cards):
@@ -200,41 +228,715 @@ def hand_ranking(cards):
     return "High Card"
 
 
+# Create dictionary that has the hands as the keys and their "score" as the values. Set these scores
+# from 1-10, with 10 being the best hand and 1 being the high card.
+score_hands = {"Royal Flush": 10, "Straight Flush": 9, "Four of a Kind": 8, "Full House": 7,
+               "Flush": 6, "Straight": 5,
+               "Three of a Kind": 4, "Two Pair": 3, "Pair": 2, "High Card": 1}
+
+# Reverse of score_hands so a score can be turned back into the name of the hand
+hand_names = {score: hand for hand, score in score_hands.items()}
+
+# Lookup tables: instead of sorting the cards and running the boolean checks for every hand,
+# every possible hand is classified once when the module is imported. Each card is packed into a
+# single integer that holds:
+#   bits 16-28: one bit for the rank (2 is bit 16, Ace is bit 28)
+#   bits 12-15: one bit for the suit
+#   bits 8-11:  the rank index from 0 (2) to 12 (Ace)
+#   bits 0-7:   a prime number for the rank
+# OR-ing the five cards gives the ranks in the hand, AND-ing them tells if all suits match, and
+# multiplying the primes gives a number that is unique to the ranks in the hand (including pairs)
+# no matter the order of the cards.
+rank_strings = ['2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A']
+rank_primes = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41]
+suit_bits = {'h': 1, 'd': 2, 'c': 4, 's': 8}
+
+
+def encode_card_bits(rank, suit):
+    """ Function that packs a numeric rank (2-14) and a suit string into one integer, the packed
+    form of the card that the lookup tables are built around """
+    rank_index = rank - 2
+    return ((1 << (16 + rank_index)) | (suit_bits[suit] << 12) | (rank_index << 8)
+            | rank_primes[rank_index])
+
+
+# Dictionary with every card string as the key and its packed integer as the value (Card objects
+# are added as keys too, see Card)
+card_bit_values = {rank_str + suit: encode_card_bits(rank, suit)
+                   for suit in suit_bits
+                   for rank, rank_str in enumerate(rank_strings, start=2)}
+
+# Cards can also be passed around as integers from 0 to 51, numbered in the same order that
+# Deck.build makes them (2h is 0, Ah is 12, 2d is 13, ..., As is 51). This saves turning strings
+# into numbers over and over: strings only need to be converted when cards are read or shown.
+# card_strings turns an integer card into its string and card_codes does the reverse
+card_strings = [rank_str + suit for suit in suit_strings for rank_str in rank_strings]
+card_codes = {card: code for code, card in enumerate(card_strings)}
+
+# Tuple with the packed integer (see encode_card_bits) of each integer card
+card_bits_by_code = tuple(card_bit_values[card] for card in card_strings)
+
+# List with every integer card, the encoded version of card_strings, and the same as a numpy array
+all_card_codes = list(range(52))
+all_card_codes_array = np.arange(52, dtype=np.uint8)
+
+
+def encode_card(card):
+    """ Function that converts a card string such as "10h" into an integer from 0 to 51 """
+    return card_codes[card]
+
+
+def decode_card(code):
+    """ Function that converts an integer card from 0 to 51 back into its string """
+    return card_strings[code]
+
+
+def encode_hand(cards):
+    """ Function that converts a list of card strings into a list of integer cards """
+    return [card_codes[card] for card in cards]
+
+
+def decode_hand(codes):
+    """ Function that converts a list of integer cards into a list of card strings """
+    return [card_strings[code] for code in codes]
+
+
+def card_code(card):
+    """ Function that returns the integer card (see encode_card) of a card given as a string, an
+    integer (a Python or numpy integer) or a Card """
+    if type(card) is int:
+        return card
+    if type(card) is Card:
+        return card.code
+    if isinstance(card, np.integer):
+        return int(card)
+    return card_codes[card]
+
+
+def pack_strength(score, ranks):
+    """ Function that returns one integer for a hand that is larger for a better hand, with input
+    of the hand's score (see score_hands) and the numeric ranks of its five cards """
+
+    # Straights are ordered by their highest card, and an Ace only counts as 1 in a 5-high
+    # straight (A, 2, 3, 4, 5)
+    if score in (score_hands["Straight"], score_hands["Straight Flush"],
+                 score_hands["Royal Flush"]):
+        ordered_ranks = sorted(ranks, reverse=True)
+        if ordered_ranks == [14, 5, 4, 3, 2]:
+            ordered_ranks = [5, 4, 3, 2, 1]
+    # Every other hand is ordered by how many times a rank shows up and then by the rank, e.g.
+    # a pair of Aces with K, 5, 3 is ordered as A, A, K, 5, 3
+    else:
+        rank_counts = Counter(ranks)
+        ordered_ranks = sorted(ranks, key=lambda rank: (rank_counts[rank], rank), reverse=True)
+
+    # The score takes the highest bits and each rank takes 4 bits after it, so comparing two of
+    # these integers compares the hands first by score and then by their kickers
+    strength = score
+    for rank in ordered_ranks:
+        strength = (strength << 4) | rank
+    return strength
+
+
+def build_lookup_tables():
+    """ Function that classifies every combination of five ranks with the boolean hand checks and
+    returns the three lookup tables used by hand_ranking, which hold the strength of each hand
+    (see pack_strength) """
+
+    # flush_lookup and unique_rank_lookup have one slot for every possible OR of the rank bits,
+    # prime_product_lookup holds the hands with at least two cards of the same rank
+    flush_lookup = [0] * (1 << 13)
+    unique_rank_lookup = [0] * (1 << 13)
+    prime_product_lookup = {}
+
+    # combinations_with_replacement gives each group of five ranks once, already sorted low to
+    # high, so they can be passed straight to the boolean hand checks
+    for ranks in combinations_with_replacement(range(2, 15), 5):
+        rank_counts = Counter(ranks)
+        # There are only four cards of each rank in a deck
+        if max(rank_counts.values()) > 4:
+            continue
+
+        if len(rank_counts) == 5:
+            # Five different ranks can be a flush or not, so classify both versions of the hand
+            rank_mask = sum(1 << (rank - 2) for rank in ranks)
+            flush_hand = [(rank, 'h') for rank in ranks]
+            mixed_hand = flush_hand[:-1] + [(ranks[-1], 'd')]
+            flush_lookup[rank_mask] = pack_strength(
+                score_hands[classify_sorted_hand(flush_hand)], ranks)
+            unique_rank_lookup[rank_mask] = pack_strength(
+                score_hands[classify_sorted_hand(mixed_hand)], ranks)
+        else:
+            # Hands with a repeated rank can never be a flush. Give each repeated rank a
+            # different suit and key the hand on the product of its primes
+            seen = Counter()
+            hand = []
+            product = 1
+            for rank in ranks:
+                hand.append((rank, 'hdcs'[seen[rank]]))
+                seen[rank] += 1
+                product *= rank_primes[rank - 2]
+            prime_product_lookup[product] = pack_strength(score_hands[classify_sorted_hand(hand)],
+                                                          ranks)
+
+    return flush_lookup, unique_rank_lookup, prime_product_lookup
+
+
+def lookup_hand(card1, card2, card3, card4, card5):
+    """ Function that returns the strength of a hand (see pack_strength) with input of five packed
+    cards """
+
+    # If every card shares the suit bit, the hand is a flush of five different ranks
+    rank_mask = (card1 | card2 | card3 | card4 | card5) >> 16
+    if card1 & card2 & card3 & card4 & card5 & 0xF000:
+        return flush_lookup[rank_mask]
+
+    # Five different ranks without a flush is either a straight or a high card
+    strength = unique_rank_lookup[rank_mask]
+    if strength:
+        return strength
+
+    # Otherwise there is a repeated rank, which the product of the primes identifies
+    return prime_product_lookup[(card1 & 0xFF) * (card2 & 0xFF) * (card3 & 0xFF) *
+                                (card4 & 0xFF) * (card5 & 0xFF)]
+
+
+def hand_ranking(cards):
+    """ Function that returns the hand as a string with input of a list of cards, either as strings
+    or as integers (see encode_card), which can be numpy integers such as a row of
+    deal_cards_batch """
+
+    # Look up the packed version of each of the five cards and then the hand in the lookup tables,
+    # which gives the same answer as sorting the cards and running the boolean checks
+    # (see classify_sorted_hand) without doing that work on every call. Integer cards are looked
+    # up by position in a list, which is faster than looking up strings in a dictionary. Numpy
+    # integers index the list too
+    card1, card2, card3, card4, card5 = cards
+    card_bits = (card_bits_by_code if type(card1) is int or isinstance(card1, np.integer)
+                 else card_bit_values)
+    strength = lookup_hand(card_bits[card1], card_bits[card2], card_bits[card3],
+                           card_bits[card4], card_bits[card5])
+    # The score of the hand is stored above the 20 bits used by the five kicker ranks
+    return hand_names[strength >> 20]
+
+
+def hand_strength(cards):
+    """ Function that returns the strength of the hand as an integer with input of a list of cards.
+    A better hand always has a larger strength, and two hands only have the same strength if they
+    tie, so kickers are accounted for (e.g. a pair of Aces beats a pair of 2s). Cards can be
+    strings or integers (see encode_card), including numpy integers """
+    card1, card2, card3, card4, card5 = cards
+    card_bits = (card_bits_by_code if type(card1) is int or isinstance(card1, np.integer)
+                 else card_bit_values)
+    return lookup_hand(card_bits[card1], card_bits[card2], card_bits[card3], card_bits[card4],
+                       card_bits[card5])
+
+
+# Best hand of 5-7 cards (e.g. the two hole cards and five board cards of Texas Hold'em). Instead
+# of ranking all 21 ways to pick 5 of 7 cards, two more lookup tables give the best 5 card hand
+# straight away. If five or more cards share a suit the best hand is always a flush or a straight
+# flush of that suit (the other two cards or less can not make a full house or four of a kind),
+# which only depends on the ranks in that suit. Otherwise the best hand only depends on the
+# ranks, which the product of their primes identifies as before.
+def build_best_hand_tables(flush_lookup, unique_rank_lookup, prime_product_lookup):
+    """ Function that returns the lookup tables used by best_hand_strength: the best flush for
+    every set of 5-7 ranks in one suit, and the best hand for every product of 5-7 rank primes
+    without a flush. The input is the three tables made by build_lookup_tables """
+
+    # Each table for 6 and 7 cards is filled from the one for a card less: the best hand of six
+    # cards is the best hand left after taking away one of the six, and so on
+    best_flush_lookup = list(flush_lookup)
+    for size in (6, 7):
+        for ranks in combinations(range(13), size):
+            rank_mask = sum(1 << rank for rank in ranks)
+            best_flush_lookup[rank_mask] = max(best_flush_lookup[rank_mask & ~(1 << rank)]
+                                               for rank in ranks)
+
+    best_rank_lookup = {}
+    for size in (5, 6, 7):
+        for ranks in combinations_with_replacement(range(13), size):
+            # There are only four cards of each rank in a deck. The ranks are sorted, so a rank
+            # shows up five times only if it is both at some position and four positions later
+            if any(ranks[index] == ranks[index + 4] for index in range(size - 4)):
+                continue
+            product = 1
+            for rank in ranks:
+                product *= rank_primes[rank]
+            if size > 5:
+                best_rank_lookup[product] = max(best_rank_lookup[product // rank_primes[rank]]
+                                                for rank in set(ranks))
+            elif len(set(ranks)) == 5:
+                best_rank_lookup[product] = unique_rank_lookup[sum(1 << rank for rank in ranks)]
+            else:
+                best_rank_lookup[product] = prime_product_lookup[product]
+
+    return best_flush_lookup, best_rank_lookup
+
+
+# Saved lookup tables: building the tables above takes a good part of a second, which adds up
+# when many short-lived worker processes import this module. save_lookup_tables writes them to a
+# binary file once, and on import they are mapped from that file into memory (with mmap) instead
+# of being built, so every process on the machine reads the same pages of the file. The file
+# starts with a header holding a name, a version number that changes whenever the tables change,
+# the byte order, the length of each table and a SHA-256 checksum of everything after the header.
+# If the file is missing or does not match, the tables are built like before
+table_file_name = b"PKRTABLE"
+table_file_version = 1
+table_header = struct.Struct("<8sIc3x7I32s4x")
+default_table_file = os.environ.get(
+    "POKER_TABLES_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "poker_tables.bin"))
+
+# The type of each table in the file: flush_lookup, unique_rank_lookup, the keys and the values of
+# prime_product_lookup, best_flush_lookup, and the keys and the values of best_rank_lookup. Keys
+# are products of up to 7 primes, which need 64 bits
+table_types = ["I", "I", "Q", "I", "I", "Q", "I"]
+
+
+def build_all_tables():
+    """ Function that builds and returns the five lookup tables (see build_lookup_tables and
+    build_best_hand_tables) """
+    tables = build_lookup_tables()
+    return tables + build_best_hand_tables(*tables)
+
+
+def save_lookup_tables(path=None, tables=None):
+    """ Function that writes the five lookup tables (by default the ones in use) to a file at
+    path (by default default_table_file) and returns the path """
+    if path is None:
+        path = default_table_file
+    if tables is None:
+        tables = (flush_lookup, unique_rank_lookup, prime_product_lookup, best_flush_lookup,
+                  best_rank_lookup)
+    flush, unique, products, best_flush, best_ranks = tables
+    columns = [flush, unique, sorted(products), [products[key] for key in sorted(products)],
+               best_flush, sorted(best_ranks), [best_ranks[key] for key in sorted(best_ranks)]]
+
+    # Every table starts on a multiple of 8 bytes so it can be read in place after mapping
+    payload = b""
+    for type_code, column in zip(table_types, columns):
+        data = array.array(type_code, column).tobytes()
+        payload += data + b"\0" * (-len(data) % 8)
+    header = table_header.pack(table_file_name, table_file_version, sys.byteorder[0].encode(),
+                               *[len(column) for column in columns],
+                               hashlib.sha256(payload).digest())
+
+    # Write to a temporary file first, so other processes never see a half written file
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(header + payload)
+    os.replace(temporary_path, path)
+    return path
+
+
+def load_lookup_tables(path=None):
+    """ Function that maps the lookup tables saved by save_lookup_tables into memory and returns
+    them. The flush and unique rank tables are read straight from the mapped file; the prime
+    product tables are turned back into dictionaries. Raises ValueError if the file was not made
+    by this version of the code or is damaged """
+    if path is None:
+        path = default_table_file
+    with open(path, "rb") as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(mapped) < table_header.size:
+        raise ValueError(f"{path} is too short to be a lookup table file")
+    name, version, byte_order, *lengths, checksum = table_header.unpack_from(mapped)
+    if name != table_file_name or version != table_file_version:
+        raise ValueError(f"{path} is not a version {table_file_version} lookup table file")
+    if byte_order != sys.byteorder[0].encode():
+        raise ValueError(f"{path} was saved on a machine with a different byte order")
+    payload = memoryview(mapped)[table_header.size:]
+    if hashlib.sha256(payload).digest() != checksum:
+        raise ValueError(f"{path} does not match its checksum")
+
+    columns = []
+    offset = 0
+    for type_code, length in zip(table_types, lengths):
+        size = length * array.array(type_code).itemsize
+        columns.append(payload[offset:offset + size].cast(type_code))
+        offset += size + (-size % 8)
+    flush, unique, product_keys, product_values, best_flush, rank_keys, rank_values = columns
+    return (flush, unique, dict(zip(product_keys, product_values)), best_flush,
+            dict(zip(rank_keys, rank_values)))
+
+
+def load_or_build_tables(path=None):
+    """ Function that returns the lookup tables from the file at path if it can be used, or
+    builds them otherwise """
+    try:
+        return load_lookup_tables(path)
+    except (OSError, ValueError):
+        # Lists are turned into tuples so the tables can not be changed by mistake, the same as
+        # the read only memory the loaded tables are mapped from
+        return tuple(tuple(table) if isinstance(table, list) else table
+                     for table in build_all_tables())
+
+
+# Thread safety: the lookup tables and every other table at module level are made once when the
+# module is imported and only read after that. hand_ranking, hand_strength, best_hand_strength,
+# hand_ranking_batch and winner_is keep everything else in local variables, so any number of
+# threads can call them at the same time without locks, also on Python builds without the GIL.
+# Dealing is different: a Deck's list of cards and its random number generator change on every
+# deal, so each thread needs its own deck (see poker_threads.thread_deck)
+(flush_lookup, unique_rank_lookup, prime_product_lookup, best_flush_lookup,
+ best_rank_lookup) = load_or_build_tables()
+
+# For each integer card: its rank prime, its rank bit shifted into a 13 bit block for its suit,
+# and a 1 in a 4 bit counter for its suit. Adding the counters of up to 7 cards counts the cards
+# of each suit, and adding 3 to each counter sets its top bit only if the count is 5 or more
+card_primes_by_code = tuple(rank_primes[code % 13] for code in range(52))
+card_suit_ranks_by_code = tuple(1 << code for code in range(52))
+card_suit_counters_by_code = tuple(1 << (4 * (code // 13)) for code in range(52))
+
+
+def best_hand_strength(cards):
+    """ Function that returns the strength (see hand_strength) of the best 5 card hand that can be
+    made from a list of 5-7 cards, as strings or integers (see encode_card). A numpy array of
+    integer cards, such as a row of deal_cards_batch, works too """
+    if type(cards[0]) is str:
+        cards = [card_codes[card] for card in cards]
+    elif type(cards[0]) is not int:
+        cards = [card_code(card) for card in cards]
+
+    primes = card_primes_by_code
+    suit_counters = card_suit_counters_by_code
+    product = 1
+    suit_counts = 0
+    for code in cards:
+        product *= primes[code]
+        suit_counts += suit_counters[code]
+
+    flushes = (suit_counts + 0x3333) & 0x8888
+    if not flushes:
+        return best_rank_lookup[product]
+
+    # Only one suit can have 5 of 7 cards. Its counter's top bit is bit 3, 7, 11 or 15, and its
+    # ranks are the 13 bit block for that suit
+    suit = flushes.bit_length() // 4 - 1
+    suit_ranks = 0
+    for code in cards:
+        suit_ranks |= card_suit_ranks_by_code[code]
+    return best_flush_lookup[(suit_ranks >> (13 * suit)) & 0x1FFF]
+
+
+def best_hand_ranking(cards):
+    """ Function that returns the best 5 card hand that can be made from a list of 5-7 cards as a
+    string (see hand_ranking) """
+    return hand_names[best_hand_strength(cards) >> 20]
+
+
+def canonical_hand_key(cards):
+    """ Function that returns an integer that is the same for two lists of cards (strings or
+    integers) exactly when one can be turned into the other by reordering the cards and renaming
+    the suits, e.g. ["Ah", "Kh", "2d"] and ["Ks", "2c", "As"]. Such hands always have the same
+    strength, so they can share one cache entry (see HandCache). Numpy integers work too """
+    if type(cards[0]) is str:
+        cards = [card_codes[card] for card in cards]
+    elif type(cards[0]) is not int:
+        cards = [card_code(card) for card in cards]
+
+    # Put each card's rank bit in the 13 bit block of its suit. Renaming suits only swaps the
+    # blocks around, so sorting the four blocks gives the same result for all such hands
+    suit_ranks = 0
+    for code in cards:
+        suit_ranks |= card_suit_ranks_by_code[code]
+    blocks = sorted((suit_ranks & 0x1FFF, (suit_ranks >> 13) & 0x1FFF,
+                     (suit_ranks >> 26) & 0x1FFF, suit_ranks >> 39))
+    return (((blocks[0] << 13 | blocks[1]) << 13) | blocks[2]) << 13 | blocks[3]
+
+
+# Batch evaluation: ranking a whole array of integer hands with numpy instead of one hand at a
+# time. Each card in a hand is compared with the other four to count how many cards share its
+# rank. Adding those counts up gives a different number for each kind of hand where ranks repeat
+# (every card counts itself, so five different ranks add up to 5, one pair to 2 + 2 + 1 + 1 + 1 = 7,
+# and so on), which is turned into the hand's score with batch_pattern_scores
+batch_pattern_scores = np.zeros(18, dtype=np.int32)
+batch_pattern_scores[7] = score_hands["Pair"]
+batch_pattern_scores[9] = score_hands["Two Pair"]
+batch_pattern_scores[11] = score_hands["Three of a Kind"]
+batch_pattern_scores[13] = score_hands["Full House"]
+batch_pattern_scores[17] = score_hands["Four of a Kind"]
+
+# Rank masks (one bit per rank, 2 is bit 0) of the ten straights, from 5-high to Ace-high
+wheel_mask = 0b1000000001111
+royal_mask = 0b1111100000000
+straight_masks = [wheel_mask] + [0b11111 << low for low in range(9)]
+batch_is_straight = np.zeros(1 << 13, dtype=bool)
+batch_is_straight[straight_masks] = True
+
+# The prime of each rank (see rank_primes), for multiplying the ranks of many hands at once
+batch_rank_primes = np.array(rank_primes, dtype=np.int64)
+
+
+# Pairs of positions to compare and swap that sort any five values from low to high
+sorting_network = [(0, 1), (3, 4), (2, 4), (2, 3), (1, 4), (0, 3), (0, 2), (1, 3), (1, 2)]
+
+
+def check_card_range(hands, first_row=0):
+    """ Function that raises ValueError if a hand in a 2D array of integer cards, one hand per row,
+    holds a number that is not a card (0 to 51). first_row is the number of the first hand, used
+    in error messages """
+    if hands.size and (hands.min() < 0 or hands.max() > 51):
+        row = np.flatnonzero(((hands < 0) | (hands > 51)).any(axis=1))[0]
+        raise ValueError(f"hand {first_row + row} holds a number that is not a card (0 to 51): "
+                         f"{hands[row].tolist()}")
+
+
+def check_card_columns(columns, first_row=0):
+    """ Function that raises ValueError if a hand holds the same card more than once, with input
+    of one array per card position (see rank_batch_chunk). first_row is the number of the first
+    hand, used in error messages """
+
+    # Comparing the positions two at a time is cheaper than sorting every hand
+    repeated = np.zeros(columns.shape[1], dtype=bool)
+    for first, second in combinations(range(5), 2):
+        repeated |= columns[first] == columns[second]
+    if repeated.any():
+        row = np.flatnonzero(repeated)[0]
+        raise ValueError(f"hand {first_row + row} holds the same card more than once: "
+                         f"{columns[:, row].tolist()}")
+
+
+def rank_batch_chunk(hands, first_row=0):
+    """ Function that returns the strength (see pack_strength) of every hand in a 2D array of
+    integer cards with one hand of five cards per row. Raises ValueError if a hand holds a number
+    that is not a card or a card twice (see check_card_range and check_card_columns); first_row is
+    the number of the array's first hand, used in the error """
+
+    # The range is checked before the cards are narrowed to int16, where a number such as 65541
+    # would wrap around to a card
+    check_card_range(hands, first_row)
+
+    # Work on one array per card position instead of on the rows: numpy is much faster at adding
+    # up five long arrays than at adding up millions of rows of five. Small integer types keep
+    # the arrays (and the time spent going through them) small, and order="C" lays each array out
+    # in one block (astype would otherwise keep the transposed layout, every value 5 apart)
+    columns = hands.T.astype(np.int16, order="C")
+    # A card held twice would be ranked as a pair, or count a rank more than four times, which
+    # batch_pattern_scores has no score for
+    check_card_columns(columns, first_row)
+    ranks = [column % 13 for column in columns]
+    suits = [column // 13 for column in columns]
+
+    # For every card, count the cards in the hand with the same rank (including itself)
+    rank_counts = [sum((rank == other).view(np.int8) for other in ranks) for rank in ranks]
+    scores = batch_pattern_scores[sum(rank_counts)]
+
+    # Hands with five different ranks are a flush, a straight, both, or a high card
+    rank_masks = ((1 << ranks[0]) | (1 << ranks[1]) | (1 << ranks[2]) | (1 << ranks[3])
+                  | (1 << ranks[4]))
+    flushes = ((suits[0] == suits[1]) & (suits[0] == suits[2]) & (suits[0] == suits[3])
+               & (suits[0] == suits[4]))
+    straights = batch_is_straight[rank_masks]
+    straight_flush = np.where(rank_masks == royal_mask, score_hands["Royal Flush"],
+                              score_hands["Straight Flush"])
+    unique_scores = np.where(flushes, np.where(straights, straight_flush, score_hands["Flush"]),
+                             np.where(straights, score_hands["Straight"],
+                                      score_hands["High Card"]))
+    scores = np.where(scores == 0, unique_scores, scores)
+
+    # Order the cards by how many times their rank shows up and then by rank (the same order as
+    # pack_strength), then pack the ranks 4 bits each below the score
+    order_keys = [count * 16 + rank + 2 for count, rank in zip(rank_counts, ranks)]
+    for low, high in sorting_network:
+        order_keys[low], order_keys[high] = (np.minimum(order_keys[low], order_keys[high]),
+                                             np.maximum(order_keys[low], order_keys[high]))
+    strengths = scores.astype(np.int32)
+    for key in reversed(order_keys):
+        strengths = (strengths << 4) | (key & 15)
+
+    # The Ace counts as 1 in a 5-high straight
+    wheels = straights & (rank_masks == wheel_mask)
+    strengths[wheels] = (strengths[wheels] & ~0xFFFFF) | 0x54321
+    return strengths
+
+
+def hand_ranking_batch(hands, strength=False, chunk_size=1 << 16):
+    """ Function that returns an array with the score (see score_hands) of every hand, with input
+    of an array of shape (number of hands, 5) holding integer cards (see encode_card), five
+    different cards from 0 to 51 per row (see check_card_range and check_card_columns). If
+    strength is True, the strength of each hand (see hand_strength) is returned instead. The hands
+    are ranked chunk_size at a time so the memory used stays small for large arrays. Raises
+    ValueError for hands of the wrong shape, of a type that is not integers, or with cards that
+    are not cards or are held twice """
+    hands = np.asarray(hands)
+    if hands.ndim != 2 or hands.shape[1] != 5:
+        raise ValueError(f"hands must have shape (number of hands, 5), not {hands.shape}")
+    # Floats would be cut down to integers, so 0.5 would be ranked as the card 0
+    if not np.issubdtype(hands.dtype, np.integer):
+        raise ValueError(f"hands must hold integer cards, not {hands.dtype}")
+
+    results = np.empty(len(hands), dtype=np.int32)
+    for start in range(0, len(hands), chunk_size):
+        results[start:start + chunk_size] = rank_batch_chunk(hands[start:start + chunk_size],
+                                                             start)
+
+    # The score of each hand is stored above the 20 bits used by the five kicker ranks
+    if not strength:
+        results >>= 20
+    return results
+
+
+# best_flush_lookup as a numpy array, made once on import since it only has 8192 entries, so
+# best_hand_strength_batch does not turn the list into an array on every call
+best_flush_array = np.array(best_flush_lookup, dtype=np.int32)
+
+# best_rank_lookup as two numpy arrays, its sorted keys and their values, so many prime products
+# can be looked up at once with a binary search. Made the first time best_hand_strength_batch is
+# called rather than on import; two threads that both make them get the same arrays
+best_rank_arrays = None
+
+
+def best_hand_strength_batch(hands):
+    """ Function that returns an array with the strength (see best_hand_strength) of the best 5
+    card hand in every row of an array of shape (number of hands, 5 to 7) holding integer cards.
+    A row that holds the same card twice gets a strength that means nothing, but no error, so
+    such rows can be ranked with the others and thrown away after """
+    global best_rank_arrays
+    hands = np.asarray(hands)
+    if hands.ndim != 2 or not 5 <= hands.shape[1] <= 7:
+        raise ValueError(f"hands must have shape (number of hands, 5 to 7), not {hands.shape}")
+    if best_rank_arrays is None:
+        keys = np.fromiter(best_rank_lookup.keys(), np.int64, len(best_rank_lookup))
+        values = np.fromiter(best_rank_lookup.values(), np.int32, len(best_rank_lookup))
+        order = keys.argsort()
+        best_rank_arrays = keys[order], values[order]
+    rank_keys, rank_values = best_rank_arrays
+
+    # The same steps as best_hand_strength, one card position at a time
+    columns = hands.T.astype(np.int64)
+    ranks = columns % 13
+    suits = columns // 13
+    products = batch_rank_primes[ranks].prod(axis=0)
+    places = np.minimum(np.searchsorted(rank_keys, products), len(rank_keys) - 1)
+    strengths = rank_values[places]
+
+    # Only one suit can have 5 of 7 cards; its rank mask gives the best flush or straight flush
+    suit_counts = (suits[:, :, None] == np.arange(4)).sum(axis=0)
+    flushes = suit_counts.max(axis=1) >= 5
+    if flushes.any():
+        flush_suits = suit_counts.argmax(axis=1)
+        rank_masks = np.bitwise_or.reduce((suits == flush_suits) << ranks, axis=0)
+        strengths[flushes] = best_flush_array[rank_masks[flushes]]
+    return strengths
+
+
 # Part 2: Deal Cards and Determine Winner
 
 
-def deal_cards(player_list):
-    """ Function that deals a list of players 5 cards each and stores output in dictionary"""
+def deal_cards(player_list, encoded=False, deck=None, rng=None):
+    """ Function that deals a list of players 5 cards each and stores output in dictionary. If
+    encoded is True, the cards are dealt as integers (see encode_card) instead of strings. A deck
+    can be passed in to be reused between calls: it is reset to a full deck before dealing, and
+    its encoded setting is used instead of encoded. rng is the random number generator to deal
+    with (see Deck), by default the deck's own"""
 
     # Creating a dictionary of players that will hold their names as keys and cards as a value
     players = {}
-    deck = Deck()
-    deck.build()
+    if deck is None:
+        deck = Deck(encoded, rng)
+        deck.build()
+    else:
+        deck.reset()
 
-    # For each player in the list given, will give random 5 cards, and then remove those cards
-    # from the overall deck so they are not repeated in another player's cards. Then saving the
-    # player name as the key and their cards as the associated value
+    # For each player in the list given, will give random 5 cards, which are removed from the
+    # deck so they are not repeated in another player's cards. Then saving the player name as
+    # the key and their cards as the associated value
     for player in player_list:
-        player_cards = random.sample(deck.cards, k=5)
-        for card in player_cards:
-            deck.cards.remove(card)
-        players[player] = player_cards
+        players[player] = deck.deal_random(5, rng)
 
     # Returning the dictionary of players and their cards
     return players
 
 
-# Create dictionary that has the hands as the keys and their "score" as the values. Set these scores
-# from 1-10, with 10 being the best hand and 1 being the high card.
-score_hands = {"Royal Flush": 10, "Straight Flush": 9, "Four of a Kind": 8, "Full House": 7,
-               "Flush": 6, "Straight": 5,
-               "Three of a Kind": 4, "Two Pair": 3, "Pair": 2, "High Card": 1}
-
-
-def winner_is(players):
-    """Function that returns list of strings with input of dictionary of players and their hands"""
+def shuffle_batch(num_decks, rng=None, cards=None):
+    """ Function that returns a numpy array with num_decks independent shuffles of a deck, one per
+    row. cards is the deck to shuffle (by default the 52 integer cards) and rng is a numpy
+    Generator or a seed for one """
+    rng = np.random.default_rng(rng)
+    cards = all_card_codes_array if cards is None else np.asarray(cards)
+
+    # Sorting each row of a matrix of random numbers gives a random order of the positions in
+    # that row, so one sort shuffles every deck at the same time
+    order = rng.random((num_decks, len(cards))).argsort(axis=1)
+    return cards[order]
+
+
+def deal_cards_batch(num_deals, num_players, hand_size=5, rng=None):
+    """ Function that deals num_deals deals at once and returns them as a numpy array of integer
+    cards with shape (num_deals, num_players, hand_size). rng is a numpy Generator or a seed """
+    if num_players * hand_size > 52:
+        raise ValueError(f"a deck can not deal {hand_size} cards to {num_players} players")
+
+    # Each player gets the next hand_size cards off the top of each shuffled deck
+    decks = shuffle_batch(num_deals, rng)
+    return decks[:, :num_players * hand_size].reshape(num_deals, num_players, hand_size)
+
+
+def iter_deals(num_players, hand_size=5, batch_size=10000, num_deals=None, rng=None, cards=None):
+    """ Generator that deals batches of deals for as long as it is asked, or until num_deals deals
+    have been dealt. Each batch is an array of integer cards with shape (deals in the batch,
+    num_players, hand_size), at most batch_size deals. rng is a numpy Generator or a seed, and
+    cards the deck to deal from (by default the 52 integer cards).
+
+    The batches are views of one array that is made once and dealt into again for every batch,
+    so memory stays the same however many deals are taken, and a batch has to be copied to be
+    kept after asking for the next one. Sending a number into the generator (see generator.send)
+    makes the next batch that many deals, up to batch_size, so a slow consumer can take less """
+    rng = np.random.default_rng(rng)
+    cards = all_card_codes_array if cards is None else np.asarray(cards)
+    num_cards = len(cards)
+    dealt = num_players * hand_size
+    if dealt > num_cards:
+        raise ValueError(f"a deck can not deal {hand_size} cards to {num_players} players")
+
+    # One deck per row. Every batch deals the top cards of each deck by swapping a random card
+    # from further down into each position dealt (the first steps of a Fisher-Yates shuffle).
+    # A deck shuffled in any order is as good a start as a new one, so the decks are never reset
+    decks = np.tile(cards, (batch_size, 1))
+    flat_decks = decks.reshape(-1)
+    row_starts = np.arange(batch_size, dtype=np.intp) * num_cards
+    draws = np.empty(batch_size)
+    picks = np.empty(batch_size, dtype=np.intp)
+    picked = np.empty(batch_size, dtype=decks.dtype)
+
+    remaining = num_deals
+    size = batch_size
+    while remaining is None or remaining > 0:
+        if remaining is not None:
+            size = min(size, remaining)
+        for position in range(dealt):
+            # A random card from this position to the bottom of each deck, as an index into the
+            # flat array of decks
+            rng.random(out=draws[:size])
+            np.multiply(draws[:size], num_cards - position, out=draws[:size])
+            picks[:size] = draws[:size]
+            np.minimum(picks[:size], num_cards - position - 1, out=picks[:size])
+            picks[:size] += row_starts[:size]
+            picks[:size] += position
+            np.take(flat_decks, picks[:size], out=picked[:size])
+            flat_decks[picks[:size]] = decks[:size, position]
+            decks[:size, position] = picked[:size]
+
+        if remaining is not None:
+            remaining -= size
+        requested = yield decks[:size, :dealt].reshape(size, num_players, hand_size)
+        size = batch_size if requested is None else max(1, min(int(requested), batch_size))
+
+
+def winner_is(players, category_only=False):
+    """Function that returns list of strings with input of dictionary of players and their hands.
+    Ties are broken by the kickers (see hand_strength) unless category_only is True, in which case
+    every player with the best kind of hand wins, e.g. a pair of Aces ties a pair of 2s"""
 
     # Output is list of strings so winner can include multiple players that have the same hand
+    if not category_only:
+        # Each player's strength already includes the kickers, so the winners are simply the
+        # players with the largest strength
+        strengths = {player: hand_strength(hand) for player, hand in players.items()}
+        max_strength = max(strengths.values())
+        return [player for player, strength in strengths.items() if strength == max_strength]
 
     # Create an empty dictionary called scores that will have the players as the keys and their
     # scores as the values
@@ -260,18 +962,80 @@ def winner_is(players):
     return winning_players
 
 
+def winners_batch(deals, category_only=False):
+    """ Function that returns the winners of many tables at once, with input of an array of shape
+    (number of tables, number of players, 5) holding integer cards, e.g. from deal_cards_batch.
+    The output is a boolean array of shape (number of tables, number of players) that is True for
+    every player who wins their table, so ties have more than one True in a row. Winners are the
+    same as winner_is would give for each table, including category_only """
+    deals = np.asarray(deals)
+    if deals.ndim != 3 or deals.shape[2] != 5:
+        raise ValueError(f"deals must have shape (number of tables, number of players, 5), not "
+                         f"{deals.shape}")
+
+    # Rank every hand of every table in one go and then compare the players at each table with
+    # the best strength at that table
+    num_tables, num_players, _ = deals.shape
+    strengths = hand_ranking_batch(deals.reshape(-1, 5), strength=not category_only)
+    strengths = strengths.reshape(num_tables, num_players)
+    return strengths == strengths.max(axis=1, keepdims=True)
+
+
 # Part 3: OOP
 class Card:
-    """ Class representing a card """
-
-    def __init__(self, suit, val):
-        """ Initialize the card with its suit and value"""
-        self.suit = suit
-        self.val = val
-        self.card = val + suit
-        # Create tuple that represents the numeric value of the card by converting its rank to an
-        # integer and separating out the suit as string
-        self.num_card = ()
+    """ Class representing a card. Cards can not be changed once made, and each of the 52 cards is
+    only made once: Card("h", "10") always returns the same object, so decks and hands that hold
+    millions of cards only hold references to those 52 objects. __slots__ leaves out the
+    dictionary each object would otherwise carry """
+    __slots__ = ("suit", "val", "card", "num_card", "code", "bits")
+
+    # Dictionary with (suit, value) as the key and the one Card object for that card as the value
+    interned = {}
+
+    def __new__(cls, suit, val):
+        """ Return the card with suit and value, making it the first time it is asked for. Raises
+        ValueError if suit and value are not a card """
+        card = cls.interned.get((suit, val))
+        if card is not None:
+            return card
+        if val + suit not in card_codes:
+            raise ValueError(f"{val + suit!r} is not a card")
+
+        # Everything about the card is worked out once here, instead of on every use. Attributes
+        # are set through object because the class does not allow setting them (see __setattr__)
+        card = super().__new__(cls)
+        object.__setattr__(card, "suit", suit)
+        object.__setattr__(card, "val", val)
+        object.__setattr__(card, "card", val + suit)
+        # Tuple that represents the numeric value of the card: its rank as an integer and its suit
+        # as a string, as made by convert_card_to_numeric
+        object.__setattr__(card, "num_card", convert_card_to_numeric(val + suit))
+        # The integer card (see encode_card) and the packed card (see encode_card_bits)
+        object.__setattr__(card, "code", card_codes[val + suit])
+        object.__setattr__(card, "bits", card_bit_values[val + suit])
+        cls.interned[(suit, val)] = card
+        return card
+
+    def __setattr__(self, name, value):
+        """ Cards can not be changed """
+        raise AttributeError("Card objects can not be changed")
+
+    def __delattr__(self, name):
+        """ Cards can not be changed """
+        raise AttributeError("Card objects can not be changed")
+
+    def __reduce__(self):
+        """ Pickle a card as the arguments to make it, so unpickling gives the shared card (e.g.
+        when cards are sent to worker processes) """
+        return Card, (self.suit, self.val)
+
+    def __repr__(self):
+        """ Return the code to make the card, e.g. Card('h', '10') """
+        return f"Card({self.suit!r}, {self.val!r})"
+
+    def __str__(self):
+        """ Return the card as a string, e.g. 10h """
+        return self.card
 
     def show(self):
         """ Function that returns the variable card that holds the value and the suit inputted
@@ -279,33 +1043,34 @@ class Card:
         return self.card
 
     def convert_card(self):
-        """ Function that converts card to numeric version as a tuple """
-        rank_str = self.val
-        suit = self.suit
-
-        # Making a dictionary with the face cards and their numeric values
-        face_card_values = {'J': 11, 'Q': 12, 'K': 13, 'A': 14}
-
-        # If the rank is a face card, getting the associated numeric value of it and saving it to
-        # a new variable, rank_numeric
-        if rank_str in face_card_values:
-            rank_numeric = face_card_values[rank_str]
-        # Otherwise, converting the string rank into a numeric value
-        else:
-            rank_numeric = int(rank_str)
-
-        self.num_card = (rank_numeric, suit)
-        # Returning the card as a tuple of the integer rank and the string suit
+        """ Function that returns the numeric version of the card as a tuple of the integer rank and
+        the string suit, worked out when the card was made """
         return self.num_card
 
 
+# List with the Card object of every integer card, in the order Deck.build makes them
+card_objects = [Card(card[-1], card[:-1]) for card in card_strings]
+
+# Card objects are looked up in the same dictionary as card strings by hand_ranking and
+# hand_strength. Each card only exists once, so it is found by the object itself
+card_bit_values.update({card: card.bits for card in card_objects})
+
+
 class Deck:
     """ Class representing a deck """
 
-    def __init__(self):
-        """ Initialize deck """
+    def __init__(self, encoded=False, rng=None, card_objects=False):
+        """ Initialize deck. If encoded is True, build() makes the cards as integers from 0 to 51
+        (see encode_card) instead of strings, and if card_objects is True it uses the shared Card
+        objects. rng is the random number generator used to shuffle and deal: a random.Random or
+        numpy Generator object, or None to use the random mod """
         # Create empty list of cards that represents the deck. Populate this list with build()
         self.cards = []
+        self.encoded = encoded
+        self.card_objects = card_objects
+        # Giving each deck its own seeded generator makes its shuffles and deals repeatable and
+        # keeps decks in different simulations from sharing the random mod's hidden state
+        self.rng = random if rng is None else rng
 
     def show(self):
         """ Function to show the cards by returning list of cards"""
@@ -314,40 +1079,30 @@ class Deck:
     def build(self):
         """ Function that builds deck of 52 cards"""
 
-        # Build this deck of cards by looping 4 times (once for each of the four suits) and
-        # create 13 separate cards from 2-14 that correspond with the ranks. Account for the
-        # face cards by making them 11-14.
-        for suit in range(4):
-            for num in range(2, 15):
-                if num == 11:
-                    num = "J"
-                if num == 12:
-                    num = "Q"
-                if num == 13:
-                    num = "K"
-                if num == 14:
-                    num = "A"
-
-                if suit == 0:
-                    card = str(num) + "h"
-                    self.cards.append(card)
-                if suit == 1:
-                    card = str(num) + "d"
-                    self.cards.append(card)
-                if suit == 2:
-                    card = str(num) + "c"
-                    self.cards.append(card)
-                if suit == 3:
-                    card = str(num) + "s"
-                    self.cards.append(card)
+        # The deck has the 13 cards from 2 to Ace of each of the four suits. They are made once
+        # when the module is imported (see card_strings) and copied in here. Integer cards are
+        # numbered in this same order, so they are just the numbers 0-51
+        self.cards.extend(self.full_deck())
+
+    def full_deck(self):
+        """ Function that returns the list of all 52 cards in the order build() adds them """
+        if self.card_objects:
+            return card_objects
+        return all_card_codes if self.encoded else card_strings
+
+    def reset(self):
+        """ Function that puts every card back in the deck, in the order build() makes them. The
+        cards are copied into the existing list instead of making a new one """
+        self.cards[:] = self.full_deck()
 
     def shuffle(self, num=1):
         """ Function that shuffles the list of cards in deck num amount of times """
 
-        # Shuffle the cards in the deck by using the random.shuffle function, and looping
-        # through a range of num to reflect the number of times the user wants to shuffle
+        # Shuffle the cards in the deck by using the shuffle function of the deck's random number
+        # generator, and looping through a range of num to reflect the number of times the user
+        # wants to shuffle
         for _ in range(num):
-            random.shuffle(self.cards)
+            self.rng.shuffle(self.cards)
         return self.cards
 
     def deal(self):
@@ -357,6 +1112,27 @@ class Deck:
         # cards is shuffled) and remove that card from the deck by removing it from the list
         return self.cards.pop()
 
+    def deal_random(self, num=1, rng=None):
+        """ Function that deals num random cards from the deck and returns them in a list. The
+        deck's random number generator is used unless another one is given with rng """
+
+        # Partial Fisher-Yates shuffle: pick a random position and swap that card with the last
+        # card that has not been dealt yet. Unlike random.sample followed by list.remove, which
+        # searches the list for every card, each card takes the same short time no matter how big
+        # the deck is. The dealt cards end up at the end of the list and are cut off in one go
+        cards = self.cards
+        size = len(cards)
+        if num > size:
+            raise ValueError(f"can not deal {num} cards from a deck of {size}")
+        rand = (self.rng if rng is None else rng).random
+        for _ in range(num):
+            index = int(rand() * size)
+            size -= 1
+            cards[index], cards[size] = cards[size], cards[index]
+        dealt = cards[size:]
+        del cards[size:]
+        return dealt
+
 
 class Player:
     """ Class representing a player"""
@@ -366,6 +1142,9 @@ class Player:
         self.name = name
         # Create empty list that will hold the player's cards
         self.player_cards = []
+        # Counts of the player's cards kept up to date as cards come and go, so the hand can be
+        # ranked at any time without going through every card again (see HandState)
+        self.hand_state = HandState()
 
     def say_hello(self):
         """ Function that returns a hello statement with player name """
@@ -373,23 +1152,257 @@ class Player:
         # Use an f string to say hello and the player's name when the function is called
         return f"Hi, I'm {self.name}!"
 
-    def draw(self, deck, num=1):
-        """ Function that populates a player's cards with a num amount of cards from the deck """
+    def draw(self, deck, num=1, rng=None, keep=False):
+        """ Function that populates a player's cards with a num amount of cards from the deck. The
+        deck's random number generator is used unless another one is given with rng. If keep is
+        True the cards are added to the cards the player already has, as in draw and stud games.
+        Raises ValueError if the cards drawn hold a card twice or a card the player already has
+        (e.g. from a deck built twice), leaving the player's cards as they were """
 
         # If number of cards in the deck are greater or equal to the number of cards to draw,
         # then it is possible to draw the cards and return True.
         if len(deck.cards) >= num:
-            # Use random.sample to select random num of cards in the deck
-            self.player_cards = random.sample(deck.cards, k=num)
-            # Loop through the player's cards and remove each one from the deck so there are no
-            # repeats.
-            for card in self.player_cards:
-                deck.cards.remove(card)
+            # Deal num random cards from the deck, which also removes them from the deck so there
+            # are no repeats.
+            cards = deck.deal_random(num, rng)
+            # The hand state checks the cards before anything is changed, so player_cards and
+            # hand_state always hold the same cards
+            if keep:
+                self.hand_state.extend(cards)
+                self.player_cards.extend(cards)
+            else:
+                self.hand_state.sync(cards)
+                self.player_cards = cards
             return True
         # If the number of cards to draw is greater than the number of cards remaining in the deck,
         # the function will return False
         return False
 
+    def discard(self, cards):
+        """ Function that removes a list of cards from the player's cards """
+        for card in cards:
+            self.player_cards.remove(card)
+            self.hand_state.remove(card)
+
     def show_hand(self):
         """ Function that returns the list of the player cards and show their hand"""
         return self.player_cards
+
+
+class HandState:
+    """ Class representing a hand that cards are added to and removed from one at a time, keeping
+    what is needed to rank it up to date: the count of each rank, how many ranks show up once,
+    twice, three or four times, the mask of ranks held (which shows straights and straight draws,
+    see has_straight and straight_outs), the product of the rank primes and the cards of each suit
+    (see best_hand_strength). Adding or removing a card only changes those numbers, and ranking
+    the hand reads them without going through the cards. Cards can be strings, integers (see
+    encode_card) or Card objects """
+
+    def __init__(self, cards=()):
+        """ Initialize the state with a list of cards, empty by default """
+        # Dictionary with the integer card as the key and the card as it was added as the value,
+        # in the order the cards were added
+        self.held = {}
+        self.rank_counts = [0] * 13
+        # count_of_counts[num] is the number of ranks held exactly num times
+        self.count_of_counts = [13, 0, 0, 0, 0]
+        self.rank_mask = 0
+        self.product = 1
+        self.suit_counts = 0
+        self.suit_ranks = 0
+        for card in cards:
+            self.add(card)
+
+    def __len__(self):
+        """ Return the number of cards held """
+        return len(self.held)
+
+    @property
+    def cards(self):
+        """ The list of cards held, in the order they were added """
+        return list(self.held.values())
+
+    def add(self, card):
+        """ Function that adds a card. Raises ValueError if the card is already held """
+        code = card_code(card)
+        if code in self.held:
+            raise ValueError(f"{card} is already in the hand")
+        rank = code % 13
+        count = self.rank_counts[rank]
+        self.rank_counts[rank] = count + 1
+        self.count_of_counts[count] -= 1
+        self.count_of_counts[count + 1] += 1
+        self.rank_mask |= 1 << rank
+        self.product *= card_primes_by_code[code]
+        self.suit_counts += card_suit_counters_by_code[code]
+        self.suit_ranks |= card_suit_ranks_by_code[code]
+        self.held[code] = card
+
+    def remove(self, card):
+        """ Function that removes a card. Raises ValueError if the card is not held """
+        code = card_code(card)
+        if code not in self.held:
+            raise ValueError(f"{card} is not in the hand")
+        rank = code % 13
+        count = self.rank_counts[rank]
+        self.rank_counts[rank] = count - 1
+        self.count_of_counts[count] -= 1
+        self.count_of_counts[count - 1] += 1
+        if count == 1:
+            self.rank_mask &= ~(1 << rank)
+        self.product //= card_primes_by_code[code]
+        self.suit_counts -= card_suit_counters_by_code[code]
+        self.suit_ranks &= ~card_suit_ranks_by_code[code]
+        # The cards are kept by their integer, so a card added as a string can be removed as an
+        # integer or a Card
+        del self.held[code]
+
+    def extend(self, cards):
+        """ Function that adds a list of cards. Raises ValueError, without adding any of them, if
+        a card is in the list twice or already held """
+        codes = [card_code(card) for card in cards]
+        if len(set(codes)) != len(codes) or not self.held.keys().isdisjoint(codes):
+            raise ValueError(f"{cards} holds a card twice or a card already in the hand")
+        for card in cards:
+            self.add(card)
+
+    def sync(self, cards):
+        """ Function that changes the state to hold a new list of cards, only adding and removing
+        the cards that are different. Raises ValueError, without changing the state, if a card is
+        in the list twice """
+        codes = {card_code(card) for card in cards}
+        if len(codes) != len(cards):
+            raise ValueError(f"{cards} holds a card twice")
+        for code in [code for code in self.held if code not in codes]:
+            self.remove(code)
+        for card in cards:
+            if card_code(card) not in self.held:
+                self.add(card)
+
+    def strength(self):
+        """ Function that returns the strength (see hand_strength) of the best 5 card hand in the
+        5-7 cards held. Raises ValueError for any other number of cards """
+        if not 5 <= len(self.held) <= 7:
+            raise ValueError(f"a hand of {len(self.held)} cards can not be ranked, 5-7 are needed")
+
+        # The same lookups as best_hand_strength, with the product and suit counts already made
+        flushes = (self.suit_counts + 0x3333) & 0x8888
+        if not flushes:
+            return best_rank_lookup[self.product]
+        suit = flushes.bit_length() // 4 - 1
+        return best_flush_lookup[(self.suit_ranks >> (13 * suit)) & 0x1FFF]
+
+    def has_straight(self):
+        """ Function that returns True if five of the ranks held are in a row (an Ace can also be
+        low, as in A, 2, 3, 4, 5), whatever their suits """
+        rank_mask = self.rank_mask
+        return any(rank_mask & mask == mask for mask in straight_masks)
+
+    def straight_outs(self):
+        """ Function that returns the ranks (as strings, e.g. "9") that would make a straight if a
+        card of that rank were added, for drawing to a straight: two ranks for an open-ended
+        straight draw, one for an inside straight draw. Empty if the hand already has a straight """
+        if self.has_straight():
+            return []
+        rank_mask = self.rank_mask
+        return [rank_strings[rank] for rank in range(13) if not rank_mask >> rank & 1
+                and any((rank_mask | 1 << rank) & mask == mask for mask in straight_masks)]
+
+    def category(self):
+        """ Function that returns the best hand so far as a string (see hand_ranking). With fewer
+        than 5 cards there can be no straight or flush, so only the repeated ranks count, e.g. two
+        Kings and a 3 are a Pair. Returns None if no cards are held """
+        if len(self.held) >= 5:
+            return hand_names[self.strength() >> 20]
+        if not self.held:
+            return None
+        count_of_counts = self.count_of_counts
+        if count_of_counts[4]:
+            return "Four of a Kind"
+        if count_of_counts[3]:
+            return "Three of a Kind"
+        if count_of_counts[2] == 2:
+            return "Two Pair"
+        if count_of_counts[2]:
+            return "Pair"
+        return "High Card"
+
+
+class HandCache:
+    """ Class representing a cache of hand strengths that sits in front of best_hand_strength,
+    for jobs that rank the same hands over and over. Hands are stored under their canonical key
+    (see canonical_hand_key), so hands that only differ by the order of the cards or by renaming
+    the suits share one entry. Once max_size hands are stored, the hand that was used the longest
+    time ago is removed to make room (least recently used).
+
+    Memory: each entry takes about 150 bytes on 64 bit CPython, so the default max_size of
+    200,000 hands stays under about 30 MB per process. There are only 134,459 different 5 card
+    hands after renaming suits, so that is enough to hold every 5 card hand; 7 card hands have
+    6,009,159, which would need about 900 MB to hold in full.
+
+    Note that working out the canonical key of a hand takes longer than looking the hand up in
+    the lookup tables, so the cache does not make ranking a single hand faster by itself """
+
+    def __init__(self, max_size=200000):
+        """ Initialize an empty cache that holds at most max_size hands """
+        self.max_size = max_size
+        self.strengths = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Looking a hand up and marking it as used are two steps, so threads sharing the cache take
+        # turns. Working out the key and ranking a missing hand happen outside of the lock
+        self.lock = threading.Lock()
+
+    def hand_strength(self, cards):
+        """ Function that returns the strength of the best hand in a list of 5-7 cards (see
+        best_hand_strength), from the cache if it is there """
+        key = canonical_hand_key(cards)
+        strengths = self.strengths
+        with self.lock:
+            strength = strengths.get(key)
+            if strength is not None:
+                self.hits += 1
+                # Mark the hand as the most recently used so it is removed last
+                strengths.move_to_end(key)
+                return strength
+            self.misses += 1
+
+        strength = best_hand_strength(cards)
+        with self.lock:
+            strengths[key] = strength
+            if len(strengths) > self.max_size:
+                strengths.popitem(last=False)
+        return strength
+
+    def hand_ranking(self, cards):
+        """ Function that returns the hand as a string (see hand_ranking) using the cache """
+        return hand_names[self.hand_strength(cards) >> 20]
+
+    def winner_is(self, players, category_only=False):
+        """ Function that returns the list of winners (see winner_is) using the cache """
+        strengths = {player: self.hand_strength(hand) for player, hand in players.items()}
+        # Without the kickers only the score above the 20 kicker bits is compared
+        if category_only:
+            strengths = {player: strength >> 20 for player, strength in strengths.items()}
+        max_strength = max(strengths.values())
+        return [player for player, strength in strengths.items() if strength == max_strength]
+
+    def warm(self, hands):
+        """ Function that adds a list of hands to the cache ahead of time """
+        for hand in hands:
+            self.hand_strength(hand)
+
+    def clear(self):
+        """ Function that empties the cache and resets the hit and miss counters """
+        with self.lock:
+            self.strengths.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """ Function that returns a dictionary with the number of hits and misses, the share of
+        lookups that were hits, and the current and largest number of hands stored """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self.strengths), "max_size": self.max_size}
@@ -0,0 +1,221 @@
+""" Range against range equity: how often one set of possible hands beats another set of possible
+hands over the same boards. Each hand in a range is ranked once on every board (one row of
+strengths per hand), the two rows of every pair of hands are compared to get a matrix of how often
+each hand beats each other hand, and the equity of the ranges is a weighted sum over that matrix
+found with matrix products. Pairs of hands that share a card, and boards that hold a card of a hand,
+are left out. Hashlib and os mods to keep matrices in a cache on disk, re mod to read ranges such
+as "AA, AKs, QhJh:0.5", numpy for the strengths and the matrices"""
+import hashlib
+import os
+import re
+
+import numpy as np
+
+from poker_python_challenge_answers import best_hand_strength_batch, card_code, decode_hand, \
+    shuffle_batch
+from poker_simulation import card_masks
+
+# A card such as "Ah" or "10h", and a class of two card hands such as "AA", "AKs" (suited), "AKo"
+# (offsuit) or "AK" (both). T can be used for 10
+range_card_pattern = re.compile(r"(10|[2-9TJQKA])([hdcs])")
+range_class_pattern = re.compile(r"(10|[2-9TJQKA])(10|[2-9TJQKA])([so]?)")
+range_rank_indexes = {rank: index for index, rank in
+                      enumerate(["2", "3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K", "A"])}
+range_rank_indexes["T"] = range_rank_indexes["10"]
+
+# Version of the matrices in the cache, changed whenever the way they are made changes so older
+# files are not used
+range_cache_version = 1
+
+
+def hand_combos(hand):
+    """ Function that returns the list of hands, each a sorted tuple of integer cards, meant by one
+    entry of a range: a list of cards (strings, integers or Cards), a string of cards such as
+    "AhKd" or a class of two card hands such as "AA", "AKs", "AKo" or "AK" """
+    if not isinstance(hand, str):
+        cards = [card_code(card) for card in hand]
+    else:
+        text = hand.replace(" ", "")
+        found = range_card_pattern.findall(text)
+        if "".join(rank + suit for rank, suit in found) == text and found:
+            cards = [range_rank_indexes[rank] + 13 * "hdcs".index(suit) for rank, suit in found]
+        else:
+            match = range_class_pattern.fullmatch(text)
+            if match is None:
+                raise ValueError(f"{hand!r} is not a hand or a class of hands")
+            first, second, kind = match.groups()
+            first, second = range_rank_indexes[first], range_rank_indexes[second]
+            if first == second and kind:
+                raise ValueError(f"{hand!r}: a pair can not be suited or offsuit")
+            # Every way to give the two ranks a suit each, keeping the ones of the right kind
+            combos = {tuple(sorted((first + 13 * suit1, second + 13 * suit2)))
+                      for suit1 in range(4) for suit2 in range(4)
+                      if not (first == second and suit1 == suit2)
+                      and (kind != "s" or suit1 == suit2) and (kind != "o" or suit1 != suit2)}
+            return sorted(combos)
+
+    if len(set(cards)) != len(cards):
+        raise ValueError(f"{hand!r} holds the same card more than once")
+    return [tuple(sorted(cards))]
+
+
+def parse_range(hand_range):
+    """ Function that returns the hands of a range as an array of integer cards with one hand per
+    row, and the weight of each hand as an array. hand_range is a dictionary of hands (see
+    hand_combos) and their weights, a list of hands with a weight of 1 each, or a string of hands
+    separated by commas where each can end in ":weight", e.g. "AA, AKs:0.5, QhJh". A hand given
+    more than once keeps the last weight given, and hands with a weight of 0 are left out """
+    if isinstance(hand_range, str):
+        entries = []
+        for entry in hand_range.split(","):
+            if entry.strip():
+                hand, _, weight = entry.partition(":")
+                entries.append((hand.strip(), float(weight) if weight else 1.0))
+    elif isinstance(hand_range, dict):
+        entries = list(hand_range.items())
+    else:
+        entries = [(hand, 1.0) for hand in hand_range]
+
+    weights = {}
+    for hand, weight in entries:
+        if weight < 0:
+            raise ValueError(f"{hand!r} has a negative weight")
+        for combo in hand_combos(hand):
+            weights[combo] = weight
+    weights = {combo: weight for combo, weight in weights.items() if weight > 0}
+    if not weights:
+        raise ValueError("the range has no hands")
+    if len({len(combo) for combo in weights}) != 1:
+        raise ValueError("every hand in a range must have the same number of cards")
+
+    # Sorted so the same range always gives the same arrays, and so the same cache key
+    combos = sorted(weights)
+    return np.array(combos, dtype=np.uint8), np.array([weights[combo] for combo in combos])
+
+
+def sample_boards(num_boards, board_size=5, seed=0, dead_cards=()):
+    """ Function that deals num_boards boards of board_size cards as an array with one board per
+    row, from a deck without dead_cards. Boards may hold cards of the hands in the ranges; those
+    are left out for the hands concerned (see strength_rows). With no board cards there is only
+    one (empty) board """
+    if board_size == 0:
+        return np.zeros((1, 0), dtype=np.uint8)
+    dead = {card_code(card) for card in dead_cards}
+    cards = np.array([code for code in range(52) if code not in dead], dtype=np.uint8)
+    return shuffle_batch(num_boards, seed, cards)[:, :board_size]
+
+
+def strength_rows(combos, boards, chunk_size=1 << 18):
+    """ Function that returns an array with one row per hand and one column per board, holding the
+    strength (see best_hand_strength) of the best 5 card hand made from the hand and the board, or
+    -1 where the board holds one of the hand's cards """
+    strengths = np.empty((len(combos), len(boards)), dtype=np.int32)
+    # Ranked a number of hands at a time, with every board for each, so memory stays small
+    step = max(1, chunk_size // len(boards))
+    for start in range(0, len(combos), step):
+        chunk = combos[start:start + step]
+        hands = np.concatenate([np.repeat(chunk, len(boards), axis=0),
+                                np.tile(boards, (len(chunk), 1))], axis=1)
+        strengths[start:start + step] = best_hand_strength_batch(hands).reshape(len(chunk), -1)
+
+    conflicts = (card_masks(combos)[:, None] & card_masks(boards)[None, :]) != 0
+    strengths[conflicts] = -1
+    return strengths
+
+
+def hand_matrix(strengths1, strengths2, chunk_size=1 << 24):
+    """ Function that compares every hand of one range with every hand of another on every board,
+    with input of the strength rows of both ranges (see strength_rows). Returns three arrays of
+    shape (hands in the first range, hands in the second range): the number of boards the first
+    hand wins on, the number it ties on, and the number of boards that hold neither hand's cards """
+    valid1 = (strengths1 >= 0).astype(np.float64)
+    valid2 = (strengths2 >= 0).astype(np.float64)
+    # Counting the boards both hands can be dealt with is a matrix product
+    counts = np.rint(valid1 @ valid2.T).astype(np.int32)
+
+    # A board the second hand can not be dealt with gets the largest strength there is, so the
+    # first hand never beats or ties it there; the first hand's -1 already never beats or ties
+    strengths2 = np.where(strengths2 >= 0, strengths2, np.iinfo(np.int32).max)
+    wins = np.zeros(counts.shape, dtype=np.int32)
+    ties = np.zeros(counts.shape, dtype=np.int32)
+    step = max(1, chunk_size // max(1, counts.size))
+    for start in range(0, strengths1.shape[1], step):
+        first = strengths1[:, None, start:start + step]
+        second = strengths2[None, :, start:start + step]
+        wins += (first > second).sum(axis=2, dtype=np.int32)
+        ties += (first == second).sum(axis=2, dtype=np.int32)
+    return wins, ties, counts
+
+
+def matrix_cache_path(cache_dir, combos1, combos2, boards):
+    """ Function that returns the path of the file in cache_dir for the matrices of two ranges on
+    a set of boards. The file name is a hash of the hands of both ranges and of the boards, so the
+    weights of the hands can change without making the matrices again """
+    key = hashlib.sha256()
+    for array in (combos1, combos2, boards):
+        key.update(str(array.shape).encode())
+        key.update(np.ascontiguousarray(array, dtype=np.uint8).tobytes())
+    return os.path.join(cache_dir, f"range-v{range_cache_version}-{key.hexdigest()[:32]}.npz")
+
+
+def load_or_build_matrix(combos1, combos2, boards, cache_dir=None):
+    """ Function that returns the matrices of two ranges on a set of boards (see hand_matrix) and
+    True if they were read from the cache in cache_dir, or False if they were made (and saved
+    there, if cache_dir is given) """
+    path = None
+    if cache_dir is not None:
+        path = matrix_cache_path(cache_dir, combos1, combos2, boards)
+        try:
+            with np.load(path) as saved:
+                return (saved["wins"], saved["ties"], saved["counts"]), True
+        except (OSError, KeyError, ValueError):
+            pass
+
+    matrices = hand_matrix(strength_rows(combos1, boards), strength_rows(combos2, boards))
+    if path is not None:
+        # Written to a temporary file first, so other processes never read a half written file
+        os.makedirs(cache_dir, exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(temporary_path, wins=matrices[0], ties=matrices[1], counts=matrices[2])
+        os.replace(temporary_path, path)
+    return matrices, False
+
+
+def range_equity(range1, range2, num_boards=1000, board_size=5, seed=0, dead_cards=(),
+                 cache_dir=None):
+    """ Function that returns how often the first range beats the second over num_boards boards of
+    board_size cards (see sample_boards), as a dictionary with the weighted share of pairs of hands
+    and boards won, tied and lost by the first range, its equity (wins plus half the ties), the
+    equity of each of its hands against the whole second range, the number of pairs of hands that
+    share no card, the number of boards and whether the matrices came from the cache in cache_dir.
+    The ranges can be given in any form parse_range reads """
+    combos1, weights1 = parse_range(range1)
+    combos2, weights2 = parse_range(range2)
+    if not 5 <= combos1.shape[1] + board_size <= 7 or not 5 <= combos2.shape[1] + board_size <= 7:
+        raise ValueError("a hand and a board together must make 5 to 7 cards")
+    boards = sample_boards(num_boards, board_size, seed, dead_cards)
+    (wins, ties, counts), cached = load_or_build_matrix(combos1, combos2, boards, cache_dir)
+
+    # Pairs of hands that share a card can never be dealt together, so they are blocked
+    usable = ((card_masks(combos1)[:, None] & card_masks(combos2)[None, :]) == 0) & (counts > 0)
+    boards_dealt = np.maximum(counts, 1)
+    win_matrix = np.where(usable, wins / boards_dealt, 0.0)
+    tie_matrix = np.where(usable, ties / boards_dealt, 0.0)
+    usable = usable.astype(np.float64)
+
+    # Each pair of hands counts with the product of their weights, so the weighted sums over all
+    # pairs are matrix products of the weights with the matrices
+    total = weights1 @ usable @ weights2
+    if total == 0:
+        raise ValueError("every pair of hands in the two ranges shares a card")
+    win = weights1 @ win_matrix @ weights2 / total
+    tie = weights1 @ tie_matrix @ weights2 / total
+
+    hand_totals = usable @ weights2
+    hand_equities = (win_matrix + tie_matrix / 2) @ weights2 / np.maximum(hand_totals, 1e-300)
+    return {"win": float(win), "tie": float(tie), "lose": float(1 - win - tie),
+            "equity": float(win + tie / 2),
+            "hand_equity": {"".join(decode_hand(combo)): float(equity)
+                            for combo, equity, hand_total in
+                            zip(combos1.tolist(), hand_equities, hand_totals) if hand_total > 0},
+            "pairs": int(usable.sum()), "boards": len(boards), "cached": cached}
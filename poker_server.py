@@ -0,0 +1,212 @@
+""" Hosting many live tables in one process with asyncio. Each table has its own deck and random
+number generator, and showdowns from every table are collected and ranked together once per turn
+of the event loop. Asyncio mod to run the tables at the same time, concurrent futures mod to rank
+large batches in other processes, argparse and sys mods for the command line, collections mod to
+keep the latest latencies, operator mod to check the cards of a showdown, random mod for each
+table's random number generator, time mod to measure latency, numpy to rank the hands of many
+tables at once. Run a load test with: python poker_server.py --tables 2000 """
+import argparse
+import asyncio
+import operator
+import random
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from poker_python_challenge_answers import Deck, deal_cards, hand_ranking_batch
+
+
+class Table:
+    """ Class representing a table of players that plays one hand after another with its own deck
+    and random number generator """
+
+    def __init__(self, name, player_list, seed=None):
+        """ Initialize the table with a name, a list of player names and a seed for the table's
+        random number generator. Tables with the same name and seed deal the same cards """
+        self.name = name
+        self.player_list = player_list
+        self.rng = random.Random(None if seed is None else f"{seed}:{name}")
+        self.deck = Deck(encoded=True, rng=self.rng)
+        self.deck.build()
+        self.hands_played = 0
+
+    def deal(self):
+        """ Function that deals a new hand to every player (see deal_cards) and returns the
+        dictionary of players and their integer cards """
+        self.hands_played += 1
+        return deal_cards(self.player_list, deck=self.deck)
+
+
+def check_showdown(players):
+    """ Function that checks a dictionary of players and their cards before it joins a batch, and
+    raises ValueError if a player does not have five integer cards from 0 to 51 or a card is held
+    more than once. A bad showdown would otherwise stop the whole batch from being ranked """
+    seen = set()
+    for player, hand in players.items():
+        try:
+            # operator.index takes Python and numpy integers but not strings or floats
+            cards = [operator.index(card) for card in hand]
+        except TypeError:
+            raise ValueError(f"{player!r} must have integer cards, not {hand!r}") from None
+        if len(cards) != 5 or not all(0 <= card < 52 for card in cards):
+            raise ValueError(f"{player!r} must have five cards from 0 to 51, not {hand!r}")
+        if seen.intersection(cards) or len(set(cards)) != 5:
+            raise ValueError(f"{player!r} holds a card that is already dealt: {hand!r}")
+        seen.update(cards)
+
+
+class TableManager:
+    """ Class representing the showdowns of many tables that run at the same time on one event
+    loop. Every showdown asked for while the loop is busy is ranked in one batch on the next turn
+    of the loop (see hand_ranking_batch). Batches of at least process_threshold hands are ranked in
+    a process pool so the loop can carry on in the meantime """
+
+    def __init__(self, process_threshold=50000, workers=None, max_latencies=100000):
+        """ Initialize the manager. workers is the number of processes in the pool, which is only
+        started once a batch is large enough to need it. The latencies of the last max_latencies
+        showdowns are kept for the stats """
+        self.process_threshold = process_threshold
+        self.workers = workers
+        self.executor = None
+        # Showdowns waiting for the next batch, as tuples of the players' hands and the future
+        # that gets the winners
+        self.pending = []
+        self.batches = 0
+        self.process_batches = 0
+        self.showdowns = 0
+        # Older latencies are dropped as new ones come in, so a server that runs for days keeps
+        # the same memory and stats() always sorts at most max_latencies numbers
+        self.latencies = deque(maxlen=max_latencies)
+
+    async def showdown(self, players):
+        """ Function that returns the list of winners (see winner_is) with input of a dictionary
+        of players and their five integer cards, ranked together with the other tables. Raises
+        ValueError for bad cards (see check_showdown) without holding up the other tables """
+        check_showdown(players)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # The first showdown since the last batch asks the loop to rank the batch once every
+        # task that is ready to run has had its turn
+        if not self.pending:
+            loop.call_soon(self.start_batch)
+        self.pending.append((players, future))
+
+        start = time.perf_counter()
+        winners = await future
+        self.latencies.append(time.perf_counter() - start)
+        return winners
+
+    def start_batch(self):
+        """ Function that takes the waiting showdowns and ranks them as one batch """
+        batch, self.pending = self.pending, []
+        asyncio.get_running_loop().create_task(self.rank_batch(batch))
+
+    async def rank_batch(self, batch):
+        """ Function that ranks every hand in a batch of showdowns and gives each showdown its
+        winners """
+        try:
+            hands = np.array([hand for players, _ in batch for hand in players.values()],
+                             dtype=np.uint8)
+            if len(hands) >= self.process_threshold:
+                if self.executor is None:
+                    self.executor = ProcessPoolExecutor(max_workers=self.workers)
+                self.process_batches += 1
+                strengths = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, hand_ranking_batch, hands, True)
+            else:
+                strengths = hand_ranking_batch(hands, strength=True)
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        # The strengths are in the same order as the hands, table after table
+        strengths = strengths.tolist()
+        position = 0
+        for players, future in batch:
+            table = strengths[position:position + len(players)]
+            position += len(players)
+            best = max(table)
+            if not future.cancelled():
+                future.set_result([player for player, strength in zip(players, table)
+                                   if strength == best])
+        self.batches += 1
+        self.showdowns += len(batch)
+
+    def stats(self):
+        """ Function that returns a dictionary with the number of showdowns and batches, the
+        average showdowns per batch and the 50th, 90th and 99th percentile time in seconds from
+        asking for a showdown to getting its winners, over the latest showdowns (see __init__).
+        The percentiles are left out if there has been no showdown """
+        stats = {"showdowns": self.showdowns, "batches": self.batches,
+                 "process_batches": self.process_batches,
+                 "showdowns_per_batch": self.showdowns / self.batches if self.batches else 0.0}
+        if self.latencies:
+            p50, p90, p99 = np.percentile(self.latencies, [50, 90, 99])
+            stats.update(latency_p50=p50, latency_p90=p90, latency_p99=p99)
+        return stats
+
+    def close(self):
+        """ Function that shuts down the process pool, if it was started """
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+async def play_table(manager, table, num_hands):
+    """ Function that plays num_hands hands at a table and returns the list of winners of each """
+    results = []
+    for _ in range(num_hands):
+        results.append(await manager.showdown(table.deal()))
+    return results
+
+
+async def load_test(num_tables=2000, num_players=6, num_hands=10, seed=0, process_threshold=50000,
+                    workers=None):
+    """ Function that plays num_hands hands at each of num_tables tables at the same time and
+    returns a dictionary with the manager's stats (see TableManager.stats) plus the time taken and
+    the showdowns per second """
+    player_list = [f"Player {num}" for num in range(num_players)]
+    tables = [Table(f"Table {num}", player_list, seed) for num in range(num_tables)]
+    manager = TableManager(process_threshold, workers)
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*[play_table(manager, table, num_hands) for table in tables])
+    finally:
+        manager.close()
+    seconds = time.perf_counter() - start
+    stats = manager.stats()
+    stats.update(seconds=seconds, showdowns_per_second=stats["showdowns"] / seconds)
+    return stats
+
+
+def main(argv=None):
+    """ Function that runs the load test from the command line and prints the results """
+    parser = argparse.ArgumentParser(description="Load test many tables on one event loop.")
+    parser.add_argument("--tables", type=int, default=2000, help="number of tables")
+    parser.add_argument("--players", type=int, default=6, help="players per table")
+    parser.add_argument("--hands", type=int, default=10, help="hands played per table")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the tables' decks")
+    parser.add_argument("--process-threshold", type=int, default=50000,
+                        help="rank batches of at least this many hands in a process pool")
+    parser.add_argument("--workers", type=int, default=None, help="processes in the pool")
+    args = parser.parse_args(argv)
+    stats = asyncio.run(load_test(args.tables, args.players, args.hands, args.seed,
+                                  args.process_threshold, args.workers))
+    print(f"{stats['showdowns']:,} showdowns in {stats['seconds']:.2f} s "
+          f"({stats['showdowns_per_second']:,.0f}/s), {stats['batches']} batches of "
+          f"{stats['showdowns_per_batch']:.0f} on average "
+          f"({stats['process_batches']} in processes)")
+    if "latency_p50" in stats:
+        print(f"showdown latency: p50 {stats['latency_p50'] * 1000:.2f} ms, "
+              f"p90 {stats['latency_p90'] * 1000:.2f} ms, "
+              f"p99 {stats['latency_p99'] * 1000:.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+""" Equity simulation: how often each player wins with a set of known (or partly known) hands.
+Concurrent futures mod to spread work across processes, statistics mod for confidence intervals,
+itertools and math mods to list and count the ways to deal the unknown cards, time mod to measure
+throughput, numpy to deal and rank many deals at once"""
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations, permutations
+from math import comb
+from statistics import NormalDist
+
+import numpy as np
+
+from poker_python_challenge_answers import Deck, card_code, hand_ranking_batch, shuffle_batch
+
+
+def prepare_hands(known_hands, num_players=None):
+    """ Function that checks the known hands and returns the player names, the known hands as
+    lists of integer cards and the remaining cards in the deck as a numpy array. known_hands is a
+    dictionary with the player names as keys and a list of 0-5 cards (strings or integers) as
+    values. If num_players is larger than the number of known hands, players with no known cards
+    are added as "Opponent 1", "Opponent 2", ... """
+    if num_players is None:
+        num_players = len(known_hands)
+    if num_players < len(known_hands):
+        raise ValueError(f"num_players ({num_players}) is smaller than the number of known "
+                         f"hands ({len(known_hands)})")
+
+    # Converting strings to integer cards here means the simulation never touches strings
+    names = list(known_hands)
+    codes = []
+    for name, hand in known_hands.items():
+        if len(hand) > 5:
+            raise ValueError(f"{name} has {len(hand)} cards, a hand has at most 5")
+        codes.append([card_code(card) for card in hand])
+    for num in range(1, num_players - len(known_hands) + 1):
+        names.append(f"Opponent {num}")
+        codes.append([])
+
+    known_cards = [card for hand in codes for card in hand]
+    if len(set(known_cards)) != len(known_cards):
+        raise ValueError("the same card is in more than one known hand")
+    if num_players * 5 > 52:
+        raise ValueError(f"a deck can not deal 5 cards to {num_players} players")
+
+    # The remaining deck is a full deck without the known cards
+    deck = Deck(encoded=True)
+    deck.build()
+    used = set(known_cards)
+    remaining = np.array([card for card in deck.cards if card not in used], dtype=np.uint8)
+    return names, codes, remaining
+
+
+def count_results(strengths, weights=None):
+    """ Function that returns the number of wins and the number of ties of each player with input
+    of an array of hand strengths with one deal per row and one player per column. If weights is
+    given, each deal counts weights[row] times """
+    best = strengths.max(axis=1, keepdims=True)
+    winners = strengths == best
+    # A deal where more than one player has the best hand is a tie for each of those players
+    single_winner = winners.sum(axis=1, keepdims=True) == 1
+    if weights is None:
+        return (winners & single_winner).sum(axis=0), (winners & ~single_winner).sum(axis=0)
+    return weights @ (winners & single_winner), weights @ (winners & ~single_winner)
+
+
+def deal_strengths(codes, unknown_cards):
+    """ Function that returns the strength of every player's hand in every deal, with input of the
+    known hands and an array with one deal per row holding the unknown cards in player order """
+    num_deals = len(unknown_cards)
+    hands = np.empty((num_deals, len(codes), 5), dtype=np.uint8)
+    dealt = 0
+    for player, hand in enumerate(codes):
+        hands[:, player, :len(hand)] = hand
+        hands[:, player, len(hand):] = unknown_cards[:, dealt:dealt + 5 - len(hand)]
+        dealt += 5 - len(hand)
+    return hand_ranking_batch(hands.reshape(-1, 5), strength=True).reshape(num_deals, len(codes))
+
+
+def simulate_batch(codes, remaining, trials, seed, worker, batch_round):
+    """ Function that deals the unknown cards trials times and returns the number of wins and ties
+    of each player. The random numbers come from (seed, worker, batch_round) alone, so the same
+    batch always gives the same answer no matter which process runs it """
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(worker, batch_round)))
+
+    # Shuffle a copy of the remaining deck for every trial and deal the unknown cards off the top
+    decks = shuffle_batch(trials, rng, remaining)
+    return count_results(deal_strengths(codes, decks))
+
+
+def wilson_interval(successes, trials, confidence):
+    """ Function that returns the (low, high) Wilson score interval for a probability estimated
+    from successes out of trials """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    estimate = successes / trials
+    center = (estimate + z * z / (2 * trials)) / (1 + z * z / trials)
+    spread = (z / (1 + z * z / trials)) * np.sqrt(estimate * (1 - estimate) / trials
+                                                    + z * z / (4 * trials * trials))
+    return float(center - spread), float(center + spread)
+
+
+def summarize(names, wins, ties, trials, confidence):
+    """ Function that turns win and tie counts into the dictionary returned by simulate_equity """
+    players = {}
+    for name, player_wins, player_ties in zip(names, wins, ties):
+        win = player_wins / trials
+        players[name] = {"win": float(win),
+                         "tie": float(player_ties / trials),
+                         "win_interval": wilson_interval(player_wins, trials, confidence),
+                         "tie_interval": wilson_interval(player_ties, trials, confidence),
+                         "standard_error": float(np.sqrt(win * (1 - win) / trials))}
+    return {"trials": int(trials), "players": players}
+
+
+def simulate_equity(known_hands, num_players=None, trials=100000, seed=0, workers=1,
+                    batch_size=10000, target_standard_error=None, confidence=0.95):
+    """ Function that estimates how often each player wins by dealing the unknown cards at random.
+    known_hands is a dictionary with the player names as keys and a list of 0-5 known cards as
+    values (see prepare_hands). Returns a dictionary with the number of trials run and, for each
+    player, the chance to win outright, the chance to tie, their confidence intervals and the
+    standard error of the win chance.
+
+    The trials are run in rounds of batch_size trials per worker, with workers processes. If
+    target_standard_error is given, the simulation stops after the first round where every
+    player's standard error is at or below it. The results only depend on the arguments, so the
+    same seed and number of workers always give exactly the same answer """
+    names, codes, remaining = prepare_hands(known_hands, num_players)
+    wins = np.zeros(len(names), dtype=np.int64)
+    ties = np.zeros(len(names), dtype=np.int64)
+    done = 0
+    batch_round = 0
+
+    # With one worker there is no need for a process pool, which takes time to start
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        while done < trials:
+            # Split what is left of this round between the workers, each with its own seed
+            round_trials = min(batch_size * workers, trials - done)
+            sizes = [round_trials // workers + (worker < round_trials % workers)
+                     for worker in range(workers)]
+            jobs = [(codes, remaining, size, seed, worker, batch_round)
+                    for worker, size in enumerate(sizes) if size]
+            if executor is None:
+                results = [simulate_batch(*job) for job in jobs]
+            else:
+                results = list(executor.map(simulate_batch, *zip(*jobs)))
+
+            # Add the results in worker order so the totals never depend on which finished first
+            for batch_wins, batch_ties in results:
+                wins += batch_wins
+                ties += batch_ties
+            done += round_trials
+            batch_round += 1
+
+            if target_standard_error is not None:
+                win_rates = wins / done
+                if np.sqrt(win_rates * (1 - win_rates) / done).max() <= target_standard_error:
+                    break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return summarize(names, wins, ties, done, confidence)
+
+
+# Exact equity: when only a few cards are unknown, every way of dealing them can be ranked instead
+# of a random sample. Two deals that only differ by swapping suits that none of the known cards
+# tell apart (e.g. clubs and spades when nobody holds a club or a spade) always have the same
+# winner, so only one deal of each such group is ranked and it counts for the whole group
+def count_completions(known_hands, num_players=None):
+    """ Function that returns how many different ways the unknown cards can be dealt """
+    _, codes, remaining = prepare_hands(known_hands, num_players)
+    total = 1
+    left = len(remaining)
+    for hand in codes:
+        total *= comb(left, 5 - len(hand))
+        left -= 5 - len(hand)
+    return total
+
+
+def suit_symmetries(codes):
+    """ Function that returns an array with one row per suit swap that leaves every known hand
+    the same, where each row maps every integer card to the card it is swapped with """
+    tables = []
+    # permutations gives the identity (no swap) first
+    for order in permutations(range(4)):
+        table = np.array([order[card // 13] * 13 + card % 13 for card in range(52)],
+                         dtype=np.uint8)
+        if all(set(table[hand].tolist()) == set(hand) for hand in codes):
+            tables.append(table)
+    return np.array(tables)
+
+
+def combination_array(cards, size):
+    """ Function that returns an array of every combination of size cards, one per row """
+    indexes = np.array(list(combinations(range(len(cards)), size)), dtype=np.intp)
+    return np.asarray(cards)[indexes.reshape(comb(len(cards), size), size)]
+
+
+def card_masks(rows):
+    """ Function that returns one integer per row with a bit set for each card in the row """
+    masks = np.zeros(len(rows), dtype=np.int64)
+    for column in range(rows.shape[1]):
+        masks |= np.left_shift(1, rows[:, column].astype(np.int64))
+    return masks
+
+
+def first_hand_orbits(first_hands, symmetries):
+    """ Function that groups the possible cards of the first player with unknown cards into
+    groups that only differ by a suit swap. Returns one hand from each group and the size of
+    the group """
+
+    # Give every hand a key for each suit swap: the swapped cards sorted and packed 6 bits each
+    keys = np.zeros((len(first_hands), len(symmetries)), dtype=np.int64)
+    for index, table in enumerate(symmetries):
+        swapped = np.sort(table[first_hands], axis=1).astype(np.int64)
+        for column in range(swapped.shape[1]):
+            keys[:, index] |= swapped[:, column] << (6 * column)
+
+    # The hand with the smallest key stands for its group. first_hands comes from combinations
+    # so it is already sorted, which makes its own key the one for the identity swap
+    representative = keys[:, 0] == keys.min(axis=1)
+    sorted_keys = np.sort(keys, axis=1)
+    group_sizes = 1 + (np.diff(sorted_keys, axis=1) != 0).sum(axis=1)
+    return first_hands[representative], group_sizes[representative]
+
+
+def exact_chunk(codes, remaining, first_hands, weights):
+    """ Function that ranks every deal that starts with one of first_hands (the unknown cards of
+    the first player with unknown cards) and returns the weighted number of wins and ties """
+    unknown_counts = [5 - len(hand) for hand in codes if len(hand) < 5]
+
+    # Add the unknown cards of each following player to every deal so far, skipping the
+    # combinations that use a card already dealt in that deal
+    parts = [first_hands]
+    masks = card_masks(first_hands)
+    for count in unknown_counts[1:]:
+        hands = combination_array(remaining, count)
+        hand_masks = card_masks(hands)
+        deal_rows, hand_rows = np.nonzero((masks[:, None] & hand_masks[None, :]) == 0)
+        parts = [part[deal_rows] for part in parts] + [hands[hand_rows]]
+        masks = masks[deal_rows] | hand_masks[hand_rows]
+        weights = weights[deal_rows]
+
+    strengths = deal_strengths(codes, np.concatenate(parts, axis=1))
+    return count_results(strengths, weights)
+
+
+def exact_equity(known_hands, num_players=None, workers=1, chunk_size=100000):
+    """ Function that returns the exact chance of each player to win and tie by ranking every way
+    to deal the unknown cards. known_hands and num_players are the same as for simulate_equity.
+    The deals are split into chunks of about chunk_size deals and ranked by workers processes.
+
+    Returns a dictionary with the number of possible deals (completions), how many of them were
+    actually ranked after grouping deals that only differ by a suit swap (evaluated), the time
+    taken and completions per second, and for each player the number and fraction of deals won
+    and tied """
+    start = time.perf_counter()
+    names, codes, remaining = prepare_hands(known_hands, num_players)
+    total = count_completions(known_hands, num_players)
+    unknown_counts = [5 - len(hand) for hand in codes if len(hand) < 5] or [0]
+
+    # Group the first unknown hand by suit swaps. The deals that follow each of its hands are
+    # listed in full, so a chunk holds as many first hands as fit in about chunk_size deals
+    first_hands = combination_array(remaining, unknown_counts[0])
+    first_hands, weights = first_hand_orbits(first_hands, suit_symmetries(codes))
+    deals_per_first_hand = total // comb(len(remaining), unknown_counts[0])
+    step = max(1, chunk_size // deals_per_first_hand)
+    jobs = [(codes, remaining, first_hands[index:index + step], weights[index:index + step])
+            for index in range(0, len(first_hands), step)]
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(exact_chunk, *zip(*jobs)))
+    else:
+        results = [exact_chunk(*job) for job in jobs]
+
+    # Add the chunks up in order so the totals are the same every time
+    wins = np.zeros(len(names), dtype=np.int64)
+    ties = np.zeros(len(names), dtype=np.int64)
+    for chunk_wins, chunk_ties in results:
+        wins += chunk_wins
+        ties += chunk_ties
+
+    seconds = time.perf_counter() - start
+    players = {name: {"wins": int(player_wins), "ties": int(player_ties),
+                      "win": int(player_wins) / total, "tie": int(player_ties) / total}
+               for name, player_wins, player_ties in zip(names, wins, ties)}
+    return {"completions": total,
+            "evaluated": len(first_hands) * deals_per_first_hand,
+            "seconds": seconds,
+            "completions_per_second": total / seconds if seconds else float("inf"),
+            "players": players}
+
+
+def equity(known_hands, num_players=None, max_exact_completions=2000000, workers=1,
+           **simulation_options):
+    """ Function that returns exact_equity when there are at most max_exact_completions ways to
+    deal the unknown cards, and simulate_equity otherwise. simulation_options (trials, seed,
+    target_standard_error, ...) are only used by simulate_equity. The result has a "method" key
+    set to "exact" or "simulation" """
+    if count_completions(known_hands, num_players) <= max_exact_completions:
+        result = exact_equity(known_hands, num_players, workers=workers)
+        result["method"] = "exact"
+    else:
+        result = simulate_equity(known_hands, num_players, workers=workers, **simulation_options)
+        result["method"] = "simulation"
+    return result
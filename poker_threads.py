@@ -0,0 +1,110 @@
+""" Ranking hands, finding winners and dealing with a pool of threads. The lookup tables are only
+read once the poker module is imported, so ranking needs no locks (see the note on thread safety
+in poker_python_challenge_answers). Dealing changes a deck and its random number generator, so
+every thread gets its own. On Python builds without the GIL the threads run at the same time;
+with the GIL, only numpy's work in hand_ranking_batch can overlap. Concurrent futures mod for the
+thread pool, random and threading mods for each thread's deck and random number generator, numpy
+to split and join batches of hands"""
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from poker_python_challenge_answers import Deck, deal_cards, hand_ranking, hand_ranking_batch, \
+    winner_is
+
+# Each thread's own deck and random number generator, made the first time the thread asks
+thread_state = threading.local()
+
+
+def thread_rng():
+    """ Function that returns the calling thread's own random number generator, seeded from the
+    operating system the first time the thread asks for it """
+    rng = getattr(thread_state, "rng", None)
+    if rng is None:
+        rng = thread_state.rng = random.Random()
+    return rng
+
+
+def thread_deck(encoded=True):
+    """ Function that returns the calling thread's own deck (see Deck) of integer cards, or of card
+    strings if encoded is False, using the thread's random number generator """
+    decks = getattr(thread_state, "decks", None)
+    if decks is None:
+        decks = thread_state.decks = {}
+    deck = decks.get(encoded)
+    if deck is None:
+        deck = decks[encoded] = Deck(encoded, thread_rng())
+        deck.build()
+    return deck
+
+
+def deal_cards_local(player_list, encoded=True):
+    """ Function that deals 5 cards to each player in a list (see deal_cards) from the calling
+    thread's own deck, so it can be called from any number of threads at once """
+    return deal_cards(player_list, deck=thread_deck(encoded))
+
+
+def pool_map(func, items, workers=None, executor=None):
+    """ Function that calls func on each item in a list in a pool of workers threads (or in
+    executor, a pool that is already running) and returns the results in the same order """
+    if executor is not None:
+        return list(executor.map(func, items))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(func, items))
+
+
+def map_chunks(func, items, workers=None, chunk_size=1000, executor=None):
+    """ Function that splits a list into chunks of chunk_size, calls func on each chunk in a pool of
+    threads (see pool_map) and returns the list of results in the same order as the chunks """
+    chunks = [items[start:start + chunk_size] for start in range(0, len(items), chunk_size)]
+    return pool_map(func, chunks, workers, executor)
+
+
+def rank_hands_threaded(hands, strength=False, workers=None, chunk_size=1 << 14, executor=None):
+    """ Function that ranks an array of integer hands of shape (number of hands, 5) in a pool of
+    threads and returns the same array as hand_ranking_batch would """
+    hands = np.asarray(hands)
+    if len(hands) == 0:
+        return hand_ranking_batch(hands, strength)
+    results = map_chunks(lambda chunk: hand_ranking_batch(chunk, strength), hands, workers,
+                         chunk_size, executor)
+    return np.concatenate(results)
+
+
+def hand_ranking_threaded(hands, workers=None, chunk_size=1000, executor=None):
+    """ Function that returns the list of hands as strings (see hand_ranking) with input of a list
+    of hands, ranked in a pool of threads """
+    results = map_chunks(lambda chunk: [hand_ranking(hand) for hand in chunk], hands, workers,
+                         chunk_size, executor)
+    return [ranking for chunk in results for ranking in chunk]
+
+
+def winners_threaded(tables, category_only=False, workers=None, chunk_size=1000, executor=None):
+    """ Function that returns the list of winners (see winner_is) of every table in a list of
+    dictionaries of players and their hands, found in a pool of threads """
+    results = map_chunks(lambda chunk: [winner_is(players, category_only) for players in chunk],
+                         tables, workers, chunk_size, executor)
+    return [winners for chunk in results for winners in chunk]
+
+
+def deal_chunk(player_list, num_deals, seed):
+    """ Function that deals num_deals deals of 5 integer cards to each player in a list from a
+    deck of its own, seeded with seed """
+    deck = Deck(encoded=True, rng=random.Random(seed))
+    deck.build()
+    return [deal_cards(player_list, deck=deck) for _ in range(num_deals)]
+
+
+def deal_cards_threaded(num_deals, player_list, seed=0, workers=None, chunk_size=1000,
+                        executor=None):
+    """ Function that deals num_deals deals (see deal_cards) in a pool of threads and returns them
+    as a list. Each chunk of chunk_size deals has its own deck and a random number generator
+    seeded from seed and the chunk's number, so the deals are the same however many threads
+    there are and whichever thread deals which chunk """
+    sizes = [min(chunk_size, num_deals - start) for start in range(0, num_deals, chunk_size)]
+    seeds = np.random.SeedSequence(seed).generate_state(len(sizes), dtype=np.uint64).tolist()
+    results = pool_map(lambda chunk: deal_chunk(player_list, *chunk), list(zip(sizes, seeds)),
+                       workers, executor)
+    return [players for deals in results for players in deals]
@@ -0,0 +1,57 @@
+import pytest
+from poker_python_challenge_answers import hand_ranking
+from benchmark_poker import measure, make_category_hands, run_suite, save_baseline, \
+    load_baseline, compare_results, main
+
+
+# Test the benchmark suite
+
+def test_measure():
+    result = measure(len, [[1, 2]] * 250, repeat=2)
+    assert result["calls"] == 500
+    assert result["ops_per_second"] > 0
+    assert result["p50_us"] <= result["p90_us"] <= result["p99_us"]
+
+
+@pytest.mark.parametrize("category", ["High Card", "Pair", "Flush"])
+def test_make_category_hands(category):
+    hands = make_category_hands(category, 50, seed=3)
+    assert len(hands) == 50
+    assert all(hand_ranking(hand) == category for hand in hands)
+    assert hands == make_category_hands(category, 50, seed=3)
+
+
+def test_save_and_load_baseline(tmp_path):
+    results = run_suite(scale=0.01, repeat=1, names=["Deck", "winner_is"])
+    assert list(results) == ["Deck.build", "Deck.shuffle", "winner_is/4_players",
+                             "winner_is/category_only"]
+    path = tmp_path / "baseline.json"
+    save_baseline(results, path)
+    assert load_baseline(path) == results
+
+
+def test_compare_results():
+    baseline = {"fast": {"ops_per_second": 100.0}, "slow": {"ops_per_second": 100.0},
+                "gone": {"ops_per_second": 100.0}}
+    results = {"fast": {"ops_per_second": 85.0}, "slow": {"ops_per_second": 70.0},
+               "new": {"ops_per_second": 1.0}}
+    assert compare_results(results, baseline, threshold=0.2) == \
+        [("slow", 100.0, 70.0, pytest.approx(-0.3))]
+    assert [name for name, *_ in compare_results(results, baseline, threshold=0.1)] == \
+        ["fast", "slow"]
+
+
+def test_main_fails_on_regression(tmp_path, capsys):
+    path = tmp_path / "baseline.json"
+    options = ["--only", "Deck.build", "--scale", "0.01", "--repeat", "1", "--retries", "0"]
+    assert main(options + ["--save", str(path)]) == 0
+    results = load_baseline(path)
+
+    # A baseline that is far faster than anything possible has to fail, a far slower one to pass
+    results["Deck.build"]["ops_per_second"] *= 1000
+    save_baseline(results, path)
+    assert main(options + ["--baseline", str(path)]) == 1
+    assert "REGRESSION Deck.build" in capsys.readouterr().out
+    results["Deck.build"]["ops_per_second"] /= 1e6
+    save_baseline(results, path)
+    assert main(options + ["--baseline", str(path)]) == 0
@@ -0,0 +1,69 @@
+import json
+import numpy as np
+import pytest
+from poker_python_challenge_answers import hand_ranking, hand_strength, encode_hand, winner_is
+from poker_cli import main
+
+
+# Test the command line
+
+hands = [["Kh", "As", "5c", "3d", "4h"], ["10h", "Jh", "Qh", "Kh", "Ah"],
+         ["2h", "2d", "7c", "7s", "9h"]]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_rank_text(tmp_path, capsys, workers):
+    path = tmp_path / "hands.txt"
+    output_path = tmp_path / "ranked.txt"
+    path.write_text("".join(" ".join(hand) + "\n" for hand in hands))
+    assert main(["rank", str(path), "-o", str(output_path), "--workers", str(workers)]) == 0
+    assert output_path.read_text().splitlines() == \
+        [f"{hand_ranking(hand)},{hand_strength(hand)}" for hand in hands]
+    assert "rank: 3 hands in" in capsys.readouterr().err
+
+
+def test_rank_binary(tmp_path):
+    path = tmp_path / "hands.bin"
+    output_path = tmp_path / "ranked.bin"
+    path.write_bytes(bytes(card for hand in hands for card in encode_hand(hand)))
+    main(["rank", str(path), "-o", str(output_path), "--format", "binary", "--batch-size", "2"])
+    strengths = np.frombuffer(output_path.read_bytes(), dtype="<u4")
+    assert strengths.tolist() == [hand_strength(hand) for hand in hands]
+
+
+def test_rank_binary_rejects_partial_hand(tmp_path):
+    path = tmp_path / "hands.bin"
+    path.write_bytes(bytes(7))
+    with pytest.raises(ValueError):
+        main(["rank", str(path), "-o", str(tmp_path / "ranked.bin"), "--format", "binary"])
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_winner_json(tmp_path, workers):
+    tables = {"first": {"Noor": hands[0], "Hagen": hands[1]},
+              "second": {"Noor": hands[2], "Hagen": hands[0], "Sadie": hands[2]}}
+    path = tmp_path / "tables.json"
+    output_path = tmp_path / "winners.json"
+    path.write_text(json.dumps(tables))
+    main(["winner", str(path), "-o", str(output_path), "--workers", str(workers),
+          "--batch-size", "1"])
+    assert json.loads(output_path.read_text()) == \
+        {name: winner_is(players) for name, players in tables.items()}
+
+
+def test_winner_csv(tmp_path):
+    path = tmp_path / "tables.csv"
+    output_path = tmp_path / "winners.csv"
+    path.write_text("1,Noor,Kh,As,5c,3d,4h\n1,Hagen,2h 2d 7c 7s 9h\n2,Noor,2h,3h,4h,5h,6h\n")
+    main(["winner", str(path), "-o", str(output_path), "--format", "csv"])
+    assert output_path.read_text().splitlines() == ["1,Hagen", "2,Noor"]
+
+
+def test_simulate(tmp_path):
+    output_path = tmp_path / "equity.json"
+    main(["simulate", "--deals", "2000", "--players", "3", "--known", "Noor=Ah As", "--seed", "5",
+          "--format", "json", "-o", str(output_path)])
+    result = json.loads(output_path.read_text())
+    assert result["trials"] == 2000
+    assert list(result["players"]) == ["Noor", "Opponent 1", "Opponent 2"]
+    assert result["players"]["Noor"]["win"] > 0.5
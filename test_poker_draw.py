@@ -0,0 +1,111 @@
+import random
+from itertools import combinations
+from math import comb
+import numpy as np
+import pytest
+from poker_python_challenge_answers import Deck, encode_hand, hand_names, hand_ranking_batch
+from poker_draw import colex_combinations, colex_index, get_draw_tables, solve_draw, \
+    solve_draws, save_draw_tables, load_or_build_draw_tables
+
+
+# Test the draw solver
+
+def brute_force(hand, deck, discard):
+    # Rank every draw onto the kept cards, as the chance of each kind of hand
+    kept = [card for card in encode_hand(hand) if card not in encode_hand(discard)]
+    draws = [kept + list(draw) for draw in combinations(encode_hand(deck), len(discard))]
+    counts = np.bincount(hand_ranking_batch(np.array(draws, dtype=np.uint8)), minlength=11)
+    return {hand_names[score]: counts[score] / len(draws) for score in range(10, 0, -1)}
+
+
+@pytest.mark.parametrize("num_items, size", [(52, 2), (10, 3), (7, 0), (5, 5)])
+def test_colex_combinations(num_items, size):
+    combos = colex_combinations(num_items, size)
+    assert combos.shape == (comb(num_items, size), size)
+    assert [colex_index(combo) for combo in combos.tolist()] == list(range(len(combos)))
+    assert sorted(map(tuple, combos.tolist())) == list(combinations(range(num_items), size))
+
+
+def test_draw_tables():
+    tables = get_draw_tables()
+    assert tables[0][0].tolist() == [0, 1302540, 1098240, 123552, 54912, 10200, 5108, 3744, 624,
+                                     36, 4]
+    # Every hand holds 5 single cards, 10 pairs of cards, and so on
+    for size in range(5):
+        assert tables[size].sum() == comb(52, 5) * comb(5, size)
+    assert tables[4][colex_index(encode_hand(["10h", "Jh", "Qh", "Kh"]))][10] == 1
+
+
+def test_draw_tables_file(tmp_path):
+    path = save_draw_tables(tmp_path / "draw.npz")
+    loaded = load_or_build_draw_tables(path)
+    assert all((saved == table).all() for saved, table in zip(loaded, get_draw_tables()))
+
+
+@pytest.mark.parametrize("hand", [["Ah", "Kh", "Qh", "Jh", "2c"], ["2h", "2d", "7c", "7s", "9h"],
+                                  ["10s", "Js", "Qd", "Kc", "3h"]])
+def test_solve_draw_matches_brute_force(hand):
+    options = solve_draw(hand)
+    assert len(options) == 32
+    assert [option["ev"] for option in options] == \
+        sorted((option["ev"] for option in options), reverse=True)
+    deck = [card for card in Deck().full_deck() if card not in hand]
+    for option in options:
+        assert option["method"] == "exact"
+        assert option["draws"] == comb(47, len(option["discard"]))
+        assert sorted(option["keep"] + option["discard"]) == sorted(hand)
+        if len(option["discard"]) <= 3:
+            assert option["categories"] == pytest.approx(brute_force(hand, deck,
+                                                                     option["discard"]))
+
+
+def test_solve_draw_with_dealt_deck():
+    # With the cards of other players gone, both exact ways of counting are used
+    deck = Deck(rng=random.Random(0))
+    deck.build()
+    hand = ["Ah", "Ad", "8c", "9c", "10c"]
+    for card in hand:
+        deck.cards.remove(card)
+    deck.deal_random(17)
+    options = solve_draw(hand, deck)
+    for option in options:
+        assert option["method"] == "exact"
+        assert option["categories"] == pytest.approx(brute_force(hand, deck.cards,
+                                                                 option["discard"]))
+
+
+def test_solve_draw_sampled():
+    hand = ["Ah", "Kh", "Qh", "Jh", "2c"]
+    exact = {tuple(option["discard"]): option for option in solve_draw(hand)}
+    sampled = solve_draw(hand, exact_limit=0, samples=20000, rng=4)
+    assert sampled == solve_draw(hand, exact_limit=0, samples=20000, rng=4)
+    for option in sampled:
+        assert option["method"] == "sampled"
+        expected = exact[tuple(option["discard"])]
+        assert option["ev"] == pytest.approx(expected["ev"], abs=0.05)
+
+
+def test_solve_draw_payouts_and_errors():
+    payouts = {"Royal Flush": 800, "Straight Flush": 50, "Four of a Kind": 25, "Full House": 9,
+               "Flush": 6, "Straight": 4, "Three of a Kind": 3, "Two Pair": 2}
+    options = solve_draw(["Ah", "Kh", "Qh", "Jh", "10h"], payouts=payouts)
+    assert options[0]["discard"] == [] and options[0]["ev"] == 800
+    with pytest.raises(ValueError):
+        solve_draw(["Ah", "Ah", "Qh", "Jh", "10h"])
+    with pytest.raises(ValueError):
+        solve_draw(["Ah", "Kh", "Qh", "Jh", "10h"], deck=["Ah", "2c"])
+
+
+def test_solve_draw_ties_discard_fewest_first():
+    # With nothing paid every option is worth 0, so they are ordered by the number of discards;
+    # building them in order of the discard masks would put two discards (mask 3) before one
+    options = solve_draw(["2h", "2d", "7c", "7s", "9h"], payouts={})
+    assert all(option["ev"] == 0 for option in options)
+    sizes = [len(option["discard"]) for option in options]
+    assert sizes == sorted(sizes)
+    assert options[0]["discard"] == []
+
+
+def test_solve_draws():
+    hands = [["2h", "2d", "7c", "7s", "9h"], ["Ah", "Kh", "Qh", "Jh", "2c"]]
+    assert solve_draws(hands, workers=2) == [solve_draw(hand) for hand in hands]
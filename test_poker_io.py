@@ -0,0 +1,209 @@
+import random
+import numpy as np
+import pytest
+from poker_python_challenge_answers import hand_ranking, hand_strength, encode_hand, deal_cards, \
+    deal_cards_batch, winner_is, winners_batch, Deck
+from poker_io import parse_hands, parse_line, read_line_blocks, iter_ranked_file, rank_file, \
+    DealWriter, DealFile, write_deals, pack_cards, unpack_cards
+
+
+# Test parsing hands
+
+@pytest.mark.parametrize("data", [b"Kh As 5c 3d 4h\n10h Jh Qh Kh Ah\n",
+                                  b"Kh As 5c 3d 4h\r\nTh Jh Qh Kh Ah",
+                                  b"Kh,As,5c,3d,4h\nTh,Jh,Qh,Kh,Ah\n",
+                                  b"Kh  As 5c 3d 4h\n10h, Jh, Qh, Kh, Ah\n"])
+def test_parse_hands(data):
+    hands = parse_hands(data)
+    assert hands.tolist() == [encode_hand(["Kh", "As", "5c", "3d", "4h"]),
+                              encode_hand(["10h", "Jh", "Qh", "Kh", "Ah"])]
+
+
+@pytest.mark.parametrize("line", [b"Kh As 5c 3d", b"Kh As 5c 3d 4h 5h", b"Kh As 5c 3d 1h"])
+def test_parse_line_rejects_bad_lines(line):
+    with pytest.raises(ValueError):
+        parse_line(line, 1)
+    with pytest.raises(ValueError):
+        parse_hands(b"Kh As 5c 3d 4h\n" + line + b"\n")
+
+
+@pytest.mark.parametrize("data", [b"Kh As 5c 3d 4h\n\n", b"\nKh As 5c 3d 4h\n  \n\n",
+                                  b"Kh As 5c 3d 4h\r\n\r\n \t\n"])
+def test_parse_hands_skips_empty_lines(data):
+    assert parse_hands(data).tolist() == [encode_hand(["Kh", "As", "5c", "3d", "4h"])]
+    with pytest.raises(ValueError):
+        parse_line(b"", 1)
+
+
+@pytest.mark.parametrize("data", [b"Kh As 5c 3d 4h\nAh Ah Ah Ah Ah\n",
+                                  b"Kh As 5c 3d 4h\nAh Ah Kd Kc Ks\n",
+                                  b"Kh As 5c 3d 4h\n10h Jh Qh Kh 10h\n"])
+def test_parse_hands_rejects_repeated_cards(data):
+    # The first two are read by the fixed width path, the last one line at a time
+    with pytest.raises(ValueError, match="line 2: the same card"):
+        parse_hands(data)
+    with pytest.raises(ValueError, match="line 7: the same card"):
+        parse_line(data.splitlines()[1], 7)
+
+
+# Test reading and ranking files
+
+def write_hands(path, num_hands, seed=0):
+    rng = random.Random(seed)
+    deck = [rank + suit for suit in "hdcs" for rank in
+            ["2", "3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K", "A"]]
+    hands = [rng.sample(deck, 5) for _ in range(num_hands)]
+    with open(path, "w") as file:
+        for hand in hands:
+            file.write(" ".join(hand) + "\n")
+    return hands
+
+
+@pytest.mark.parametrize("block_size, num_ranges", [(7, 1), (64, 3), (1000, 4), (1 << 20, 2)])
+def test_read_line_blocks_splits_on_lines(tmp_path, block_size, num_ranges):
+    path = tmp_path / "hands.txt"
+    write_hands(path, 200)
+    data = path.read_bytes()
+    bounds = [len(data) * num // num_ranges for num in range(num_ranges + 1)]
+    blocks = [block for start, end in zip(bounds, bounds[1:])
+              for block in read_line_blocks(path, block_size, start, end)]
+    assert all(block.endswith(b"\n") for block in blocks)
+    assert b"".join(blocks) == data
+
+
+def test_iter_ranked_file(tmp_path):
+    path = tmp_path / "hands.txt"
+    hands = write_hands(path, 500)
+    strengths = [strength for block in iter_ranked_file(path, block_size=1000)
+                 for strength in block.tolist()]
+    assert strengths == [hand_strength(hand) for hand in hands]
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_rank_file(tmp_path, workers):
+    path = tmp_path / "hands.txt"
+    output_path = tmp_path / "ranked.txt"
+    hands = write_hands(path, 2000)
+    stats = rank_file(path, output_path, block_size=4096, workers=workers)
+    assert stats["lines"] == 2000
+    assert stats["lines_per_second"] > 0
+    assert output_path.read_text().splitlines() == \
+        [f"{hand_ranking(hand)},{hand_strength(hand)}" for hand in hands]
+
+
+def test_rank_file_errors_name_the_line(tmp_path):
+    path = tmp_path / "hands.txt"
+    write_hands(path, 2000)
+    lines = path.read_bytes().splitlines(keepends=True)
+    # An empty line is skipped but still counted
+    lines.insert(10, b"\n")
+    lines[1500] = b"Ah Ah Kd Kc Ks\n"
+    path.write_bytes(b"".join(lines))
+    with pytest.raises(ValueError, match="^line 1501: the same card"):
+        rank_file(path, tmp_path / "ranked.txt", block_size=4096)
+    # With two workers the second starts half way through the file, and says from which byte
+    start = path.stat().st_size // 2
+    offsets = np.cumsum([0] + [len(line) for line in lines])
+    line_in_range = 1500 - np.searchsorted(offsets, start) + 1
+    with pytest.raises(ValueError,
+                       match=f"^in the lines from byte {start}: line {line_in_range}: the same"):
+        rank_file(path, tmp_path / "ranked.txt", block_size=4096, workers=2)
+
+
+# Test binary deal files
+
+@pytest.mark.parametrize("num_cards", [1, 3, 4, 5, 10, 45])
+def test_pack_cards(num_cards):
+    cards = np.random.default_rng(num_cards).integers(0, 52, (100, num_cards), dtype=np.uint8)
+    packed = pack_cards(cards, 6)
+    assert packed.shape == (100, (num_cards * 6 + 7) // 8)
+    # The same bits as writing each card's 6 bits one after the other
+    bits = np.unpackbits(cards[..., np.newaxis], axis=-1)[..., 2:].reshape(100, -1)
+    assert (packed == np.packbits(bits, axis=1)).all()
+    assert (unpack_cards(packed, num_cards, 6) == cards).all()
+
+
+@pytest.mark.parametrize("card_bits", [8, 6])
+def test_deal_file_round_trip(tmp_path, card_bits):
+    path = tmp_path / "deals.bin"
+    player_list = ["Noor", "Hagen", "Sadie"]
+    deals = deal_cards_batch(1000, 3, rng=4)
+    with DealWriter(path, player_list, seed=4, card_bits=card_bits) as writer:
+        writer.write(deals[:600])
+        writer.write(deals[600:])
+    # Header, the names padded to 16 bytes, then 15 bytes per deal or 90 bits rounded up to 12
+    assert path.stat().st_size == 40 + 16 + 1000 * {8: 15, 6: 12}[card_bits]
+
+    with DealFile(path) as deal_file:
+        assert len(deal_file) == 1000
+        assert deal_file.seed == 4
+        assert deal_file.player_list == player_list
+        assert (deal_file.deals() == deals).all()
+        assert (np.concatenate(list(deal_file.iter_deals(chunk_size=300))) == deals).all()
+        assert (deal_file.deals(990, 2000) == deals[990:]).all()
+        # Replay straight into the evaluators
+        assert (winners_batch(deal_file.deals()) == winners_batch(deals)).all()
+        tables = deal_file.tables(0, 50)
+        assert [winner_is(players) for players in tables] == \
+            [[name for name, won in zip(player_list, mask) if won]
+             for mask in winners_batch(deals[:50]).tolist()]
+
+
+def test_deal_file_is_zero_copy(tmp_path):
+    path = tmp_path / "deals.bin"
+    write_deals(path, deal_cards_batch(100, 2, rng=0))
+    with DealFile(path) as deal_file:
+        deals = deal_file.deals()
+        assert not deals.flags.writeable
+        assert not deals.flags.owndata
+        assert deal_file.player_list == ["Player 1", "Player 2"]
+        assert deal_file.seed is None
+
+
+def test_write_deals_from_deal_cards(tmp_path):
+    path = tmp_path / "deals.bin"
+    deck = Deck(rng=random.Random(0))
+    deck.build()
+    deals = [deal_cards(["Noor", "Hagen"], deck=deck) for _ in range(20)]
+    write_deals(path, deals, card_bits=6)
+    with DealFile(path) as deal_file:
+        assert deal_file.tables() == \
+            [{name: encode_hand(hand) for name, hand in players.items()} for players in deals]
+
+
+def test_deal_file_rejects_bad_files(tmp_path):
+    path = tmp_path / "deals.bin"
+    path.write_bytes(b"not a deal file" * 10)
+    with pytest.raises(ValueError):
+        DealFile(path)
+    write_deals(path, deal_cards_batch(10, 2, rng=0))
+    path.write_bytes(path.read_bytes()[:-1])
+    with pytest.raises(ValueError):
+        DealFile(path)
+    with pytest.raises(ValueError):
+        DealWriter(tmp_path / "other.bin", ["Noor"], card_bits=7)
+
+
+@pytest.mark.parametrize("seed", [-1, 1 << 64, 1.5, "7"])
+def test_deal_writer_rejects_bad_seeds(tmp_path, seed):
+    with pytest.raises(ValueError):
+        DealWriter(tmp_path / "deals.bin", ["Noor"], seed=seed)
+
+
+@pytest.mark.parametrize("card_bits", [6, 8])
+@pytest.mark.parametrize("card", [52, 64, 300, -1])
+def test_deal_writer_rejects_bad_cards(tmp_path, card_bits, card):
+    deals = np.array([[[0, 1, 2, 3, card]]])
+    with DealWriter(tmp_path / "deals.bin", ["Noor"], card_bits=card_bits) as writer:
+        with pytest.raises(ValueError):
+            writer.write(deals)
+        with pytest.raises(ValueError):
+            writer.write([{"Noor": [0, 1, 2, 3, card]}])
+        with pytest.raises(ValueError):
+            writer.write(deals.astype(float))
+    assert DealFile(tmp_path / "deals.bin").count == 0
+
+
+def test_deal_writer_largest_seed(tmp_path):
+    write_deals(tmp_path / "deals.bin", deal_cards_batch(3, 2, rng=0), seed=(1 << 64) - 1)
+    assert DealFile(tmp_path / "deals.bin").seed == (1 << 64) - 1
@@ -0,0 +1,91 @@
+import json
+import pytest
+import poker_python_challenge_answers as poker
+import poker_metrics
+from poker_cli import main
+
+
+# Test instrumentation
+
+@pytest.fixture
+def instrumented():
+    poker_metrics.reset()
+    poker_metrics.enable()
+    yield poker_metrics
+    poker_metrics.disable()
+    poker_metrics.reset()
+
+
+def test_disabled_functions_are_the_originals():
+    hand_ranking = poker.hand_ranking
+    deal_random = poker.Deck.deal_random
+    poker_metrics.enable()
+    assert poker_metrics.is_enabled()
+    assert poker.hand_ranking is not hand_ranking
+    poker_metrics.disable()
+    assert not poker_metrics.is_enabled()
+    assert poker.hand_ranking is hand_ranking
+    assert poker.Deck.deal_random is deal_random
+    # Names imported into this module are put back as well
+    assert main.__globals__["winner_is"] is poker.winner_is
+
+
+def test_counts_calls_and_categories(instrumented):
+    assert poker.hand_ranking(["Kh", "As", "5c", "3d", "4h"]) == "High Card"
+    assert poker.hand_ranking(["2h", "2d", "5c", "3d", "4h"]) == "Pair"
+    poker.hand_strength(["2h", "2d", "5c", "3d", "4h"])
+    poker.winner_is(poker.deal_cards(["Noor", "Hagen"], rng=poker.random.Random(0)))
+
+    snapshot = instrumented.snapshot()
+    functions = snapshot["functions"]
+    assert functions["hand_ranking"]["calls"] == 2
+    assert sum(functions["hand_ranking"]["buckets"].values()) == 2
+    assert functions["hand_ranking"]["seconds"] > 0
+    assert functions["deal_cards"]["calls"] == 1
+    assert functions["Deck.deal_random"]["calls"] == 2
+    # winner_is ranks both hands with hand_strength
+    assert functions["hand_strength"]["calls"] == 3
+    assert snapshot["categories"]["hand_ranking"]["High Card"] == 1
+    assert snapshot["categories"]["hand_ranking"]["Pair"] == 1
+    assert sum(snapshot["categories"]["hand_strength"].values()) == 3
+
+
+def test_counts_predicates(instrumented):
+    poker.classify_sorted_hand(poker.sort_cards(["2h", "2d", "2c", "3d", "3h"]))
+    snapshot = instrumented.snapshot()
+    assert snapshot["categories"]["classify_sorted_hand"]["Full House"] == 1
+    assert snapshot["predicate_true"]["is_full_house"] == 1
+    assert snapshot["functions"]["is_royal_flush"]["calls"] == 1
+    # The checks stop at the first one that is true, so two pair is never checked
+    assert "is_two_pair" not in snapshot["functions"]
+
+
+def test_counts_batches(instrumented):
+    hands = poker.deal_cards_batch(1000, 1, rng=0).reshape(-1, 5)
+    strengths = poker.hand_ranking_batch(hands, strength=True)
+    counts = instrumented.snapshot()["categories"]["hand_ranking_batch"]
+    assert sum(counts.values()) == 1000
+    assert counts["High Card"] == (strengths >> 20 == poker.score_hands["High Card"]).sum()
+
+
+def test_prometheus_and_json_dump(instrumented, tmp_path):
+    poker.hand_ranking(["Kh", "As", "5c", "3d", "4h"])
+    text = instrumented.metrics.to_prometheus()
+    assert 'poker_call_seconds_bucket{function="hand_ranking",le="+Inf"} 1' in text
+    assert 'poker_call_seconds_count{function="hand_ranking"} 1' in text
+    assert 'poker_hands_total{function="hand_ranking",category="High Card"} 1' in text
+
+    path = tmp_path / "metrics.json"
+    instrumented.dump(path)
+    assert json.loads(path.read_text()) == instrumented.snapshot()
+
+
+def test_cli_metrics(tmp_path):
+    path = tmp_path / "hands.txt"
+    path.write_text("Kh As 5c 3d 4h\n")
+    metrics_path = tmp_path / "metrics.prom"
+    main(["rank", str(path), "-o", str(tmp_path / "ranked.txt"), "--metrics", str(metrics_path)])
+    assert not poker_metrics.is_enabled()
+    assert 'poker_hands_total{function="hand_ranking_batch",category="High Card"} 1' in \
+        metrics_path.read_text()
+    poker_metrics.reset()
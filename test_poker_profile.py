@@ -0,0 +1,92 @@
+import sys
+import time
+from collections import Counter
+import pytest
+from poker_python_challenge_answers import hand_ranking, sort_cards
+from poker_profile import StackSampler, StackTracer, collapse_stacks, hotspots, \
+    make_decks, measure_allocations, run_workload, workloads, profile_workload, main as profile_main
+from poker_cli import main
+
+
+# Test the profiling harness
+
+def test_collapse_stacks_and_hotspots():
+    stacks = Counter({"main;rank;lookup": 6, "main;rank": 2, "main;deal": 2})
+    assert collapse_stacks(stacks) == "main;deal 2\nmain;rank 2\nmain;rank;lookup 6\n"
+    rows = hotspots(stacks)
+    assert [row["function"] for row in rows] == ["lookup", "rank", "deal", "main"]
+    assert rows[0]["self_share"] == 0.6
+    assert rows[1]["total"] == 8
+    assert rows[3]["total_share"] == 1.0
+    assert len(hotspots(stacks, limit=2)) == 2
+
+
+def test_stack_tracer():
+    with StackTracer() as tracer:
+        for _ in range(100):
+            sort_cards(["Kh", "As", "5c", "3d", "4h"])
+    assert sys.getprofile() is None
+    names = [stack.split(";") for stack in tracer.stacks]
+    assert all(stack[0].endswith("test_stack_tracer") for stack in names)
+    assert any(stack[-1].endswith(".convert_card_to_numeric") for stack in names)
+    assert any(stack[-1] == "builtins.sorted" for stack in names)
+
+
+def test_stack_sampler():
+    with StackSampler(interval=0.001) as sampler:
+        end = time.perf_counter() + 0.2
+        while time.perf_counter() < end:
+            hand_ranking(["Kh", "As", "5c", "3d", "4h"])
+    assert sum(sampler.stacks.values()) > 0
+    assert all(stack.split(";")[0].endswith("test_stack_sampler") for stack in sampler.stacks)
+
+
+def test_measure_allocations():
+    kept = []
+    hands = [["Kh", "As", "5c", "3d", "4h"]] * 100
+    # sort_cards makes a tuple per card and frees them all, keeping a list of cards keeps them
+    sorting = measure_allocations(sort_cards, hands)
+    keeping = measure_allocations(lambda hand: kept.append(sort_cards(hand)), hands)
+    assert sorting["calls"] == 100
+    assert sorting["peak_bytes_per_call"] > 0
+    assert sorting["retained_bytes_per_call"] < keeping["retained_bytes_per_call"]
+    assert any("poker_python_challenge_answers.py" in line for line, *_ in keeping["top_lines"])
+
+
+@pytest.mark.parametrize("mode", ["sample", "trace"])
+def test_profile_workload(mode):
+    result = profile_workload("sort_cards", num_inputs=200, mode=mode, min_seconds=0.1)
+    assert result["calls"] >= 200
+    assert result["memory"]["calls"] == 200
+    functions = [row["function"] for row in result["hotspots"]]
+    assert "poker_python_challenge_answers.sort_cards" in functions
+    with pytest.raises(ValueError):
+        profile_workload("nothing")
+
+
+def test_build_deck_workload():
+    # Repeating the workload builds each deck again rather than adding to it
+    func, _ = workloads["Deck.build"]
+    decks = make_decks(3)
+    assert run_workload(func, decks, min_seconds=0.05) > 3
+    assert all(len(deck.cards) == 52 for deck in decks)
+
+
+def test_profile_main(tmp_path, capsys):
+    path = tmp_path / "stacks.txt"
+    assert profile_main(["deal_cards", "--inputs", "100", "--seconds", "0", "--mode", "trace",
+                         "--flame", str(path)]) == 0
+    assert "poker_python_challenge_answers.deal_cards" in path.read_text()
+    assert "bytes at peak per call" in capsys.readouterr().out
+
+
+def test_cli_profile(tmp_path, capsys):
+    path = tmp_path / "hands.txt"
+    path.write_text("Kh As 5c 3d 4h\n" * 100)
+    profile_path = tmp_path / "stacks.txt"
+    main(["rank", str(path), "-o", str(tmp_path / "ranked.txt"), "--profile", str(profile_path),
+          "--profile-mode", "trace", "--profile-memory"])
+    assert "poker_cli.run_rank" in profile_path.read_text()
+    err = capsys.readouterr().err
+    assert "self %" in err
+    assert "per hand" in err
@@ -1,7 +1,18 @@
+import pickle
+import random
+import tracemalloc
+from collections import Counter
+from itertools import combinations
+import numpy as np
 import pytest
 from poker_python_challenge_answers import Deck, Player, Card, hand_ranking, deal_cards, \
     winner_is, convert_card_to_numeric, is_flush, is_four_kind, is_three_kind, is_straight_flush, \
-    is_straight, is_royal_flush, is_full_house, is_two_pair, is_pair, sort_cards
+    is_straight, is_royal_flush, is_full_house, is_two_pair, is_pair, sort_cards, \
+    classify_sorted_hand, hand_strength, encode_card, decode_card, encode_hand, decode_hand, \
+    hand_ranking_batch, score_hands, shuffle_batch, deal_cards_batch, best_hand_strength, \
+    best_hand_ranking, build_all_tables, save_lookup_tables, load_lookup_tables, \
+    load_or_build_tables, canonical_hand_key, HandCache, winners_batch, HandState, \
+    best_hand_strength_batch, iter_deals, card_code
 
 
 # Test Functions (boolean hand checks, hand ranking, dealing cards, sorting cards, converting
@@ -23,6 +34,193 @@ def test_hand_ranking(sample_hands, expected_result):
     assert result == expected_result
 
 
+def test_hand_ranking_matches_predicates_for_every_hand():
+    deck = Deck()
+    deck.build()
+    # Sorting the deck by rank once means every combination comes out already sorted
+    numeric_cards = {card: convert_card_to_numeric(card) for card in deck.cards}
+    cards = sorted(deck.cards, key=lambda card: numeric_cards[card][0])
+    # The boolean checks only look at the ranks and whether every suit matches, so their answer
+    # is saved per (ranks, flush) pair instead of being recomputed for all 2,598,960 hands
+    predicate_results = {}
+    counts = Counter()
+    for hand in combinations(cards, 5):
+        result = hand_ranking(hand)
+        sorted_hand = [numeric_cards[card] for card in hand]
+        key = (tuple(card[0] for card in sorted_hand), is_flush(sorted_hand))
+        if key not in predicate_results:
+            predicate_results[key] = classify_sorted_hand(sorted_hand)
+        assert result == predicate_results[key]
+        counts[result] += 1
+
+    assert counts == {"Royal Flush": 4, "Straight Flush": 36, "Four of a Kind": 624,
+                      "Full House": 3744, "Flush": 5108, "Straight": 10200,
+                      "Three of a Kind": 54912, "Two Pair": 123552, "Pair": 1098240,
+                      "High Card": 1302540}
+
+
+@pytest.mark.parametrize("sample_hands, expected_result",
+                         [(["2h", "As", "5c", "3d", "4h"], "Straight"),
+                          (["10s", "As", "Qs", "Js", "Ks"], "Royal Flush"),
+                          (["2h", "2s", "2c", "8d", "8h"], "Full House"),
+                          (["Kh", "As", "5c", "3d", "4h"], "High Card"), ])
+def test_hand_ranking_encoded(sample_hands, expected_result):
+    encoded_hand = encode_hand(sample_hands)
+    assert hand_ranking(encoded_hand) == expected_result
+    assert hand_strength(encoded_hand) == hand_strength(sample_hands)
+
+
+def test_hand_ranking_batch_matches_hand_strength_for_every_hand():
+    hands = np.array(list(combinations(range(52), 5)), dtype=np.uint8)
+    expected = np.array([hand_strength(hand) for hand in hands.tolist()])
+    assert (hand_ranking_batch(hands, strength=True) == expected).all()
+    assert (hand_ranking_batch(hands) == expected >> 20).all()
+
+
+def test_hand_ranking_batch_scores():
+    hands = [encode_hand(["2h", "As", "5c", "3d", "4h"]),
+             encode_hand(["10s", "As", "Qs", "Js", "Ks"]),
+             encode_hand(["6h", "6s", "4c", "3d", "4h"])]
+    result = hand_ranking_batch(hands)
+    assert [int(score) for score in result] == [score_hands["Straight"],
+                                                score_hands["Royal Flush"],
+                                                score_hands["Two Pair"]]
+
+
+def test_hand_ranking_batch_rejects_wrong_shape():
+    with pytest.raises(ValueError):
+        hand_ranking_batch(np.zeros((3, 4), dtype=np.uint8))
+
+
+@pytest.mark.parametrize("hand, message", [([12, 12, 12, 12, 12], "hand 3 holds the same card"),
+                                           ([12, 12, 11, 24, 37], "hand 3 holds the same card"),
+                                           ([0, 1, 2, 3, 52], "hand 3 holds a number"),
+                                           ([0, 1, 2, 3, -1], "hand 3 holds a number"),
+                                           ([0, 1, 2, 3, 65541], "hand 3 holds a number")])
+def test_hand_ranking_batch_rejects_bad_cards(hand, message):
+    # 65541 would wrap around to the card 5 as an int16
+    hands = np.array([[0, 1, 2, 3, 4]] * 3 + [hand], dtype=np.int64)
+    with pytest.raises(ValueError, match=message):
+        hand_ranking_batch(hands, chunk_size=2)
+
+
+def test_hand_ranking_batch_rejects_floats():
+    with pytest.raises(ValueError, match="integer cards"):
+        hand_ranking_batch(np.array([[0.5, 1, 2, 3, 9.9]]))
+    with pytest.raises(ValueError, match="integer cards"):
+        hand_ranking_batch(np.array([[0.0, 1, 2, 3, 9]]))
+
+
+@pytest.mark.parametrize("num_cards", [5, 6, 7])
+def test_best_hand_strength_matches_brute_force(num_cards):
+    rng = random.Random(num_cards)
+    for _ in range(20000):
+        cards = rng.sample(range(52), num_cards)
+        expected = max(hand_strength(hand) for hand in combinations(cards, 5))
+        assert best_hand_strength(cards) == expected
+
+
+@pytest.mark.parametrize("num_cards", [5, 6, 7])
+def test_best_hand_strength_batch_matches_best_hand_strength(num_cards):
+    hands = shuffle_batch(20000, rng=num_cards)[:, :num_cards]
+    expected = [best_hand_strength(hand) for hand in hands.tolist()]
+    assert best_hand_strength_batch(hands).tolist() == expected
+
+
+def test_best_hand_strength_batch_rejects_wrong_shape():
+    with pytest.raises(ValueError):
+        best_hand_strength_batch(np.zeros((3, 4), dtype=np.uint8))
+
+
+@pytest.mark.parametrize("cards, expected_result",
+                         [(["2h", "As", "5c", "3d", "4h", "Kd", "Kc"], "Straight"),
+                          (["9h", "Ah", "5h", "3h", "4h", "2h", "Ac"], "Straight Flush"),
+                          (["10s", "As", "Qs", "Js", "Ks", "9s", "8s"], "Royal Flush"),
+                          (["2h", "2s", "2c", "8d", "8h", "8s", "Ah"], "Full House"),
+                          (["6h", "6s", "4c", "4d", "3h", "3s", "Ad"], "Two Pair"),
+                          (["7h", "7s", "7c", "7d", "Kh", "Ks", "Kd"], "Four of a Kind"),
+                          (["Kh", "Qh", "9h", "3h", "2h", "Kd", "Ks"], "Flush"),
+                          (["Kh", "As", "5c", "3d", "4h", "9d"], "High Card")])
+def test_best_hand_ranking(cards, expected_result):
+    assert best_hand_ranking(cards) == expected_result
+
+
+def test_save_and_load_lookup_tables(tmp_path):
+    path = save_lookup_tables(str(tmp_path / "tables.bin"))
+    loaded = load_lookup_tables(path)
+    built = build_all_tables()
+    for loaded_table, built_table in zip(loaded, built):
+        if isinstance(built_table, dict):
+            assert loaded_table == built_table
+        else:
+            assert list(loaded_table) == list(built_table)
+
+
+def test_load_lookup_tables_rejects_damaged_file(tmp_path):
+    path = save_lookup_tables(str(tmp_path / "tables.bin"))
+    with open(path, "r+b") as file:
+        file.seek(-1, 2)
+        last_byte = file.read(1)
+        file.seek(-1, 2)
+        file.write(bytes([last_byte[0] ^ 1]))
+    with pytest.raises(ValueError):
+        load_lookup_tables(path)
+
+    with open(path, "wb") as file:
+        file.write(b"not a table file")
+    with pytest.raises(ValueError):
+        load_lookup_tables(path)
+
+
+def test_load_or_build_tables_without_file(tmp_path):
+    tables = load_or_build_tables(str(tmp_path / "missing.bin"))
+    assert list(tables[0]) == list(build_all_tables()[0])
+
+
+@pytest.mark.parametrize("hand1, hand2, same_key",
+                         [(["Ah", "Kh", "2d", "5c", "5s"], ["Ks", "5h", "2c", "As", "5d"], True),
+                          (["Ah", "Kh", "Qh", "Jh", "9h"], ["As", "Ks", "Qs", "Js", "9s"], True),
+                          (["Ah", "Kh", "Qh", "Jh", "9h"], ["As", "Ks", "Qs", "Js", "9d"], False),
+                          (["Ah", "Kh", "2d", "5c", "5s"], ["Ah", "Kd", "2d", "5c", "5s"], False)])
+def test_canonical_hand_key(hand1, hand2, same_key):
+    assert (canonical_hand_key(hand1) == canonical_hand_key(hand2)) == same_key
+    assert canonical_hand_key(encode_hand(hand1)) == canonical_hand_key(hand1)
+
+
+def test_hand_cache_hits_and_misses():
+    cache = HandCache()
+    assert cache.hand_ranking(["Ah", "Kh", "2d", "5c", "5s"]) == "Pair"
+    assert cache.hand_ranking(["Ks", "5h", "2c", "As", "5d"]) == "Pair"
+    assert cache.hand_strength(["As", "Ks", "Qs", "Js", "9s", "2h", "3h"]) == \
+        best_hand_strength(["As", "Ks", "Qs", "Js", "9s", "2h", "3h"])
+    assert cache.stats() == {"hits": 1, "misses": 2, "hit_rate": 1 / 3, "size": 2,
+                             "max_size": 200000}
+    cache.clear()
+    assert cache.stats()["size"] == 0
+    assert cache.stats()["hits"] == 0
+
+
+def test_hand_cache_removes_least_recently_used():
+    cache = HandCache(max_size=2)
+    pair = ["Ah", "Kh", "2d", "5c", "5s"]
+    flush = ["Ah", "Kh", "Qh", "Jh", "9h"]
+    straight = ["2h", "As", "5c", "3d", "4h"]
+    cache.warm([pair, flush])
+    cache.hand_strength(pair)
+    cache.hand_strength(straight)
+    assert canonical_hand_key(pair) in cache.strengths
+    assert canonical_hand_key(flush) not in cache.strengths
+    assert len(cache.strengths) == 2
+
+
+def test_hand_cache_winner_is():
+    cache = HandCache()
+    player_hands = {'Noor': ['Ah', 'As', '5c', '3d', '4h'], 'Hagen': ['2h', '2s', 'Kc', 'Qd', 'Jh']}
+    assert cache.winner_is(player_hands) == winner_is(player_hands)
+    assert cache.winner_is(player_hands, category_only=True) == \
+        winner_is(player_hands, category_only=True)
+
+
 @pytest.mark.parametrize("players", [["Noor", "Hagen", "Sadie", "Kunai"]])
 def test_deal_cards(players):
     result = deal_cards(players)
@@ -31,6 +229,139 @@ def test_deal_cards(players):
         assert len(hand) == 5
 
 
+@pytest.mark.parametrize("players", [["Noor", "Hagen", "Sadie", "Kunai"]])
+def test_deal_cards_reuses_deck(players):
+    deck = Deck()
+    deck.build()
+    for _ in range(3):
+        result = deal_cards(players, deck=deck)
+        dealt = [card for hand in result.values() for card in hand]
+        assert len(set(dealt)) == 20
+        assert len(deck.cards) == 32
+        assert not set(dealt) & set(deck.cards)
+
+
+@pytest.mark.parametrize("make_rng", [random.Random, np.random.default_rng])
+def test_deal_cards_with_seeded_rng(make_rng):
+    players = ["Noor", "Hagen", "Sadie", "Kunai"]
+    assert deal_cards(players, rng=make_rng(5)) == deal_cards(players, rng=make_rng(5))
+    assert deal_cards(players, rng=make_rng(5)) != deal_cards(players, rng=make_rng(6))
+
+
+def test_shuffle_batch():
+    decks = shuffle_batch(1000, rng=3)
+    assert decks.shape == (1000, 52)
+    assert (np.sort(decks, axis=1) == np.arange(52)).all()
+    assert (decks == shuffle_batch(1000, rng=3)).all()
+    assert len({tuple(deck) for deck in decks.tolist()}) == 1000
+
+
+def test_shuffle_batch_of_cards():
+    decks = shuffle_batch(10, rng=np.random.default_rng(0), cards=[3, 7, 11])
+    assert (np.sort(decks, axis=1) == [3, 7, 11]).all()
+
+
+def test_deal_cards_batch():
+    deals = deal_cards_batch(500, 4, rng=1)
+    assert deals.shape == (500, 4, 5)
+    assert all(len(set(deal)) == 20 for deal in deals.reshape(500, 20).tolist())
+    with pytest.raises(ValueError):
+        deal_cards_batch(1, 11)
+
+
+@pytest.mark.parametrize("num_players, hand_size", [(4, 5), (1, 7), (26, 2)])
+def test_iter_deals(num_players, hand_size):
+    batches = [batch.copy() for batch in iter_deals(num_players, hand_size, batch_size=400,
+                                                    num_deals=1000, rng=2)]
+    assert [len(batch) for batch in batches] == [400, 400, 200]
+    deals = np.concatenate(batches)
+    assert deals.shape == (1000, num_players, hand_size)
+    dealt = num_players * hand_size
+    assert all(len(set(deal)) == dealt for deal in deals.reshape(1000, dealt).tolist())
+    again = np.concatenate(list(batch.copy() for batch in
+                                iter_deals(num_players, hand_size, 400, 1000, rng=2)))
+    assert (deals == again).all()
+
+
+def test_iter_deals_reuses_memory():
+    deals = iter_deals(9, batch_size=1000, rng=0)
+    first = next(deals)
+    # Sending a number makes the next batch that size, in the same memory as the first
+    smaller = deals.send(10)
+    assert smaller.shape == (10, 9, 5)
+    assert np.shares_memory(first, smaller)
+    assert len(next(deals)) == 1000
+    tracemalloc.start()
+    next(deals)
+    before = tracemalloc.get_traced_memory()[0]
+    for _ in range(50):
+        next(deals)
+    assert tracemalloc.get_traced_memory()[0] - before < 1000
+    tracemalloc.stop()
+
+
+def test_iter_deals_cards_and_errors():
+    cards = encode_hand(["Ah", "Kh", "Qh", "Jh", "10h", "9h"])
+    deals = next(iter_deals(1, batch_size=50, rng=0, cards=cards))
+    assert set(deals.ravel().tolist()) <= set(cards)
+    with pytest.raises(ValueError):
+        next(iter_deals(2, cards=cards))
+
+
+def test_numpy_rows_are_ranked():
+    # Rows of the batch dealers are passed as they are, without .tolist()
+    deals = deal_cards_batch(200, 2, hand_size=7, rng=3)
+    names = ["Noor", "Hagen"]
+    for deal, listed in zip(deals, deals.tolist()):
+        assert best_hand_strength(deal[0]) == best_hand_strength(listed[0])
+        assert canonical_hand_key(deal[1]) == canonical_hand_key(listed[1])
+        hands = deal[:, :5]
+        assert hand_ranking(hands[0]) == hand_ranking(listed[0][:5])
+        assert hand_strength(hands[1]) == hand_strength(listed[1][:5])
+        assert winner_is(dict(zip(names, hands))) == \
+            winner_is(dict(zip(names, [hand[:5] for hand in listed])))
+        assert winner_is(dict(zip(names, hands)), category_only=True) == \
+            winner_is(dict(zip(names, [hand[:5] for hand in listed])), category_only=True)
+    card = next(iter_deals(1, rng=0))[0, 0, 0]
+    assert card_code(card) == int(card) and type(card_code(card)) is int
+    assert convert_card_to_numeric(card) == convert_card_to_numeric(int(card))
+
+
+@pytest.mark.parametrize("num_players", [2, 9])
+@pytest.mark.parametrize("category_only", [False, True])
+def test_winners_batch_matches_winner_is(num_players, category_only):
+    deals = deal_cards_batch(3000, num_players, rng=num_players)
+    masks = winners_batch(deals, category_only)
+    assert masks.shape == (3000, num_players)
+    names = [f"Player {num}" for num in range(num_players)]
+    for deal, mask in zip(deals.tolist(), masks.tolist()):
+        assert winner_is(dict(zip(names, deal)), category_only) == \
+            [name for name, won in zip(names, mask) if won]
+
+
+def test_winners_batch_ties():
+    tables = [[["2h", "2d", "5c", "3d", "4h"], ["2c", "2s", "5d", "3h", "4c"],
+               ["Ah", "Kd", "5s", "3c", "4d"]],
+              [["Ah", "Ad", "5c", "3d", "4h"], ["2c", "2s", "5d", "3h", "4c"],
+               ["Kh", "Kd", "9s", "3c", "4d"]]]
+    deals = [[encode_hand(hand) for hand in table] for table in tables]
+    assert winners_batch(deals).tolist() == [[True, True, False], [True, False, False]]
+    assert winners_batch(deals, category_only=True).tolist() == \
+        [[True, True, False], [True, True, True]]
+    with pytest.raises(ValueError):
+        winners_batch(np.zeros((3, 5), dtype=np.uint8))
+
+
+@pytest.mark.parametrize("players", [["Noor", "Hagen", "Sadie", "Kunai"]])
+def test_deal_cards_encoded(players):
+    result = deal_cards(players, encoded=True)
+    dealt = [card for hand in result.values() for card in hand]
+    assert all(type(card) is int and 0 <= card < 52 for card in dealt)
+    assert len(set(dealt)) == 20
+    assert winner_is(result) == winner_is({player: decode_hand(hand)
+                                           for player, hand in result.items()})
+
+
 @pytest.mark.parametrize("player_hands", [
     {'Noor': ['9h', '10s', '4h', 'Jc', '6c'], 'Hagen': ['6h', '6s', 'Qc', '9d', '9s'],
      'Sadie': ['10h', '2c', '5s', '2d', '3c'], 'Kunai': ['Ah', 'Qh', 'Kh', '10h', 'Jh']}])
@@ -39,12 +370,44 @@ def test_winner_is(player_hands):
     assert result == ["Kunai"]
 
 
+@pytest.mark.parametrize("player_hands, expected_result", [
+    ({'Noor': ['Ah', 'As', '5c', '3d', '4h'], 'Hagen': ['2h', '2s', 'Kc', 'Qd', 'Jh']}, ["Noor"]),
+    ({'Noor': ['Ah', 'As', '5c', '3d', '4h'], 'Hagen': ['Ac', 'Ad', '5h', '3s', '2h']}, ["Noor"]),
+    ({'Noor': ['Ah', '2s', '3c', '4d', '5h'], 'Hagen': ['6h', '2d', '3s', '4c', '5s']}, ["Hagen"]),
+    ({'Noor': ['Ah', 'Ks', '5c', '3d', '4h'], 'Hagen': ['Ac', 'Kd', '5h', '3s', '4s']},
+     ["Noor", "Hagen"])])
+def test_winner_is_breaks_ties_with_kickers(player_hands, expected_result):
+    assert winner_is(player_hands) == expected_result
+
+
+def test_winner_is_category_only():
+    player_hands = {'Noor': ['Ah', 'As', '5c', '3d', '4h'], 'Hagen': ['2h', '2s', 'Kc', 'Qd', 'Jh']}
+    assert winner_is(player_hands, category_only=True) == ["Noor", "Hagen"]
+
+
+@pytest.mark.parametrize("better_hand, worse_hand",
+                         [(["2h", "2s", "2c", "3d", "3h"], ["Ah", "As", "Kc", "Kd", "Qh"]),
+                          (["Kh", "Ks", "Kc", "2d", "2h"], ["Qh", "Qs", "Qc", "Ad", "Ah"]),
+                          (["6h", "6s", "5c", "5d", "3h"], ["6c", "6d", "5h", "5s", "2h"]),
+                          (["Ah", "Qh", "9h", "7h", "5h"], ["Kh", "Qh", "Jh", "9h", "7h"]),
+                          (["6h", "2s", "3c", "4d", "5h"], ["Ah", "2s", "3c", "4d", "5h"])])
+def test_hand_strength_orders_kickers(better_hand, worse_hand):
+    assert hand_strength(better_hand) > hand_strength(worse_hand)
+
+
 @pytest.mark.parametrize("card", ["As"])
 def test_convert_card_to_numeric(card):
     result = convert_card_to_numeric(card)
     assert result == (14, "s")
 
 
+@pytest.mark.parametrize("card, code", [("2h", 0), ("Ah", 12), ("2d", 13), ("10c", 34), ("As", 51)])
+def test_encode_decode_card(card, code):
+    assert encode_card(card) == code
+    assert decode_card(code) == card
+    assert convert_card_to_numeric(code) == convert_card_to_numeric(card)
+
+
 @pytest.mark.parametrize("hand, expected_result", [(["2h", "5h", "6h", "10h", "Ah"], True),
                                                    (["2h", "3s", "4c", "5d", "Ah"], False)])
 def test_is_flush(hand, expected_result):
@@ -125,7 +488,30 @@ def test_card_creation():
     assert card.suit == "h"
     assert card.val == "10"
     assert card.card == "10h"
-    assert card.num_card == ()
+    assert card.num_card == (10, "h")
+
+
+def test_card_is_interned_and_immutable():
+    card = Card("h", "10")
+    assert card is Card("h", "10")
+    assert card is not Card("d", "10")
+    assert pickle.loads(pickle.dumps(card)) is card
+    assert {card: 1}[Card("h", "10")] == 1
+    assert not hasattr(card, "__dict__")
+    with pytest.raises(AttributeError):
+        card.val = "J"
+    with pytest.raises(ValueError):
+        Card("x", "10")
+
+
+@pytest.mark.parametrize("hand", [["Kh", "As", "5c", "3d", "4h"], ["10h", "Jh", "Qh", "Kh", "Ah"],
+                                  ["2h", "2d", "7c", "7s", "7h"]])
+def test_card_objects_are_ranked(hand):
+    cards = [Card(card[-1], card[:-1]) for card in hand]
+    assert hand_ranking(cards) == hand_ranking(hand)
+    assert hand_strength(cards) == hand_strength(hand)
+    assert sort_cards(cards) == sort_cards(hand)
+    assert winner_is({"Noor": cards, "Hagen": hand}) == ["Noor", "Hagen"]
 
 
 def test_card_show():
@@ -172,6 +558,25 @@ def test_deck_build():
                           '8s', '9s', '10s', 'Js', 'Qs', 'Ks', 'As']
 
 
+def test_deck_build_card_objects():
+    deck = Deck(card_objects=True)
+    deck.build()
+    assert [card.show() for card in deck.cards] == Deck().full_deck()
+    assert all(card is Card(card.suit, card.val) for card in deck.cards)
+    player = Player("Noor")
+    player.draw(deck, 5, rng=random.Random(0))
+    assert all(type(card) is Card for card in player.show_hand())
+
+
+def test_deck_build_encoded():
+    deck = Deck()
+    deck.build()
+    encoded_deck = Deck(encoded=True)
+    encoded_deck.build()
+    assert encoded_deck.cards == encode_hand(deck.cards)
+    assert decode_hand(encoded_deck.cards) == deck.cards
+
+
 def test_deck_shuffle():
     deck = Deck()
     deck.build()
@@ -182,6 +587,39 @@ def test_deck_shuffle():
     assert deck.cards != original_order
 
 
+def test_deck_deal_random():
+    deck = Deck()
+    deck.build()
+    original_cards = deck.cards.copy()
+
+    cards_dealt = deck.deal_random(5)
+    assert len(cards_dealt) == 5
+    assert len(set(cards_dealt)) == 5
+    assert len(deck.cards) == len(original_cards) - 5
+    assert sorted(deck.cards + cards_dealt) == sorted(original_cards)
+
+
+@pytest.mark.parametrize("make_rng", [random.Random, np.random.default_rng])
+def test_deck_shuffle_with_seeded_rng(make_rng):
+    deck1 = Deck(rng=make_rng(42))
+    deck2 = Deck(rng=make_rng(42))
+    deck1.build()
+    deck2.build()
+    assert deck1.shuffle() == deck2.shuffle()
+    assert deck1.deal_random(5) == deck2.deal_random(5)
+
+
+def test_deck_reset():
+    deck = Deck(encoded=True)
+    deck.build()
+    cards = deck.cards
+    deck.shuffle()
+    deck.deal_random(20)
+    deck.reset()
+    assert deck.cards is cards
+    assert deck.cards == list(range(52))
+
+
 def test_deck_deal():
     deck = Deck()
     deck.build()
@@ -226,6 +664,17 @@ def test_player_draw_with_not_enough_cards():
     assert len(deck.cards) == 52
 
 
+def test_player_draw_with_seeded_rng():
+    hands = []
+    for _ in range(2):
+        player = Player("Noor")
+        deck = Deck()
+        deck.build()
+        player.draw(deck, num=5, rng=random.Random(9))
+        hands.append(player.player_cards)
+    assert hands[0] == hands[1]
+
+
 def test_player_show_hand():
     player = Player("Noor")
     deck = Deck()
@@ -233,3 +682,108 @@ def test_player_show_hand():
     player.draw(deck, num=5)
     result = player.show_hand()
     assert result == player.player_cards
+
+
+def test_player_draw_keep_and_discard():
+    player = Player("Noor")
+    deck = Deck(rng=random.Random(4))
+    deck.build()
+    for _ in range(5):
+        player.draw(deck, keep=True)
+        assert player.hand_state.cards == player.player_cards
+    assert player.hand_state.category() == hand_ranking(player.player_cards)
+    player.discard(player.player_cards[:2])
+    assert len(player.player_cards) == 3
+    assert player.hand_state.cards == player.player_cards
+    player.draw(deck, num=5)
+    assert player.hand_state.strength() == hand_strength(player.player_cards)
+
+
+def test_player_draw_rejects_repeated_cards():
+    # A deck built twice holds every card twice, so drawing many cards repeats one
+    player = Player("Noor")
+    deck = Deck(rng=random.Random(0))
+    deck.build()
+    deck.build()
+    with pytest.raises(ValueError):
+        player.draw(deck, num=30)
+    assert player.player_cards == [] and len(player.hand_state) == 0
+    deck = Deck()
+    deck.cards = ["Ah", "Kd"]
+    player.draw(deck, num=1, keep=True)
+    deck.cards = [player.player_cards[0]]
+    with pytest.raises(ValueError):
+        player.draw(deck, num=1, keep=True)
+    assert player.hand_state.cards == player.player_cards
+    with pytest.raises(ValueError):
+        HandState().sync(["Ah", "Kd", "Ah"])
+
+
+# TEST HAND STATE
+def test_hand_state_matches_full_evaluation():
+    rng = random.Random(1)
+    for _ in range(2000):
+        cards = rng.sample(range(52), 9)
+        state = HandState()
+        held = []
+        # Add the cards one at a time, taking one out again now and then
+        for card in cards:
+            state.add(card)
+            held.append(card)
+            if len(held) > 5 and rng.random() < 0.5:
+                state.remove(held.pop(rng.randrange(len(held))))
+            if len(held) > 7:
+                state.remove(held.pop(0))
+            assert state.cards == held
+            if len(held) >= 5:
+                assert state.strength() == best_hand_strength(held)
+        assert state.category() == best_hand_ranking(held)
+        if len(held) == 5:
+            assert state.category() == hand_ranking(held)
+
+
+@pytest.mark.parametrize("hand, expected_result", [
+    ([], None), (["Kh"], "High Card"), (["Kh", "Kd"], "Pair"),
+    (["Kh", "Kd", "3c", "3s"], "Two Pair"),
+    (["Kh", "Kd", "Kc"], "Three of a Kind"), (["Kh", "Kd", "Kc", "Ks"], "Four of a Kind"),
+    (["2h", "3h", "4h", "5h"], "High Card"), (["2h", "3h", "4h", "5h", "Ah"], "Straight Flush")])
+def test_hand_state_category(hand, expected_result):
+    assert HandState(hand).category() == expected_result
+
+
+@pytest.mark.parametrize("hand, has_straight, outs", [
+    (["5h", "6d", "7c", "8s"], False, ["4", "9"]), (["5h", "6d", "8c", "9s"], False, ["7"]),
+    (["Ah", "2d", "3c", "4s"], False, ["5"]), (["Ah", "Kd", "Qc", "Js"], False, ["10"]),
+    (["Kh", "Kd", "3c"], False, []), (["2h", "3d", "4c", "5s", "6h", "Kd"], True, [])])
+def test_hand_state_straights(hand, has_straight, outs):
+    state = HandState(hand)
+    assert state.has_straight() == has_straight
+    assert state.straight_outs() == outs
+
+
+def test_hand_state_straights_after_removing():
+    state = HandState(["5h", "6d", "7c", "8s", "9h", "9d"])
+    assert state.has_straight()
+    # Removing one of two 9s keeps the straight, removing both breaks it
+    state.remove("9h")
+    assert state.has_straight()
+    state.remove("9d")
+    assert not state.has_straight()
+    assert state.straight_outs() == ["4", "9"]
+
+
+def test_hand_state_mixed_cards_and_errors():
+    state = HandState(["Ah", Card("s", "A"), encode_card("Ad")])
+    assert state.category() == "Three of a Kind"
+    state.remove(encode_card("As"))
+    state.remove(Card("h", "A"))
+    assert state.cards == [encode_card("Ad")]
+    with pytest.raises(ValueError):
+        state.add("Ad")
+    with pytest.raises(ValueError):
+        state.remove("Kh")
+    with pytest.raises(ValueError):
+        state.strength()
+    state.sync(["Kh", "Ad", "Qh", "Jh", "10h"])
+    assert len(state) == 5
+    assert state.category() == "Straight"
@@ -0,0 +1,87 @@
+import pytest
+from poker_python_challenge_answers import best_hand_strength
+from poker_ranges import hand_combos, parse_range, sample_boards, range_equity
+
+
+# Test range against range equity
+
+@pytest.mark.parametrize("hand, num_combos", [("AA", 6), ("AKs", 4), ("AKo", 12), ("AK", 16),
+                                              ("T9s", 4), ("109o", 12), ("AhKd", 1),
+                                              (["Ah", "Kd"], 1), ([12, 13], 1)])
+def test_hand_combos(hand, num_combos):
+    combos = hand_combos(hand)
+    assert len(combos) == num_combos
+    assert all(len(set(combo)) == len(combo) == 2 for combo in combos)
+
+
+@pytest.mark.parametrize("hand", ["AAs", "AX", "AhAh", "Ahh"])
+def test_hand_combos_rejects_bad_hands(hand):
+    with pytest.raises(ValueError):
+        hand_combos(hand)
+
+
+def test_parse_range():
+    combos, weights = parse_range("AA, AKs:0.5, AhKh:2, KK:0")
+    assert len(combos) == 10
+    assert sorted(weights.tolist()) == [0.5] * 3 + [1.0] * 6 + [2.0]
+    assert parse_range({"AA": 1, "AKs": 0.5, "AhKh": 2})[0].tolist() == combos.tolist()
+    with pytest.raises(ValueError):
+        parse_range("KK:0")
+    with pytest.raises(ValueError):
+        parse_range(["AhKh", ["2c", "3c", "4c"]])
+
+
+def loop_equity(range1, range2, boards):
+    # The same equity from a loop over every pair of hands and every board
+    combos1, weights1 = parse_range(range1)
+    combos2, weights2 = parse_range(range2)
+    equity = total = 0.0
+    for hand1, weight1 in zip(combos1.tolist(), weights1.tolist()):
+        for hand2, weight2 in zip(combos2.tolist(), weights2.tolist()):
+            results = [(best_hand_strength(hand1 + board) > best_hand_strength(hand2 + board))
+                       + (best_hand_strength(hand1 + board) == best_hand_strength(hand2 + board))
+                       / 2 for board in boards if not set(board) & set(hand1 + hand2)]
+            if not set(hand1) & set(hand2) and results:
+                equity += weight1 * weight2 * sum(results) / len(results)
+                total += weight1 * weight2
+    return equity / total
+
+
+@pytest.mark.parametrize("range1, range2", [("AA", "KK"), ("AKs, QQ:0.5", "AA, AhQh:3"),
+                                            ("AhKh, 22", "AK, 72o")])
+def test_range_equity_matches_loop(range1, range2):
+    result = range_equity(range1, range2, num_boards=100, seed=5)
+    expected = loop_equity(range1, range2, sample_boards(100, seed=5).tolist())
+    assert result["equity"] == pytest.approx(expected)
+    assert result["win"] + result["tie"] + result["lose"] == pytest.approx(1)
+    reverse = range_equity(range2, range1, num_boards=100, seed=5)
+    assert result["equity"] + reverse["equity"] == pytest.approx(1)
+
+
+def test_range_equity_blocks_shared_cards():
+    # Only the two pairs of Aces that share no card with AhAs can meet it
+    result = range_equity("AhAs", "AA", num_boards=200)
+    assert result["pairs"] == 1
+    assert result["tie"] > 0.9
+    with pytest.raises(ValueError):
+        range_equity("AhAs", "AhKh", num_boards=10)
+
+
+def test_range_equity_five_card_hands():
+    result = range_equity([["10s", "As", "Qs", "Js", "Ks"]], "AhKhQhJh9h", board_size=0)
+    assert result["equity"] == 1.0
+    assert result["boards"] == 1
+
+
+def test_range_equity_cache(tmp_path):
+    result = range_equity("AA, KK", "AKs", num_boards=200, cache_dir=tmp_path)
+    assert not result["cached"]
+    assert len(list(tmp_path.iterdir())) == 1
+    cached = range_equity("AA, KK", "AKs", num_boards=200, cache_dir=tmp_path)
+    assert cached["cached"]
+    assert cached["equity"] == result["equity"]
+
+    # The weights are applied after the cache, other ranges or boards get new matrices
+    assert range_equity("AA:2, KK", "AKs", num_boards=200, cache_dir=tmp_path)["cached"]
+    assert not range_equity("AA", "AKs", num_boards=200, cache_dir=tmp_path)["cached"]
+    assert not range_equity("AA, KK", "AKs", num_boards=200, seed=1, cache_dir=tmp_path)["cached"]
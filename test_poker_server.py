@@ -0,0 +1,114 @@
+import asyncio
+import pytest
+from poker_python_challenge_answers import winner_is
+from poker_server import Table, TableManager, play_table, load_test, main
+
+
+# Test the table manager
+
+class RecordingTable(Table):
+    """ Table that keeps every hand it deals """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dealt = []
+
+    def deal(self):
+        self.dealt.append(super().deal())
+        return self.dealt[-1]
+
+
+def play(num_tables, num_hands, **options):
+    """ Play num_hands hands at num_tables tables and return the tables' hands, their winners and
+    the manager's stats """
+    async def run():
+        manager = TableManager(**options)
+        player_list = ["Noor", "Hagen", "Sadie"]
+        tables = [RecordingTable(f"Table {num}", player_list, seed=1)
+                  for num in range(num_tables)]
+        try:
+            results = await asyncio.gather(*[play_table(manager, table, num_hands)
+                                             for table in tables])
+        finally:
+            manager.close()
+        return [table.dealt for table in tables], results, manager.stats()
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("options", [{}, {"process_threshold": 1, "workers": 2}])
+def test_showdowns_match_winner_is(options):
+    dealt, results, stats = play(50, 4, **options)
+    for hands, winners in zip(dealt, results):
+        assert winners == [winner_is(players) for players in hands]
+    assert stats["showdowns"] == 200
+    assert stats["process_batches"] == (stats["batches"] if options else 0)
+
+
+def test_showdowns_are_batched_per_tick():
+    # Every table asks for its showdown in the same turn of the loop, so each round is one batch
+    _, _, stats = play(100, 3)
+    assert stats["batches"] == 3
+    assert stats["showdowns_per_batch"] == 100
+    assert stats["latency_p50"] <= stats["latency_p99"]
+
+
+def test_tables_are_reproducible():
+    table1 = Table("Table 1", ["Noor", "Hagen"], seed=5)
+    table2 = Table("Table 1", ["Noor", "Hagen"], seed=5)
+    table3 = Table("Table 2", ["Noor", "Hagen"], seed=5)
+    hands1 = [table1.deal() for _ in range(3)]
+    assert hands1 == [table2.deal() for _ in range(3)]
+    assert hands1 != [table3.deal() for _ in range(3)]
+
+
+def test_load_test():
+    stats = asyncio.run(load_test(num_tables=1000, num_players=9, num_hands=3))
+    assert stats["showdowns"] == 3000
+    assert stats["showdowns_per_second"] > 0
+    assert stats["latency_p99"] > 0
+
+
+def test_latencies_are_bounded():
+    _, _, stats = play(30, 4, max_latencies=50)
+    assert stats["showdowns"] == 120
+    assert stats["latency_p50"] <= stats["latency_p99"]
+    manager = TableManager(max_latencies=50)
+    manager.latencies.extend(range(200))
+    assert len(manager.latencies) == 50
+
+
+@pytest.mark.parametrize("argv", [["--tables", "0"], ["--tables", "3", "--hands", "0"]])
+def test_main_without_showdowns(argv, capsys):
+    assert main(argv) == 0
+    out = capsys.readouterr().out
+    assert "0 showdowns" in out
+    assert "latency" not in out
+
+
+def test_bad_showdown_in_batch():
+    # A bad table in the same batch as a good one only fails itself
+    async def run():
+        manager = TableManager()
+        good = {"Noor": [0, 1, 2, 3, 4], "Hagen": [13, 14, 15, 16, 18]}
+        results = await asyncio.gather(
+            manager.showdown(good),
+            manager.showdown({"Sadie": ["Ah", "Kd", "Qc", "Js", "10h"]}),
+            manager.showdown({"Kunai": [0, 0, 1, 2, 3]}),
+            manager.showdown({"Noor": [0, 1, 2, 3, 4], "Hagen": [4, 5, 6, 7, 8]}),
+            return_exceptions=True)
+        return results, manager.stats()
+    results, stats = asyncio.run(asyncio.wait_for(run(), timeout=10))
+    assert results[0] == winner_is({"Noor": [0, 1, 2, 3, 4], "Hagen": [13, 14, 15, 16, 18]})
+    assert all(isinstance(result, ValueError) for result in results[1:])
+    assert stats["showdowns"] == 1
+
+
+def test_rank_batch_errors_reach_every_showdown():
+    async def run():
+        manager = TableManager()
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in range(2)]
+        await manager.rank_batch([({"Noor": [0, 1, 2, 3, 4]}, futures[0]),
+                                  ({"Sadie": ["Ah", "Kd", "Qc", "Js", "10h"]}, futures[1])])
+        return [future.exception() for future in futures]
+    assert all(isinstance(error, ValueError) for error in asyncio.run(run()))
@@ -0,0 +1,123 @@
+from itertools import combinations
+import pytest
+from poker_python_challenge_answers import winner_is
+from poker_simulation import simulate_equity, prepare_hands, exact_equity, count_completions, \
+    equity
+
+
+# Test Monte Carlo equity simulation
+
+def test_simulate_equity_is_reproducible():
+    known_hands = {"Noor": ["Ah", "As"], "Hagen": ["Kh", "Ks"]}
+    result1 = simulate_equity(known_hands, num_players=3, trials=5000, seed=7)
+    result2 = simulate_equity(known_hands, num_players=3, trials=5000, seed=7)
+    assert result1 == result2
+    assert result1["trials"] == 5000
+    assert list(result1["players"]) == ["Noor", "Hagen", "Opponent 1"]
+
+
+def test_simulate_equity_is_reproducible_with_workers():
+    known_hands = {"Noor": ["Ah", "As"], "Hagen": ["Kh", "Ks"]}
+    result1 = simulate_equity(known_hands, trials=4000, seed=3, workers=2, batch_size=1000)
+    result2 = simulate_equity(known_hands, trials=4000, seed=3, workers=2, batch_size=1000)
+    assert result1 == result2
+
+
+def test_simulate_equity_known_winner():
+    known_hands = {"Noor": ["10s", "As", "Qs", "Js", "Ks"], "Hagen": ["2h", "3d"]}
+    result = simulate_equity(known_hands, num_players=4, trials=2000, seed=0)
+    noor = result["players"]["Noor"]
+    assert noor["win"] == 1.0
+    assert noor["tie"] == 0.0
+    assert noor["win_interval"][0] < 1.0 <= noor["win_interval"][1] + 1e-12
+    assert result["players"]["Hagen"]["win"] == 0.0
+
+
+def test_simulate_equity_probabilities_add_up():
+    result = simulate_equity({}, num_players=3, trials=3000, seed=1)
+    players = result["players"].values()
+    # Every trial is either won by one player or tied by two or more
+    assert sum(player["win"] for player in players) <= 1.0
+    assert sum(player["win"] for player in players) + sum(player["tie"] for player in players) \
+        >= 1.0
+    for player in players:
+        low, high = player["win_interval"]
+        assert low <= player["win"] <= high
+
+
+def test_simulate_equity_stops_early():
+    result = simulate_equity({"Noor": ["Ah", "As"]}, num_players=2, trials=1000000,
+                             batch_size=1000, target_standard_error=0.01, seed=0)
+    assert result["trials"] < 1000000
+    assert all(player["standard_error"] <= 0.01 for player in result["players"].values())
+
+
+@pytest.mark.parametrize("known_hands, num_players", [
+    ({"Noor": ["Ah", "As"], "Hagen": ["Ah", "Ks"]}, None),
+    ({"Noor": ["Ah", "As", "2c", "3c", "4c", "5c"]}, None),
+    ({"Noor": ["Ah"], "Hagen": ["Kh"]}, 1),
+    ({}, 11)])
+def test_prepare_hands_rejects_bad_input(known_hands, num_players):
+    with pytest.raises(ValueError):
+        prepare_hands(known_hands, num_players)
+
+
+# Test exact equity
+
+def brute_force_equity(known_hands):
+    """ Rank every deal of the unknown cards one at a time with winner_is """
+    names, codes, remaining = prepare_hands(known_hands)
+    wins = dict.fromkeys(names, 0)
+    ties = dict.fromkeys(names, 0)
+
+    def deal(player, used, hands):
+        if player == len(codes):
+            winners = winner_is(dict(zip(names, hands)))
+            for name in winners:
+                if len(winners) == 1:
+                    wins[name] += 1
+                else:
+                    ties[name] += 1
+            return
+        left = [card for card in remaining.tolist() if card not in used]
+        for cards in combinations(left, 5 - len(codes[player])):
+            deal(player + 1, used | set(cards), hands + [codes[player] + list(cards)])
+
+    deal(0, set(), [])
+    return wins, ties
+
+
+@pytest.mark.parametrize("known_hands", [
+    {"Noor": ["Ah", "As", "Kd"], "Hagen": ["Kh", "Ks", "Qd", "Qc"]},
+    {"Noor": ["Ah", "As", "Kd", "2c"], "Hagen": ["Kh", "Ks", "Qd", "Qc"],
+     "Sadie": ["3h", "3s", "4c"]},
+    {"Noor": ["2h", "7d", "9c", "Js"], "Hagen": ["2d", "7h", "9s", "Jc"]},
+    {"Noor": ["Ah", "As", "Kd", "Kc", "2h"], "Hagen": ["Kh", "Ks", "Ad", "Ac", "2d"]}])
+def test_exact_equity_matches_brute_force(known_hands):
+    result = exact_equity(known_hands, chunk_size=5000)
+    wins, ties = brute_force_equity(known_hands)
+    assert result["completions"] == count_completions(known_hands)
+    assert result["evaluated"] <= result["completions"]
+    for name, player in result["players"].items():
+        assert player["wins"] == wins[name]
+        assert player["ties"] == ties[name]
+
+
+def test_exact_equity_uses_suit_symmetry():
+    # Nobody holds a club or a spade, so deals that swap clubs and spades are only ranked once
+    result = exact_equity({"Noor": ["Ah", "Kh", "Qh", "Jh"], "Hagen": ["2d", "3d", "4d", "5d"]})
+    assert result["evaluated"] < result["completions"]
+    assert result["players"]["Noor"]["win"] + result["players"]["Hagen"]["win"] \
+        + result["players"]["Noor"]["tie"] == pytest.approx(1.0)
+
+
+def test_exact_equity_with_workers():
+    known_hands = {"Noor": ["Ah", "As", "Kd"], "Hagen": ["Kh", "Ks", "Qd", "Qc"]}
+    assert exact_equity(known_hands, workers=2, chunk_size=5000)["players"] == \
+        exact_equity(known_hands)["players"]
+
+
+def test_equity_chooses_method():
+    known_hands = {"Noor": ["Ah", "As", "Kd"], "Hagen": ["Kh", "Ks", "Qd", "Qc"]}
+    assert equity(known_hands)["method"] == "exact"
+    assert equity(known_hands, max_exact_completions=10, trials=1000)["method"] == "simulation"
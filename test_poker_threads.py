@@ -0,0 +1,104 @@
+import random
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from poker_python_challenge_answers import hand_ranking, hand_strength, winner_is, \
+    best_hand_strength, hand_ranking_batch, deal_cards_batch, HandCache
+from poker_threads import thread_deck, thread_rng, deal_cards_local, rank_hands_threaded, \
+    hand_ranking_threaded, winners_threaded, deal_cards_threaded
+
+
+@pytest.fixture
+def fast_switching():
+    # Switching threads as often as possible makes races show up if there are any
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+# Test the thread pool batch functions
+
+def test_rank_hands_threaded_matches_serial():
+    hands = deal_cards_batch(50000, 1, rng=0).reshape(-1, 5)
+    for strength in [False, True]:
+        assert (rank_hands_threaded(hands, strength, workers=4, chunk_size=3000) ==
+                hand_ranking_batch(hands, strength)).all()
+    assert len(rank_hands_threaded(hands[:0])) == 0
+
+
+@pytest.mark.parametrize("category_only", [False, True])
+def test_winners_threaded_matches_serial(fast_switching, category_only):
+    tables = deal_cards_threaded(5000, ["Noor", "Hagen", "Sadie"], seed=2)
+    assert winners_threaded(tables, category_only, workers=8, chunk_size=100) == \
+        [winner_is(players, category_only) for players in tables]
+    hands = [hand for players in tables for hand in players.values()]
+    assert hand_ranking_threaded(hands, workers=8, chunk_size=100) == \
+        [hand_ranking(hand) for hand in hands]
+
+
+def test_deal_cards_threaded_is_reproducible():
+    player_list = ["Noor", "Hagen"]
+    deals = deal_cards_threaded(2500, player_list, seed=7, workers=1, chunk_size=300)
+    assert len(deals) == 2500
+    assert all(len(set(players["Noor"] + players["Hagen"])) == 10 for players in deals)
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        assert deal_cards_threaded(2500, player_list, seed=7, chunk_size=300,
+                                   executor=executor) == deals
+    assert deal_cards_threaded(2500, player_list, seed=8, chunk_size=300) != deals
+
+
+def test_thread_decks_are_per_thread():
+    decks = []
+    barrier = threading.Barrier(4)
+
+    def remember():
+        deck = thread_deck()
+        assert thread_deck() is deck
+        decks.append((deck, thread_rng()))
+        assert len(deal_cards_local(["Noor", "Hagen"])["Noor"]) == 5
+        # Keep every thread alive until all of them have their deck
+        barrier.wait()
+
+    threads = [threading.Thread(target=remember) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(deck) for deck, _ in decks}) == 4
+    assert len({id(rng) for _, rng in decks}) == 4
+
+
+# Stress test: many threads ranking, dealing and sharing a cache at the same time
+
+def test_stress(fast_switching):
+    rng = random.Random(0)
+    hands = [rng.sample(range(52), 7) for _ in range(2000)]
+    expected = [best_hand_strength(hand) for hand in hands]
+    expected5 = [hand_strength(hand[:5]) for hand in hands]
+    cache = HandCache(max_size=500)
+    errors = []
+
+    def work(worker):
+        try:
+            for _ in range(3):
+                for hand, strength, strength5 in zip(hands, expected, expected5):
+                    assert best_hand_strength(hand) == strength
+                    assert hand_strength(hand[:5]) == strength5
+                    assert cache.hand_strength(hand) == strength
+                deal = deal_cards_local([f"Player {num}" for num in range(worker % 9 + 2)])
+                cards = [card for hand in deal.values() for card in hand]
+                assert len(set(cards)) == len(cards)
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=work, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    stats = cache.stats()
+    assert stats["hits"] + stats["misses"] == 8 * 3 * 2000
+    assert stats["size"] <= 500